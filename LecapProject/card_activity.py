@@ -0,0 +1,92 @@
+"""
+Предварительный отбор карточек для отчёта по активности.
+
+Списания карточки за период [start_date, end_date] возможны, только если карточка
+создана не позже end_date и её последняя активность — изменение, перемещение или
+последнее увиденное списание (CardTimeLogWatermark) — не раньше start_date.
+Списание не всегда меняет карточку, поэтому к началу периода добавляется запас
+ACTIVITY_GRACE_DAYS; карточки без отметок времени не отсеиваются.
+
+Отметки списаний обновляются после каждой загрузки (record_time_log_watermarks),
+поэтому карточка, по которой продолжают списывать время без правок, остаётся в отчёте.
+
+Отбор выключен по умолчанию (KAITEN_ACTIVITY_PREFILTER=1 — включить): списание, внесённое
+задним числом в карточку, которую давно не меняли, он пропустит, а отчёт идёт в биллинг.
+"""
+import os
+from datetime import datetime, date, timedelta, timezone
+
+from .models import CardTimeLogWatermark
+
+ACTIVITY_PREFILTER = os.getenv("KAITEN_ACTIVITY_PREFILTER", "0") in ("1", "true", "True", "yes")
+ACTIVITY_GRACE_DAYS = int(os.getenv("KAITEN_ACTIVITY_GRACE_DAYS", "30"))
+
+
+def _parse(value):
+    """ISO-дата/время Kaiten → aware datetime (UTC для дат без зоны) или None."""
+    if not value:
+        return None
+    if isinstance(value, datetime):
+        parsed = value
+    elif isinstance(value, date):
+        parsed = datetime(value.year, value.month, value.day)
+    else:
+        try:
+            parsed = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+        except ValueError:
+            return None
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+
+def prefilter_active_cards(domain, cards, start_date, end_date):
+    """
+    (активные карточки, число пропущенных). start_date/end_date — 'YYYY-MM-DD'.
+    Порядок карточек сохраняется; если период не разобрать, отбор не выполняется.
+    """
+    period_start, period_end = _parse(start_date), _parse(end_date)
+    if not ACTIVITY_PREFILTER or not cards or period_start is None or period_end is None:
+        return list(cards), 0
+    window_start = period_start - timedelta(days=ACTIVITY_GRACE_DAYS)
+    window_end = period_end + timedelta(days=1)
+    watermarks = dict(
+        CardTimeLogWatermark.objects
+        .filter(domain=domain, card_id__in=[str(card.get('id')) for card in cards])
+        .values_list('card_id', 'last_log_at')
+    )
+    active = []
+    for card in cards:
+        created = _parse(card.get('created'))
+        if created is not None and created >= window_end:
+            continue
+        moments = [_parse(card.get('updated')), _parse(card.get('last_moved_at')), watermarks.get(str(card.get('id')))]
+        moments = [m for m in moments if m is not None]
+        if moments and max(moments) < window_start:
+            continue
+        active.append(card)
+    return active, len(cards) - len(active)
+
+
+def record_time_log_watermarks(domain, logs_by_card):
+    """Запоминает самое позднее списание по каждой карточке (только если оно новее сохранённого)."""
+    latest = {}
+    for card_id, logs in logs_by_card.items():
+        moments = [m for m in (_parse(log.get('created')) for log in logs) if m is not None]
+        if moments:
+            latest[str(card_id)] = max(moments)
+    if not latest:
+        return
+    existing = dict(
+        CardTimeLogWatermark.objects
+        .filter(domain=domain, card_id__in=list(latest))
+        .values_list('card_id', 'last_log_at')
+    )
+    changed = [
+        CardTimeLogWatermark(domain=domain, card_id=card_id, last_log_at=moment)
+        for card_id, moment in latest.items()
+        if card_id not in existing or existing[card_id] < moment
+    ]
+    if changed:
+        CardTimeLogWatermark.objects.bulk_create(
+            changed, update_conflicts=True,
+            unique_fields=['domain', 'card_id'], update_fields=['last_log_at', 'updated_at'],
+        )
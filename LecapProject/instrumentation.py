@@ -0,0 +1,141 @@
+"""
+Инструментирование запросов: correlation id, сэмплирование трассировки и
+отложенные (ленивые) вычисления для логов.
+
+- Correlation id живёт в contextvar: его ставит CorrelationIdMiddleware (из
+  X-Request-ID или новый), он переносится в пулы потоков вместе с контекстом
+  (copy_context) и попадает в каждую запись лога через CorrelationIdFilter.
+- Решение «трассировать ли запрос» принимается один раз на correlation id
+  (KAITEN_TRACE_SAMPLE_RATE), поэтому трасса запроса либо полная, либо её нет.
+- LazyHash / LazyPreview откладывают хэширование и обрезку тела до момента
+  форматирования записи: при отключённом уровне или отброшенной записи они не
+  вычисляются вовсе, а при QueueHandler — вычисляются в потоке слушателя.
+"""
+import contextvars
+import hashlib
+import json
+import os
+import random
+import uuid
+from contextlib import contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+
+# Доля запросов с полной трассировкой HTTP-обмена с Kaiten (0 — выключено, 1 — все)
+TRACE_SAMPLE_RATE = float(os.getenv("KAITEN_TRACE_SAMPLE_RATE", "0"))
+REQUEST_ID_HEADER = "X-Request-ID"
+
+_CORRELATION_ID = contextvars.ContextVar("correlation_id", default=None)
+_TRACED = contextvars.ContextVar("traced", default=None)
+
+
+def new_correlation_id() -> str:
+    return uuid.uuid4().hex[:16]
+
+
+def get_correlation_id() -> str:
+    return _CORRELATION_ID.get() or "-"
+
+
+def _sample() -> bool:
+    return TRACE_SAMPLE_RATE >= 1 or (TRACE_SAMPLE_RATE > 0 and random.random() < TRACE_SAMPLE_RATE)
+
+
+@contextmanager
+def correlation_scope(correlation_id: str = None, traced: bool = None):
+    """Задаёт correlation id (и решение о трассировке) для кода внутри блока."""
+    cid_token = _CORRELATION_ID.set(correlation_id or new_correlation_id())
+    traced_token = _TRACED.set(_sample() if traced is None else traced)
+    try:
+        yield _CORRELATION_ID.get()
+    finally:
+        _TRACED.reset(traced_token)
+        _CORRELATION_ID.reset(cid_token)
+
+
+def tracing_enabled() -> bool:
+    """Трассировать ли текущую операцию: решение correlation scope, вне его — по сэмплированию."""
+    traced = _TRACED.get()
+    return _sample() if traced is None else traced
+
+
+class CorrelationIdFilter:
+    """Фильтр logging: добавляет record.correlation_id (вызывается в потоке, породившем запись)."""
+
+    def filter(self, record):
+        if not hasattr(record, "correlation_id"):
+            record.correlation_id = get_correlation_id()
+        return True
+
+
+class CorrelationIdMiddleware:
+    """Ставит correlation id на время запроса и возвращает его в заголовке X-Request-ID."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def _incoming(self, request) -> str:
+        value = request.headers.get(REQUEST_ID_HEADER, "")
+        # чужой id принимается, только если он короткий и из безопасных символов
+        return value if 0 < len(value) <= 64 and value.replace("-", "").isalnum() else None
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        with correlation_scope(self._incoming(request)) as cid:
+            request.correlation_id = cid
+            response = self.get_response(request)
+        response[REQUEST_ID_HEADER] = cid
+        return response
+
+    async def __acall__(self, request):
+        with correlation_scope(self._incoming(request)) as cid:
+            request.correlation_id = cid
+            response = await self.get_response(request)
+        response[REQUEST_ID_HEADER] = cid
+        return response
+
+
+def _to_bytes(payload) -> bytes:
+    if isinstance(payload, bytes):
+        return payload
+    if isinstance(payload, str):
+        return payload.encode("utf-8", errors="ignore")
+    return json.dumps(
+        payload, ensure_ascii=False, sort_keys=True, separators=(",", ":"),
+        default=lambda o: o.to_dict() if hasattr(o, "to_dict") else str(o),
+    ).encode("utf-8", errors="ignore")
+
+
+class LazyHash:
+    """Хэш полезной нагрузки, вычисляемый только при форматировании записи (и не более одного раза)."""
+    __slots__ = ("_payload", "_value")
+
+    def __init__(self, payload):
+        self._payload = payload
+        self._value = None
+
+    def __str__(self):
+        if self._value is None:
+            self._value = hashlib.blake2b(_to_bytes(self._payload), digest_size=16).hexdigest()
+            self._payload = None
+        return self._value
+
+
+class LazyPreview:
+    """Начало тела (limit символов) — тоже только при форматировании."""
+    __slots__ = ("_payload", "_limit")
+
+    def __init__(self, payload, limit: int = None):
+        self._payload = payload
+        self._limit = limit
+
+    def __str__(self):
+        text = self._payload.decode("utf-8", errors="replace") if isinstance(self._payload, bytes) else str(self._payload)
+        if self._limit is not None and len(text) > self._limit:
+            return text[:self._limit] + "…"
+        return text
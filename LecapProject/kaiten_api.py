@@ -8,7 +8,24 @@ import hashlib
 from typing import Any, Dict
 from urllib3.util.retry import Retry
 from requests.adapters import HTTPAdapter
+from .kaiten_ratelimit import SharedTokenBucket, PriorityScheduler, default_state_path
+from .kaiten_cache import TwoTierCache, mark_stale, is_stale
+from .kaiten_records import CardRecord, TimeLogRecord, iter_response_items
+from .kaiten_cassette import Cassette, cassette_from_env, strip_conditional
+from .instrumentation import LazyHash, LazyPreview, get_correlation_id, tracing_enabled
+from . import metrics
+import itertools
 import random
+import copy
+from collections import OrderedDict
+from email.utils import parsedate_to_datetime
+import threading
+import contextvars
+import asyncio
+import functools
+from contextlib import contextmanager
+from datetime import date, timedelta
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 # -----------------------------------------------------------------------------
 # Конфигурация/флаги (управляются переменными окружения)
@@ -22,13 +39,75 @@ ENABLE_LOGGING = os.getenv("KAITEN_ENABLE_LOGGING", "OFF") in ("1", "true", "Tru
 # Показ секретов в логах (Authorization и пр.)
 SHOW_SECRETS = os.getenv("KAITEN_LOG_SHOW_SECRETS", "1") in ("1", "true", "True", "yes")
 
-# Ограничение длины печати тела ответа (None = без ограничений)
-PRINT_PREVIEW_LIMIT = None
+# Ограничение длины тела ответа в трассе (0 = без ограничений)
+PRINT_PREVIEW_LIMIT = int(os.getenv("KAITEN_TRACE_BODY_LIMIT", "2048")) or None
 
 # Троттлинг и ретраи
-HTTP_MIN_INTERVAL = float(os.getenv("KAITEN_HTTP_MIN_INTERVAL", "0.35"))  # минимум интервал между вызовами, сек
-HTTP_MAX_RETRIES = int(os.getenv("KAITEN_HTTP_MAX_RETRIES", "6"))         # максимальное кол-во повторов на 429/5xx
+HTTP_MIN_INTERVAL = float(os.getenv("KAITEN_HTTP_MIN_INTERVAL", "0.35"))  # минимум интервал между вызовами, сек (на весь хост)
+HTTP_RATE_BURST = float(os.getenv("KAITEN_HTTP_RATE_BURST", "1"))          # сколько запросов можно сделать подряд после простоя
+# Пределы адаптивного темпа: при запасе квоты интервал опускается до FLOOR, при её нехватке растёт до MAX
+HTTP_MIN_INTERVAL_FLOOR = float(os.getenv("KAITEN_HTTP_MIN_INTERVAL_FLOOR", "0.1"))
+HTTP_MAX_INTERVAL = float(os.getenv("KAITEN_HTTP_MAX_INTERVAL", "5"))
+HTTP_MAX_RETRIES = int(os.getenv("KAITEN_HTTP_MAX_RETRIES", "6"))         # максимальное кол-во повторов на 429/5xx/сбой сети
+HTTP_BACKOFF_FACTOR = float(os.getenv("KAITEN_HTTP_BACKOFF_FACTOR", "1.2"))  # база экспоненциальной паузы между повторами, сек
+HTTP_MAX_BACKOFF = float(os.getenv("KAITEN_HTTP_MAX_BACKOFF", "16"))       # верхняя граница паузы между повторами, сек
+HTTP_MIN_ATTEMPT_BUDGET = float(os.getenv("KAITEN_HTTP_MIN_ATTEMPT_BUDGET", "1"))  # меньше этого бюджета новую попытку не начинаем
+
+# Условные GET (ETag/Last-Modified) для редко меняющихся метаданных
+CONDITIONAL_GET = os.getenv("KAITEN_CONDITIONAL_GET", "1") in ("1", "true", "True", "yes")
+VALIDATOR_STORE_SIZE = int(os.getenv("KAITEN_VALIDATOR_STORE_SIZE", "512"))  # сколько URL помнить
+CONDITIONAL_ENDPOINTS = {
+    "spaces", "boards", "user-roles", "users", "board-roles",
+    "custom-property-values", "columns", "lanes",
+}
+
+# Кэш метаданных: L1 в процессе + L2 в Django cache (общий для воркеров)
+CACHE_ENABLED = os.getenv("KAITEN_CACHE", "1") in ("1", "true", "True", "yes")
+CACHE_FRESH_TTL = float(os.getenv("KAITEN_CACHE_FRESH_TTL", "60"))      # сек, в течение которых данные отдаются без обновления
+CACHE_STALE_TTL = float(os.getenv("KAITEN_CACHE_STALE_TTL", "3600"))    # сек, до которых устаревшие отдаются с фоновым обновлением
+CACHE_L1_SIZE = int(os.getenv("KAITEN_CACHE_L1_SIZE", "256"))
+
+# Потоковый разбор больших списков (карточки, списания) в компактные записи
+STREAM_PARSE = os.getenv("KAITEN_STREAM_PARSE", "1") in ("1", "true", "True", "yes")
+
+# Склейка одинаковых одновременных GET внутри процесса
+SINGLE_FLIGHT = os.getenv("KAITEN_SINGLE_FLIGHT", "1") in ("1", "true", "True", "yes")
+
+# Circuit breaker по эндпоинтам: при недоступности Kaiten запросы не ждут таймаутов
+BREAKER_ENABLED = os.getenv("KAITEN_BREAKER", "1") in ("1", "true", "True", "yes")
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("KAITEN_BREAKER_FAILURES", "5"))      # сбоев подряд до размыкания
+BREAKER_RESET_TIMEOUT = float(os.getenv("KAITEN_BREAKER_RESET_TIMEOUT", "30"))  # сек до пробного запроса
+CACHE_LKG_TTL = float(os.getenv("KAITEN_CACHE_LKG_TTL", str(7 * 24 * 3600)))   # сколько хранить last-known-good
+
+# Бюджеты времени view на все вызовы Kaiten (gunicorn убивает воркер через 120 s)
+VIEW_BUDGET = float(os.getenv("KAITEN_VIEW_BUDGET", "100"))
+AJAX_BUDGET = float(os.getenv("KAITEN_AJAX_BUDGET", "25"))
 HTTP_TIMEOUT = int(os.getenv("KAITEN_HTTP_TIMEOUT", "60"))                 # дефолтный timeout запроса
+HTTP_CONCURRENCY = int(os.getenv("KAITEN_HTTP_CONCURRENCY", "8"))         # параллельных запросов при массовой загрузке
+HTTP_CONNECT_TIMEOUT = float(os.getenv("KAITEN_HTTP_CONNECT_TIMEOUT", "5"))  # timeout установки соединения
+# Адрес API; {domain} подставляется из настроек. Для локального симулятора: http://127.0.0.1:8765/api/latest
+KAITEN_BASE_URL = os.getenv("KAITEN_BASE_URL", "https://{domain}.kaiten.ru/api/latest")
+PAGE_SIZE = int(os.getenv("KAITEN_PAGE_SIZE", "100"))                      # элементов на страницу списковых эндпоинтов
+# Списания за период одним списковым запросом /time-logs (с откатом на /cards/{id}/time-logs)
+TIME_LOGS_BULK = os.getenv("KAITEN_TIME_LOGS_BULK", "1") in ("1", "true", "True", "yes")
+TIME_LOGS_BULK_MIN_CARDS = int(os.getenv("KAITEN_TIME_LOGS_BULK_MIN_CARDS", "3"))   # для меньшего числа карточек — по карточкам
+TIME_LOGS_BULK_RETRY = float(os.getenv("KAITEN_TIME_LOGS_BULK_RETRY", "3600"))      # сек до новой попытки, если /time-logs не поддержан
+HTTP_POOL_MAXSIZE = int(os.getenv("KAITEN_HTTP_POOL_MAXSIZE", str(max(10, HTTP_CONCURRENCY * 2))))  # соединений в пуле клиента
+
+# Таймауты чтения по эндпоинтам (исторические значения из fetch_kaiten_*)
+ENDPOINT_TIMEOUTS = {
+    "spaces": HTTP_TIMEOUT,
+    "boards": HTTP_TIMEOUT,
+    "cards": HTTP_TIMEOUT,
+    "time-logs": HTTP_TIMEOUT,
+    "time-logs-bulk": HTTP_TIMEOUT,
+    "user-roles": HTTP_TIMEOUT,
+    "users": 10,
+    "board-roles": 10,
+    "custom-property-values": 10,
+    "columns": 10,
+    "lanes": 10,
+}
 
 # -----------------------------------------------------------------------------
 # Логгер
@@ -41,6 +120,12 @@ if not logger.handlers:
 # Если логирование выключено – поднимаем уровень до CRITICAL, фактически глушим
 logger.setLevel(logging.DEBUG if ENABLE_LOGGING else logging.CRITICAL)
 
+# Трасса HTTP-обмена: пишется при KAITEN_HTTP_DEBUG или для сэмплированных запросов,
+# независимо от ENABLE_LOGGING (уровень задан явно, записи уходят в обработчики "kaiten")
+_http_logger = logging.getLogger("kaiten.http")
+_http_logger.setLevel(logging.DEBUG if HTTP_DEBUG else logging.INFO)
+_REQUEST_SEQ = itertools.count(1)
+
 # -----------------------------------------------------------------------------
 # Исключения
 # -----------------------------------------------------------------------------
@@ -51,6 +136,18 @@ class KaitenApiRefusedError(KaitenApiError):
     """API отказало в обработке запроса (rate limit/unauthorized/forbidden и т.п.)."""
     pass
 
+class KaitenDeadlineExceeded(KaitenApiError):
+    """Оставшегося бюджета времени (kaiten_deadline) не хватает на ещё одну попытку."""
+    pass
+
+class KaitenUnavailableError(KaitenApiError):
+    """Circuit breaker эндпоинта разомкнут: Kaiten недавно не отвечал, запрос не отправлялся."""
+    pass
+
+class KaitenUnreliableListError(KaitenApiError):
+    """Списковый эндпоинт не учёл параметры запроса (offset, период): ответу нельзя доверять."""
+    pass
+
 # -----------------------------------------------------------------------------
 # Утилиты маскировки/печати
 # -----------------------------------------------------------------------------
@@ -80,73 +177,319 @@ def _maybe_mask_headers(headers: Dict[str, Any]) -> Dict[str, Any]:
             safe[k] = v
     return safe
 
-def _hash_payload(obj: Any) -> str:
-    try:
-        data = json.dumps(obj, ensure_ascii=False, sort_keys=True, separators=(',', ':'))
-    except Exception:
-        data = str(obj)
-    return hashlib.sha256(data.encode('utf-8', errors='ignore')).hexdigest()
-
 # -----------------------------------------------------------------------------
 # HTTP слой: сессия, ретраи, троттлинг, печать
 # -----------------------------------------------------------------------------
+# urllib3 сам не повторяет запросы: единственная политика повторов — в _http_request,
+# где она учитывает общий темп запросов и бюджет времени вызова.
+_NO_RETRY = Retry(total=0, read=False, redirect=False, raise_on_status=False)
+_RETRY_STATUSES = (500, 502, 503, 504)
+_IDEMPOTENT_METHODS = ("GET", "HEAD", "OPTIONS")
+
 _session = requests.Session()
-_retry = Retry(
-    total=HTTP_MAX_RETRIES,
-    backoff_factor=1.2,
-    status_forcelist=[429, 500, 502, 503, 504],
-    allowed_methods=["GET", "POST", "PUT", "PATCH", "DELETE"],
-    respect_retry_after_header=True,
-    raise_on_status=False,
-)
-_session.mount("https://", HTTPAdapter(max_retries=_retry))
-_session.mount("http://", HTTPAdapter(max_retries=_retry))
-
-_LAST_CALL_TS = 0.0
-
-def _print_full_request_response(req_id: str, method: str, url: str, headers: Dict[str, Any], params: Dict[str, Any] = None, body: Any = None):
-    if not HTTP_DEBUG:
-        return
-    print(f"\n[HTTP] ▶ REQUEST id={req_id}")
-    print(f"[HTTP]   {method} {url}")
-    if params:
-        try:
-            print(f"[HTTP]   params: {json.dumps(params, ensure_ascii=False)}")
-        except Exception:
-            print(f"[HTTP]   params(raw): {params}")
-    print(f"[HTTP]   headers: {_maybe_mask_headers(headers)}")
-    if body is not None:
+_session.mount("https://", HTTPAdapter(max_retries=_NO_RETRY))
+_session.mount("http://", HTTPAdapter(max_retries=_NO_RETRY))  # используется, только если не передана сессия клиента
+
+# -----------------------------------------------------------------------------
+# Бюджет времени (deadline): задаётся на входе во view, проверяется каждым вызовом Kaiten
+# -----------------------------------------------------------------------------
+_DEADLINE = contextvars.ContextVar("kaiten_deadline", default=None)
+
+
+@contextmanager
+def kaiten_deadline(seconds: float):
+    """Ограничивает суммарное время всех вызовов Kaiten внутри блока; вложенный бюджет не превышает внешний."""
+    deadline = time.monotonic() + seconds
+    outer = _DEADLINE.get()
+    token = _DEADLINE.set(deadline if outer is None else min(outer, deadline))
+    try:
+        yield
+    finally:
+        _DEADLINE.reset(token)
+
+
+def remaining_budget():
+    """Сколько секунд осталось у текущего бюджета (None — бюджет не задан)."""
+    deadline = _DEADLINE.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+def with_kaiten_deadline(seconds: float):
+    """Декоратор view (sync или async): запускает бюджет времени на всю обработку запроса."""
+    def decorator(view):
+        if asyncio.iscoroutinefunction(view):
+            @functools.wraps(view)
+            async def async_wrapper(*args, **kwargs):
+                with kaiten_deadline(seconds):
+                    return await view(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            with kaiten_deadline(seconds):
+                return view(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def _check_budget(what: str, need: float = 0.0):
+    remaining = remaining_budget()
+    if remaining is not None and remaining - need < HTTP_MIN_ATTEMPT_BUDGET:
+        raise KaitenDeadlineExceeded(f"{what}: осталось {max(remaining, 0):.1f}s бюджета")
+    return remaining
+
+
+def _cap_timeout(timeout, remaining):
+    if remaining is None:
+        return timeout
+    if isinstance(timeout, tuple):
+        return tuple(min(t, remaining) for t in timeout)
+    return min(timeout, remaining)
+
+# Троттлинг общий для всех воркеров хоста и потоков внутри них: token bucket в файле
+# состояния под flock (см. kaiten_ratelimit). HTTP_MIN_INTERVAL — интервал на один токен.
+_RATE_LIMITER = SharedTokenBucket(default_state_path(), interval=HTTP_MIN_INTERVAL, burst=HTTP_RATE_BURST)
+_SCHEDULER = PriorityScheduler(_RATE_LIMITER)
+
+# Классы приоритета запросов: внутри общего бюджета первыми обслуживаются интерактивные
+PRIORITY_INTERACTIVE = 0   # AJAX и страницы, которых ждёт пользователь
+PRIORITY_REPORT = 1        # массовая загрузка для generate_report
+PRIORITY_BACKGROUND = 2    # фоновые синхронизации и аудит
+
+_PRIORITY = contextvars.ContextVar("kaiten_priority", default=PRIORITY_INTERACTIVE)
+
+
+@contextmanager
+def kaiten_priority(priority: int):
+    """Все вызовы Kaiten внутри блока (и в пулах, запущенных из него) идут с указанным приоритетом."""
+    token = _PRIORITY.set(priority)
+    try:
+        yield
+    finally:
+        _PRIORITY.reset(token)
+
+
+def _throttle():
+    remaining = remaining_budget()
+    max_wait = None if remaining is None else max(0.0, remaining - HTTP_MIN_ATTEMPT_BUDGET)
+    waited = _SCHEDULER.acquire(_PRIORITY.get(), max_wait=max_wait)
+    if waited is None:
+        raise KaitenDeadlineExceeded(f"очередь к Kaiten длиннее оставшегося бюджета ({remaining:.1f}s)")
+    return waited
+
+
+def _header_float(resp: requests.Response, *names):
+    for name in names:
+        value = resp.headers.get(name)
+        if value is None:
+            continue
         try:
-            print(f"[HTTP]   body(json): {json.dumps(body, ensure_ascii=False)}")
-        except Exception:
-            print(f"[HTTP]   body(raw): {body}")
+            return float(value)
+        except (TypeError, ValueError):
+            continue
+    return None
 
-def _print_full_response(req_id: str, resp: requests.Response, elapsed_s: float):
-    if not HTTP_DEBUG:
-        return
-    print(f"[HTTP] ◀ RESPONSE id={req_id} status={resp.status_code} time={elapsed_s:.2f}s")
-    print(f"[HTTP]   resp.headers: {dict(resp.headers)}")
-    text = resp.text
-    if PRINT_PREVIEW_LIMIT is not None and isinstance(PRINT_PREVIEW_LIMIT, int):
-        text = (text[:PRINT_PREVIEW_LIMIT] + "…") if len(text) > PRINT_PREVIEW_LIMIT else text
-    print(f"[HTTP]   resp.text: {text}")
+
+def _retry_after_seconds(resp: requests.Response):
+    # Retry-After бывает числом секунд или HTTP-датой
+    value = resp.headers.get("Retry-After")
+    if not value:
+        return None
+    value = str(value).strip()
     try:
-        data = resp.json()
-        _type = 'list' if isinstance(data, list) else type(data).__name__
-        _len = len(data) if isinstance(data, list) else ('n/a' if not isinstance(data, dict) else len(data))
-        print(f"[HTTP]   resp.json.type={_type} len={_len} hash={_hash_payload(data)}")
-    except Exception:
-        print(f"[HTTP]   resp.json: <not a valid JSON>")
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class AdaptivePacer:
+    """
+    Подстраивает интервал общего token bucket по ответам Kaiten.
+    - есть X-RateLimit-Remaining/Reset: остаток квоты равномерно растягивается до сброса;
+      когда запас большой — интервал опускается к floor, по мере исчерпания плавно растёт;
+    - 429: интервал удваивается, выдача слотов приостанавливается до Retry-After;
+    - заголовков нет: после 429 интервал постепенно возвращается к базовому HTTP_MIN_INTERVAL (AIMD),
+      быстрее базового без сведений о квоте не разгоняемся.
+    """
+    SAFETY_MARGIN = 1      # сколько запросов квоты держим в запасе
+    RECOVERY_FACTOR = 0.9  # шаг ускорения без заголовков
+
+    def __init__(self, bucket: SharedTokenBucket, baseline: float, floor: float, ceiling: float):
+        self.bucket = bucket
+        self.floor = min(floor, ceiling)
+        self.ceiling = ceiling
+        self.baseline = self._clamp(baseline)
+
+    def _clamp(self, value: float) -> float:
+        return max(self.floor, min(self.ceiling, value))
+
+    def observe(self, resp: requests.Response):
+        """Учитывает успешный (не 429) ответ."""
+        remaining = _header_float(resp, "X-RateLimit-Remaining", "RateLimit-Remaining")
+        reset = _header_float(resp, "X-RateLimit-Reset", "RateLimit-Reset")
+        current = self.bucket.current_interval()
+        if remaining is not None and reset is not None:
+            if reset > 1e9:  # абсолютный unix time вместо секунд до сброса
+                reset = reset - time.time()
+            reset = max(0.0, reset)
+            if remaining <= 0:
+                self.bucket.pause_until(time.time() + reset)
+                target = self.ceiling
+            else:
+                target = self._clamp(reset / max(remaining - self.SAFETY_MARGIN, 1))
+            # замедляемся сразу, ускоряемся плавно — без раскачки между всплесками и паузами
+            new = target if target > current else (current + target) / 2
+        elif current > self.baseline:
+            new = max(self.baseline, current * self.RECOVERY_FACTOR)
+        else:
+            return
+        if new != current:
+            self.bucket.set_interval(new)
+            if ENABLE_LOGGING:
+                logger.debug(f"Темп запросов к Kaiten: интервал {current:.3f}s -> {new:.3f}s (remaining={remaining}, reset={reset})")
+
+    def on_throttled(self, resp: requests.Response, attempt: int) -> float:
+        """Учитывает 429: замедляет темп и ставит общую паузу. Возвращает длительность паузы."""
+        wait = _retry_after_seconds(resp)
+        if wait is None:
+            wait = min(2 ** attempt, 16) + random.uniform(0, 0.5)
+        self.bucket.set_interval(self._clamp(self.bucket.current_interval() * 2))
+        self.bucket.pause_until(time.time() + wait)
+        return wait
+
+
+_PACER = AdaptivePacer(_RATE_LIMITER, baseline=HTTP_MIN_INTERVAL, floor=HTTP_MIN_INTERVAL_FLOOR, ceiling=HTTP_MAX_INTERVAL)
+
+
+def _trace_request(req_id: str, method: str, url: str, headers: Dict[str, Any], params: Dict[str, Any] = None, body: Any = None):
+    # аргументы форматируются лениво (в потоке QueueListener), маскировка заголовков — сразу
+    _http_logger.info(
+        "▶ REQUEST id=%s %s %s params=%s headers=%s body=%s",
+        req_id, method, url, params, _maybe_mask_headers(headers),
+        LazyPreview(body, PRINT_PREVIEW_LIMIT) if body is not None else None,
+    )
+
+
+def _trace_response(req_id: str, resp: requests.Response, elapsed_s: float, stream: bool = False):
+    if stream:
+        # тело ещё не прочитано и будет разобрано потоково — в трассу идут только метаданные
+        _http_logger.info(
+            "◀ RESPONSE id=%s status=%s time=%.3fs headers=%s body=<stream, %s bytes>",
+            req_id, resp.status_code, elapsed_s, dict(resp.headers), resp.headers.get("Content-Length", "?"),
+        )
+        return
+    content = resp.content
+    _http_logger.info(
+        "◀ RESPONSE id=%s status=%s time=%.3fs headers=%s size=%s hash=%s body=%s",
+        req_id, resp.status_code, elapsed_s, dict(resp.headers), len(content),
+        LazyHash(content), LazyPreview(content, PRINT_PREVIEW_LIMIT),
+    )
+
+
+class CircuitBreaker:
+    """
+    Предохранитель одного эндпоинта (в пределах процесса).
+    closed → после failure_threshold сбоев подряд (сеть, таймаут, 5xx) → open:
+    запросы сразу получают KaitenUnavailableError. Через reset_timeout один запрос
+    пропускается пробным (half-open): успех замыкает цепь, сбой размыкает снова.
+    Проба, не дошедшая до ответа (бюджет, исключение), отпускается release(); если
+    её исход так и не записан, через reset_timeout пропускается новая проба.
+    """
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half-open"
+
+    def __init__(self, name: str, failure_threshold: int = BREAKER_FAILURE_THRESHOLD, reset_timeout: float = BREAKER_RESET_TIMEOUT):
+        self.name = name
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_at = 0.0
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                return self.HALF_OPEN
+            return self._state
+
+    def before_call(self) -> bool:
+        """
+        Пропускает запрос или сразу бросает KaitenUnavailableError.
+        True — запрос пробный: вызывающий обязан записать исход или вызвать release().
+        """
+        with self._lock:
+            if self._state == self.CLOSED:
+                return False
+            now = time.monotonic()
+            if (
+                (self._state == self.OPEN and now - self._opened_at >= self.reset_timeout)
+                # проба потерялась, не записав исход, — пропускаем следующую
+                or (self._state == self.HALF_OPEN and now - self._probe_at >= self.reset_timeout)
+            ):
+                # пробный запрос пропускается один; остальные ждут его результата, не нагружая Kaiten
+                self._state = self.HALF_OPEN
+                self._probe_at = now
+                return True
+            started = self._probe_at if self._state == self.HALF_OPEN else self._opened_at
+            retry_in = max(0.0, self.reset_timeout - (now - started))
+        raise KaitenUnavailableError(f"{self.name}: Kaiten недоступен, повтор через {retry_in:.0f}s")
+
+    def release(self):
+        """Проба завершилась без ответа Kaiten: следующий запрос снова может стать пробным."""
+        with self._lock:
+            if self._state == self.HALF_OPEN:
+                self._state = self.OPEN
+
+    def record_success(self):
+        with self._lock:
+            if self._state != self.CLOSED and ENABLE_LOGGING:
+                logger.info(f"Circuit breaker {self.name}: Kaiten снова отвечает")
+            self._state = self.CLOSED
+            self._failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                if self._state != self.OPEN and ENABLE_LOGGING:
+                    logger.warning(f"Circuit breaker {self.name}: разомкнут после {self._failures} сбоев")
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+
+    def is_open(self) -> bool:
+        return self.state == self.OPEN
+
+
+_BREAKERS: Dict[str, CircuitBreaker] = {}
+_BREAKERS_LOCK = threading.Lock()
+
+
+def _breaker(url: str, endpoint: str) -> CircuitBreaker:
+    # домены Kaiten независимы: сбой одного не размыкает цепь другого
+    name = f"{url.split('/')[2] if '://' in url else ''}:{endpoint}"
+    breaker = _BREAKERS.get(name)
+    if breaker is None:
+        with _BREAKERS_LOCK:
+            breaker = _BREAKERS.setdefault(name, CircuitBreaker(name))
+    return breaker
 
 
 def _is_api_refusal(resp: requests.Response) -> (bool, str):
     # Явный rate limit/доступ
     if resp.status_code in (401, 403, 429):
         return True, f"HTTP {resp.status_code}"
-    # Заголовок rate limit
-    if resp.headers.get("X-RateLimit-Remaining") == "0":
+    # Заголовок rate limit: исчерпанная квота на успешном ответе — не отказ, а сигнал для AdaptivePacer
+    if resp.status_code >= 400 and resp.headers.get("X-RateLimit-Remaining") == "0":
         return True, "Rate limit remaining is 0"
-    # Текст ошибки в JSON
+    # Текст ошибки в JSON (тело успешных ответов не читается: его могут разбирать потоково)
+    if resp.status_code < 400:
+        return False, ""
     try:
         data = resp.json()
         if isinstance(data, dict):
@@ -158,43 +501,279 @@ def _is_api_refusal(resp: requests.Response) -> (bool, str):
     return False, ""
 
 
-def _http_request(method: str, url: str, *, headers: Dict[str, Any], params: Dict[str, Any] = None, json_body: Any = None, timeout: int = HTTP_TIMEOUT) -> (requests.Response, float):
-    """Единая точка HTTP-запроса с троттлингом, ретраями и уважением Retry-After."""
-    global _LAST_CALL_TS
+def _backoff(attempt: int) -> float:
+    return min(HTTP_BACKOFF_FACTOR * (2 ** attempt), HTTP_MAX_BACKOFF) + random.uniform(0, 0.5)
+
+
+class _Flight:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Склейка одинаковых одновременных запросов внутри процесса: пока выполняется
+    запрос с ключом key, остальные вызывающие ждут и получают тот же результат.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights: Dict[Any, _Flight] = {}
+
+    def do(self, key, fn):
+        while True:
+            with self._lock:
+                flight = self._flights.get(key)
+                leader = flight is None
+                if leader:
+                    flight = self._flights[key] = _Flight()
+            if leader:
+                try:
+                    flight.result = fn()
+                    return flight.result
+                except BaseException as e:
+                    flight.error = e
+                    raise
+                finally:
+                    with self._lock:
+                        self._flights.pop(key, None)
+                    flight.done.set()
+
+            remaining = remaining_budget()
+            if not flight.done.wait(timeout=None if remaining is None else max(0.0, remaining)):
+                raise KaitenDeadlineExceeded("бюджет исчерпан в ожидании такого же запроса")
+            if isinstance(flight.error, KaitenDeadlineExceeded):
+                continue  # у лидера кончился его бюджет, а у нас он может ещё остаться
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
 
-    # троттлинг
-    now = time.time()
-    delta = now - _LAST_CALL_TS
-    if delta < HTTP_MIN_INTERVAL:
-        time.sleep(HTTP_MIN_INTERVAL - delta)
+_SINGLE_FLIGHT = SingleFlight()
 
-    req_id = f"{int(time.time()*1000)%100000}-{hashlib.md5((url+str(params)+str(json_body)).encode()).hexdigest()[:6]}"
-    _print_full_request_response(req_id, method, url, headers, params=params, body=json_body)
 
-    # Попытка обрабатывать 429 с Retry-After
+def _flight_key(method: str, url: str, headers: Dict[str, Any], params: Dict[str, Any]):
+    auth = hashlib.sha256(str((headers or {}).get("Authorization", "")).encode()).hexdigest()
+    return method, url, tuple(sorted((str(k), str(v)) for k, v in (params or {}).items())), auth
+
+
+class ValidatorStore:
+    """
+    Валидаторы (ETag/Last-Modified) и разобранные ответы по ключу запроса, LRU на size записей.
+    Отдаёт копии, чтобы изменения у вызывающего не портили сохранённый ответ.
+    Записи помечены эндпоинтом, чтобы сбрасывать их по одному виду метаданных (clear(endpoint)).
+    """
+
+    def __init__(self, size: int):
+        self.size = size
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Any, tuple]" = OrderedDict()
+
+    def conditional_headers(self, key) -> Dict[str, str]:
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is None:
+            return {}
+        etag, last_modified = entry[:2]
+        headers = {}
+        if etag:
+            headers["If-None-Match"] = etag
+        if last_modified:
+            headers["If-Modified-Since"] = last_modified
+        return headers
+
+    def payload(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+        return copy.deepcopy(entry[2])
+
+    def remember(self, key, resp: requests.Response, payload: Any, endpoint: str = None):
+        etag = resp.headers.get("ETag")
+        last_modified = resp.headers.get("Last-Modified")
+        if not etag and not last_modified:
+            return
+        entry = (etag, last_modified, copy.deepcopy(payload), endpoint)
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def clear(self, endpoint: str = None):
+        with self._lock:
+            if endpoint is None:
+                self._entries.clear()
+                return
+            for key in [key for key, entry in self._entries.items() if entry[3] == endpoint]:
+                del self._entries[key]
+
+
+_VALIDATORS = ValidatorStore(VALIDATOR_STORE_SIZE)
+
+
+# Кассета записи/воспроизведения (KAITEN_CASSETTE_MODE); None — обычная работа с сетью
+_CASSETTE = cassette_from_env()
+
+
+@contextmanager
+def use_kaiten_cassette(path: str, mode: str = "replay", **options):
+    """
+    Временно включает кассету для всего процесса (всех потоков), например в тестах
+    и замерах: with use_kaiten_cassette("fixtures/report", latency="recorded"): ...
+    """
+    global _CASSETTE
+    previous, _CASSETTE = _CASSETTE, Cassette(path, mode, **options)
+    try:
+        yield _CASSETTE
+    finally:
+        _CASSETTE = previous
+
+
+def _send(session: requests.Session, method: str, url: str, *, headers, params, json_body, timeout, stream):
+    """Один HTTP-обмен: через сеть или кассету."""
+    cassette = _CASSETTE
+    if cassette is not None and cassette.mode == "replay":
+        return cassette.replay(method, url, params=params, json_body=json_body, headers=headers)
+    if cassette is not None:
+        headers = strip_conditional(headers)
+    t0 = time.monotonic()
+    resp = session.request(
+        method=method, url=url, headers=headers, params=params, json=json_body,
+        timeout=timeout, stream=stream,
+    )
+    if cassette is not None:
+        cassette.record(method, url, params, json_body, resp, time.monotonic() - t0)
+    return resp
+
+
+def _http_request(method: str, url: str, *, headers: Dict[str, Any], params: Dict[str, Any] = None, json_body: Any = None, timeout: Any = HTTP_TIMEOUT, session: requests.Session = None, endpoint: str = None, stream: bool = False) -> (requests.Response, float):
+    """
+    Единая точка HTTP-запроса. Одинаковые GET (URL, параметры, учётные данные), уже
+    выполняющиеся в этом процессе, не повторяются: вызывающий получает их ответ.
+    Потоковые ответы (stream=True) читает один владелец, поэтому они не склеиваются.
+    """
+    if SINGLE_FLIGHT and method.upper() == "GET" and json_body is None and not stream:
+        return _SINGLE_FLIGHT.do(
+            _flight_key(method, url, headers, params),
+            lambda: _do_http_request(method, url, headers=headers, params=params, json_body=json_body, timeout=timeout, session=session, endpoint=endpoint),
+        )
+    return _do_http_request(method, url, headers=headers, params=params, json_body=json_body, timeout=timeout, session=session, endpoint=endpoint, stream=stream)
+
+
+def _do_http_request(method: str, url: str, *, headers: Dict[str, Any], params: Dict[str, Any] = None, json_body: Any = None, timeout: Any = HTTP_TIMEOUT, session: requests.Session = None, endpoint: str = None, stream: bool = False) -> (requests.Response, float):
+    """
+    Единая точка HTTP-запроса: троттлинг, одна политика повторов и бюджет времени.
+    Повторяются 429 (пауза по Retry-After, общая для воркеров), 5xx и сетевые сбои
+    идемпотентных методов — пока хватает HTTP_MAX_RETRIES и бюджета kaiten_deadline.
+    Если указан endpoint, сбои учитывает его circuit breaker: при разомкнутой цепи
+    запрос (и очередной повтор) сразу завершается KaitenUnavailableError.
+    """
+    # трассировка: всегда при KAITEN_HTTP_DEBUG, иначе по сэмплированию запроса (KAITEN_TRACE_SAMPLE_RATE)
+    traced = HTTP_DEBUG or tracing_enabled()
+    req_id = f"{get_correlation_id()}/{next(_REQUEST_SEQ)}" if traced else None
+    if traced:
+        _trace_request(req_id, method, url, headers, params=params, body=json_body)
+    retryable = method.upper() in _IDEMPOTENT_METHODS
+    breaker = _breaker(url, endpoint) if BREAKER_ENABLED and endpoint else None
+    label = endpoint or "other"
+
     attempt = 0
-    while True:
-        t0 = time.monotonic()
-        resp = _session.request(method=method, url=url, headers=headers, params=params, json=json_body, timeout=timeout)
-        dt = time.monotonic() - t0
-        _LAST_CALL_TS = time.time()
+    probe = False   # этот запрос — проба half-open: её исход записывается или проба отпускается
+    try:
+        while True:
+            if breaker is not None:
+                try:
+                    probe = breaker.before_call()
+                except KaitenUnavailableError:
+                    metrics.inc("kaiten_circuit_rejections_total", endpoint=label)
+                    raise
+            _check_budget(f"{method} {url}")
+            # ожидание считается целиком: очередь приоритетов + общий токен-бакет
+            t_wait = time.monotonic()
+            _throttle()
+            metrics.observe("kaiten_throttle_wait_seconds", time.monotonic() - t_wait, priority=_PRIORITY.get())
+            remaining = _check_budget(f"{method} {url}")
 
-        refused, reason = _is_api_refusal(resp)
-        _print_full_response(req_id, resp, dt)
+            t0 = time.monotonic()
+            try:
+                resp = _send(
+                    session or _session, method, url, headers=headers, params=params, json_body=json_body,
+                    timeout=_cap_timeout(timeout, remaining), stream=stream,
+                )
+            except (requests.ConnectionError, requests.Timeout) as e:
+                metrics.inc("kaiten_request_errors_total", endpoint=label, error=type(e).__name__)
+                if breaker is not None:
+                    breaker.record_failure()
+                    probe = False
+                if not retryable or attempt >= HTTP_MAX_RETRIES:
+                    raise
+                wait = _backoff(attempt)
+                if remaining_budget() is not None and remaining_budget() - wait < HTTP_MIN_ATTEMPT_BUDGET:
+                    raise KaitenDeadlineExceeded(f"{method} {url}: {e}; на повтор не хватает бюджета") from e
+                if ENABLE_LOGGING:
+                    logger.warning(f"{method} {url}: {e} (attempt {attempt+1}/{HTTP_MAX_RETRIES}), retry in {wait:.2f}s")
+                metrics.inc("kaiten_retries_total", endpoint=label, reason="network")
+                metrics.inc("kaiten_retry_sleep_seconds_total", wait, endpoint=label)
+                time.sleep(wait)
+                attempt += 1
+                continue
+            dt = time.monotonic() - t0
+            if breaker is not None:
+                # 429 — Kaiten отвечает, просто просит подождать: для предохранителя это успех
+                if resp.status_code in _RETRY_STATUSES:
+                    breaker.record_failure()
+                else:
+                    breaker.record_success()
+                probe = False
 
-        if refused and resp.status_code == 429 and attempt < HTTP_MAX_RETRIES:
-            # Уважаем Retry-After
-            ra = resp.headers.get("Retry-After")
-            if ra and str(ra).isdigit():
-                wait = int(ra)
-            else:
-                wait = min(2 ** attempt, 16) + random.uniform(0, 0.5)
-            if ENABLE_LOGGING:
-                logger.warning(f"429 Too Many Requests (attempt {attempt+1}/{HTTP_MAX_RETRIES}), sleep {wait:.2f}s")
-            time.sleep(wait)
-            attempt += 1
-            continue
-        return resp, dt
+            refused, reason = _is_api_refusal(resp)
+            if traced:
+                _trace_response(req_id, resp, dt, stream=stream)
+            metrics.inc("kaiten_requests_total", endpoint=label, status=resp.status_code)
+            metrics.observe("kaiten_request_duration_seconds", dt, endpoint=label)
+            if refused:
+                metrics.inc("kaiten_refusals_total", endpoint=label, status=resp.status_code)
+
+            if attempt < HTTP_MAX_RETRIES and refused and resp.status_code == 429:
+                # Пауза общая для всех воркеров: следующий слот выдаётся не раньше Retry-After.
+                # Если пауза не помещается в бюджет, _throttle на следующей итерации сразу сообщит об этом.
+                wait = _PACER.on_throttled(resp, attempt)
+                if ENABLE_LOGGING:
+                    logger.warning(f"429 Too Many Requests (attempt {attempt+1}/{HTTP_MAX_RETRIES}), pause {wait:.2f}s")
+                metrics.inc("kaiten_retries_total", endpoint=label, reason="429")
+                metrics.inc("kaiten_retry_sleep_seconds_total", wait, endpoint=label)
+                # соединение возвращается в пул: при pool_block=True незакрытые ответы его исчерпывают
+                resp.close()
+                attempt += 1
+                continue
+            if attempt < HTTP_MAX_RETRIES and retryable and resp.status_code in _RETRY_STATUSES:
+                wait = _retry_after_seconds(resp)
+                wait = _backoff(attempt) if wait is None else wait
+                remaining = remaining_budget()
+                if remaining is None or remaining - wait >= HTTP_MIN_ATTEMPT_BUDGET:
+                    if ENABLE_LOGGING:
+                        logger.warning(f"HTTP {resp.status_code} on {url} (attempt {attempt+1}/{HTTP_MAX_RETRIES}), retry in {wait:.2f}s")
+                    metrics.inc("kaiten_retries_total", endpoint=label, reason=str(resp.status_code))
+                    metrics.inc("kaiten_retry_sleep_seconds_total", wait, endpoint=label)
+                    resp.close()
+                    time.sleep(wait)
+                    attempt += 1
+                    continue
+                # бюджета на повтор нет — отдаём ответ как есть, вызывающий увидит ошибку статуса
+            if resp.status_code != 429:
+                _PACER.observe(resp)
+            return resp, dt
+    finally:
+        # проба не дошла до ответа (бюджет, троттлинг, иная ошибка) — не держим цепь в half-open
+        if probe:
+            breaker.release()
 
 
 def _http_get_full(method: str, url: str, headers: Dict[str, Any], params: Dict[str, Any] = None, timeout: int = HTTP_TIMEOUT):
@@ -202,179 +781,664 @@ def _http_get_full(method: str, url: str, headers: Dict[str, Any], params: Dict[
     return _http_request(method=method, url=url, headers=headers, params=params, json_body=None, timeout=timeout)
 
 # -----------------------------------------------------------------------------
-# Функции API (оригинальная логика сохранена, добавлены проверки отказов и try/except)
+# Фильтр карточек: условия компилируются в параметры и base64-filter запроса /cards
 # -----------------------------------------------------------------------------
+def _iso(value) -> str:
+    return value.isoformat() if hasattr(value, "isoformat") else str(value)
 
-def fetch_kaiten_boards(domain, bearer_key, space_id):
-    url = f"https://{domain}.kaiten.ru/api/latest/spaces/{space_id}/boards"
-    headers = {
-         "Authorization": f"Bearer {bearer_key}",
-         "Accept": "application/json",
-         "Content-Type": "application/json",
-    }
-    if ENABLE_LOGGING:
-        logger.debug(f"Запрос досок: url={url}, для пространства {space_id}")
-        logger.debug(f"Headers={_maybe_mask_headers(headers)}")
 
-    try:
-         response, dt = _http_get_full("GET", url, headers=headers, params=None, timeout=HTTP_TIMEOUT)
-         if ENABLE_LOGGING:
-             logger.debug(f"HTTP GET {url} -> {response.status_code} за {dt:.2f}s")
-         refused, reason = _is_api_refusal(response)
-         if refused:
-             raise KaitenApiRefusedError(f"API refusal on boards: {reason}")
-         response.raise_for_status()
-         boards = response.json()
-         if ENABLE_LOGGING:
-             logger.debug(f"Ответ (hash={_hash_payload(boards)}, len={len(boards) if isinstance(boards, list) else 'n/a'})")
-             logger.info(f"Получено досок: {len(boards) if isinstance(boards, list) else 'n/a'} для пространства {space_id}")
-         return [{"id": str(board.get("id")), "title": board.get("title")} for board in boards]
-    except Exception as e:
-         if ENABLE_LOGGING:
-             logger.error(f"Ошибка при получении досок для пространства {space_id}: {e}", exc_info=True)
-         return []
+class CardFilter:
+    """
+    Построитель запроса /cards. Доска, дорожка, колонка и даты уходят query-параметрами,
+    кастомные поля — деревом условий в параметре filter (base64 JSON).
+    Пустые значения (None, "") игнорируются, поэтому условия можно добавлять
+    прямо из данных формы. Методы возвращают self для цепочек:
 
+        CardFilter(space_id).board(board_id).lane(lane_id).custom_property(field_id, value)
+    """
 
-def fetch_kaiten_cards(domain, bearer_key, project_id, billing_field_id, billing_field_value):
-    # Получение списка карточек (задач) по проекту, отфильтрованных по кастомному полю Billing (дата фильтруется вне класса)
-    filter_data = {
-        "key": "and",
-        "value": [
+    def __init__(self, space_id=None):
+        self.params: Dict[str, Any] = {}
+        self.conditions = []
+        if space_id not in (None, ""):
+            self.params["space_id"] = space_id
+
+    def __repr__(self):
+        return f"<CardFilter params={self.params} conditions={self.conditions}>"
+
+    def _param(self, name, value):
+        if value not in (None, ""):
+            self.params[name] = value
+        return self
+
+    def board(self, board_id):
+        return self._param("board_id", board_id)
+
+    def lane(self, lane_id):
+        return self._param("lane_id", lane_id)
+
+    def column(self, column_id):
+        return self._param("column_id", column_id)
+
+    def created(self, after=None, before=None):
+        """Создана в интервале; границы — date/datetime или строки ISO 8601."""
+        self._param("created_after", after and _iso(after))
+        return self._param("created_before", before and _iso(before))
+
+    def updated(self, after=None, before=None):
+        """Изменялась в интервале; границы — date/datetime или строки ISO 8601."""
+        self._param("updated_after", after and _iso(after))
+        return self._param("updated_before", before and _iso(before))
+
+    def custom_property(self, property_id, value, type: str = "select", comparison: str = "eq"):
+        if property_id in (None, "") or value in (None, ""):
+            return self
+        if type == "select":
+            value = int(value)
+        self.conditions.append({
+            "key": "custom_property",
+            "comparison": comparison,
+            "id": int(property_id),
+            "type": type,
+            "value": value,
+        })
+        return self
+
+    def compile(self) -> Dict[str, Any]:
+        """Параметры запроса /cards (без offset/limit — их добавляет paginate)."""
+        params = dict(self.params)
+        if self.conditions:
+            filter_data = {"key": "and", "value": [{"key": "and", "value": list(self.conditions)}]}
+            params["filter"] = base64.b64encode(json.dumps(filter_data).encode("utf-8")).decode("utf-8")
+        return params
+
+
+# -----------------------------------------------------------------------------
+# Клиент Kaiten: пул соединений и сессии на пару (domain, bearer_key)
+# -----------------------------------------------------------------------------
+def _project_item(record):
+    # элементы-не-объекты (мусор в ответе) отбрасываются, как и раньше при обращении к .get
+    return lambda item: record.from_json(item) if isinstance(item, dict) else None
+
+
+def _describe(data: Any) -> str:
+    _type = 'list' if isinstance(data, list) else type(data).__name__
+    _len = len(data) if isinstance(data, (list, dict)) else 'n/a'
+    return f"type={_type}, len={_len}"
+
+
+class KaitenClient:
+    """
+    Клиент Kaiten API для пары (domain, bearer_key).
+    Держит собственный пул keep-alive соединений; пул urllib3 потокобезопасен,
+    а requests.Session — нет, поэтому у каждого потока своя сессия поверх общего адаптера.
+    Экземпляры не создаются напрямую, а берутся через get_kaiten_client().
+    Методы возвращают уже преобразованные данные и пробрасывают ошибки.
+    """
+
+    def __init__(self, domain, bearer_key, pool_maxsize: int = HTTP_POOL_MAXSIZE):
+        self.domain = domain
+        self.bearer_key = bearer_key
+        self.base_url = KAITEN_BASE_URL.format(domain=domain)
+        self.headers = {
+            "Authorization": f"Bearer {bearer_key}",
+            "Accept": "application/json",
+            "Content-Type": "application/json",
+            "Connection": "keep-alive",
+        }
+        # pool_block=True: при нехватке соединений поток ждёт свободное, а не открывает лишнее
+        self._adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_maxsize, pool_block=True, max_retries=_NO_RETRY)
+        self._local = threading.local()
+
+    def __repr__(self):
+        return f"<KaitenClient {self.domain}>"
+
+    @property
+    def session(self) -> requests.Session:
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = requests.Session()
+            session.mount("https://", self._adapter)
+            session.mount("http://", self._adapter)
+            self._local.session = session
+        return session
+
+    def timeout_for(self, endpoint: str, timeout=None):
+        return (HTTP_CONNECT_TIMEOUT, timeout or ENDPOINT_TIMEOUTS.get(endpoint, HTTP_TIMEOUT))
+
+    def request(self, method: str, path: str, *, endpoint: str, params: Dict[str, Any] = None, json_body: Any = None, timeout=None, extra_headers: Dict[str, str] = None, stream: bool = False):
+        url = f"{self.base_url}{path}"
+        headers = {**self.headers, **extra_headers} if extra_headers else self.headers
+        return _http_request(
+            method, url,
+            headers=headers, params=params, json_body=json_body,
+            timeout=self.timeout_for(endpoint, timeout), session=self.session, endpoint=endpoint,
+            stream=stream,
+        )
+
+    def get_json(self, path: str, *, endpoint: str, params: Dict[str, Any] = None, timeout=None) -> Any:
+        """
+        GET с проверкой отказа API и статуса; возвращает разобранный JSON.
+        Для метаданных (CONDITIONAL_ENDPOINTS) запрос условный: на 304 отдаётся
+        сохранённый ранее разобранный ответ без загрузки и парсинга тела.
+        """
+        if ENABLE_LOGGING:
+            logger.debug(f"Запрос {endpoint}: url={self.base_url}{path}, params={params}, headers={_maybe_mask_headers(self.headers)}")
+        conditional = CONDITIONAL_GET and endpoint in CONDITIONAL_ENDPOINTS
+        key = _flight_key("GET", f"{self.base_url}{path}", self.headers, params) if conditional else None
+        extra_headers = _VALIDATORS.conditional_headers(key) if conditional else None
+        resp, dt = self.request("GET", path, endpoint=endpoint, params=params, timeout=timeout, extra_headers=extra_headers)
+        if ENABLE_LOGGING:
+            logger.debug(f"HTTP GET {resp.url} -> {resp.status_code} за {dt:.2f}s")
+        if resp.status_code == 304 and conditional:
+            data = _VALIDATORS.payload(key)
+            if data is not None:
+                if ENABLE_LOGGING:
+                    logger.debug(f"Ответ {endpoint}: 304 Not Modified, используется сохранённый ({_describe(data)})")
+                return data
+            # валидатор вытеснен из хранилища между запросом и ответом — запрашиваем заново без условий
+            resp, dt = self.request("GET", path, endpoint=endpoint, params=params, timeout=timeout)
+        refused, reason = _is_api_refusal(resp)
+        if refused:
+            raise KaitenApiRefusedError(f"API refusal on {endpoint}: {reason}")
+        resp.raise_for_status()
+        data = resp.json()
+        if conditional:
+            _VALIDATORS.remember(key, resp, data, endpoint)
+        if ENABLE_LOGGING:
+            logger.debug("Ответ %s (hash=%s, %s)", endpoint, LazyHash(data), _describe(data))
+        return data
+
+    def get_records(self, path: str, *, endpoint: str, record, params: Dict[str, Any] = None, timeout=None) -> list:
+        """
+        GET спискового эндпоинта с проекцией элементов в record (CardRecord, TimeLogRecord).
+        При STREAM_PARSE тело разбирается потоково: полный список словарей не создаётся.
+        """
+        if not STREAM_PARSE:
+            data = self.get_json(path, endpoint=endpoint, params=params, timeout=timeout)
+            return [record.from_json(item) for item in (data if isinstance(data, list) else [])]
+        resp, dt = self.request("GET", path, endpoint=endpoint, params=params, timeout=timeout, stream=True)
+        try:
+            refused, reason = _is_api_refusal(resp)
+            if refused:
+                raise KaitenApiRefusedError(f"API refusal on {endpoint}: {reason}")
+            resp.raise_for_status()
+        except Exception:
+            resp.close()
+            raise
+        records = [r for r in iter_response_items(resp, _project_item(record)) if r is not None]
+        if ENABLE_LOGGING:
+            logger.debug(f"HTTP GET {resp.url} -> {resp.status_code} за {dt:.2f}s, записей: {len(records)}")
+        return records
+
+    def paginate(self, path: str, *, endpoint: str, params: Dict[str, Any] = None, page_size: int = None, items=None, prefetch: bool = True, timeout=None, record=None, strict: bool = False):
+        """
+        Генератор элементов спискового эндпоинта по страницам offset/limit.
+        Пока вызывающий обрабатывает полную страницу, следующая уже загружается
+        в фоне (prefetch), так что в памяти не больше двух страниц.
+        items(data) извлекает список из ответа (по умолчанию ответ — сам список);
+        с record страницы разбираются потоково в компактные записи (см. get_records).
+        Страница, повторяющая предыдущую (сервер не учёл offset), останавливает пагинацию;
+        со strict=True — KaitenUnreliableListError, причём повтором считается любой общий id.
+        """
+        page_size = page_size or PAGE_SIZE
+        items = items or (lambda data: data if isinstance(data, list) else [])
+
+        def load(offset):
+            page_params = {**(params or {}), "offset": offset, "limit": page_size}
+            if record is not None:
+                return self.get_records(path, endpoint=endpoint, record=record, params=page_params, timeout=timeout)
+            return items(self.get_json(path, endpoint=endpoint, params=page_params, timeout=timeout))
+
+        offset, pending, previous_head, previous_ids = 0, None, None, None
+        try:
+            page = load(offset)
+            while True:
+                repeated = bool(page) and page[0] == previous_head
+                if strict and previous_ids and not repeated:
+                    repeated = not previous_ids.isdisjoint(item.get("id") for item in page)
+                if repeated:
+                    # сервер проигнорировал offset — дальше были бы те же данные
+                    if strict:
+                        raise KaitenUnreliableListError(f"{endpoint}: offset={offset} повторяет элементы предыдущей страницы")
+                    if ENABLE_LOGGING:
+                        logger.warning(f"{endpoint}: offset={offset} вернул ту же страницу, пагинация остановлена")
+                    return
+                full = len(page) >= page_size
+                if full and prefetch:
+                    # контекст (бюджет, приоритет) переносится в поток предзагрузки
+                    pending = _PREFETCH_POOL.submit(contextvars.copy_context().run, load, offset + page_size)
+                yield from page
+                if not full:
+                    return
+                offset += page_size
+                previous_head = page[0] if page else None
+                if strict:
+                    previous_ids = {item.get("id") for item in page}
+                if pending is not None:
+                    page, pending = pending.result(), None
+                else:
+                    page = load(offset)
+        finally:
+            if pending is not None:
+                pending.cancel()
+
+    # --- эндпоинты -----------------------------------------------------------
+
+    def spaces(self):
+        data = self.get_json("/spaces", endpoint="spaces")
+        projects = [{"id": project.get("id"), "title": project.get("title")} for project in data]
+        if ENABLE_LOGGING:
+            logger.info(f"Получено проектов: {len(projects)}")
+        return projects
+
+    def boards(self, space_id):
+        boards = self.get_json(f"/spaces/{space_id}/boards", endpoint="boards")
+        if ENABLE_LOGGING:
+            logger.info(f"Получено досок: {len(boards) if isinstance(boards, list) else 'n/a'} для пространства {space_id}")
+        return [{"id": str(board.get("id")), "title": board.get("title")} for board in boards]
+
+    def cards(self, space_id, billing_field_id, billing_field_value):
+        # Карточки пространства, отфильтрованные по select-полю (дата фильтруется вне клиента)
+        return self.find_cards(CardFilter(space_id).custom_property(billing_field_id, billing_field_value))
+
+    def iter_cards(self, card_filter: "CardFilter"):
+        # Карточки по фильтру (CardRecord), по мере загрузки страниц
+        return self.paginate("/cards", endpoint="cards", params=card_filter.compile(), record=CardRecord)
+
+    def find_cards(self, card_filter: "CardFilter"):
+        cards = list(self.iter_cards(card_filter))
+        if ENABLE_LOGGING:
+            logger.info(f"Получено карточек: {len(cards)} ({card_filter!r})")
+        return cards
+
+    def iter_all_cards(self, space_id):
+        # Все карточки пространства без фильтра по кастомному полю, по мере загрузки страниц
+        return self.paginate("/cards", endpoint="cards", params={"space_id": space_id}, record=CardRecord)
+
+    def all_cards(self, space_id):
+        return list(self.iter_all_cards(space_id))
+
+    def time_logs(self, card_id):
+        try:
+            time_logs = self.get_records(f"/cards/{card_id}/time-logs", endpoint="time-logs", record=TimeLogRecord)
+        except Exception as e:
+            logger.warning(f"Не удалось получить списания времени карточки {card_id}: {e}")
+            raise
+        # хэш считается, только если запись действительно будет записана
+        _http_logger.debug("✔ TIMELOG card=%s len=%s hash=%s", card_id, len(time_logs), LazyHash(time_logs))
+        if ENABLE_LOGGING:
+            logger.info(f"Получено списаний времени для карточки {card_id}: {len(time_logs)}")
+        return time_logs
+
+    def iter_time_logs_between(self, start_date, end_date, space_id=None, board_id=None, strict=False):
+        # Списания пространства/доски с датой создания в [start_date, end_date], по мере загрузки страниц
+        params = {"from": _iso(start_date), "to": _iso(end_date), "space_id": space_id, "board_id": board_id}
+        params = {k: v for k, v in params.items() if v not in (None, "")}
+        return self.paginate("/time-logs", endpoint="time-logs-bulk", params=params, record=TimeLogRecord, strict=strict)
+
+    def roles(self):
+        # Роли компании, кроме служебной роли с id = -1
+        roles_raw = self.get_json("/user-roles", endpoint="user-roles")
+        roles = [
+            {"id": str(role.get("id")), "name": role.get("name")}
+            for role in roles_raw
+            if str(role.get("id")) != "-1"
+        ]
+        if ENABLE_LOGGING:
+            logger.info(f"Получено ролей (без id=-1): {len(roles)}")
+        return roles
+
+    def users(self, timeout=None):
+        def items(data):
+            if isinstance(data, dict):
+                return data.get("users", [])
+            if isinstance(data, list):
+                return data
+            if ENABLE_LOGGING:
+                logger.warning("Неожиданный тип ответа пользователей, страница пропущена")
+            return []
+
+        users = list(self.paginate("/users", endpoint="users", items=items, timeout=timeout))
+        if ENABLE_LOGGING:
+            logger.info(f"Получено пользователей: {len(users)}")
+        return users
+
+    def board_roles(self, space_id, board_id):
+        return self.get_json(f"/spaces/{space_id}/boards/{board_id}/roles", endpoint="board-roles")  # список {"id": ..., "name": ...}
+
+    def custom_property_values(self, property_id):
+        raw = self.get_json(f"/company/custom-properties/{property_id}/select-values", endpoint="custom-property-values")
+        return [
+            {"id": str(item["id"]), "name": item.get("value", "")}
+            for item in raw
+            if not item.get("deleted", False)
+        ]
+
+    def board_statuses(self, board_id):
+        data = self.get_json(f"/boards/{board_id}/columns", endpoint="columns")
+        # В Kaiten у колонок название лежит в поле "name"
+        return [
             {
-                "key": "and",
-                "value": [
-                    {
-                        "key": "custom_property",
-                        "comparison": "eq",
-                        "id": int(billing_field_id),
-                        "type": "select",
-                        "value": int(billing_field_value)
-                    }
-                ]
+                "id":   str(col["id"]),
+                "title": col.get("name") or col.get("title", "")
             }
+            for col in data
         ]
-    }
-    filter_str = json.dumps(filter_data)
-    filter_encoded = base64.b64encode(filter_str.encode('utf-8')).decode('utf-8')
-
-    url = f"https://{domain}.kaiten.ru/api/latest/cards"
-    params = {
-        "space_id": project_id,
-        "offset": 0,
-        "limit": 1000,
-        "filter": filter_encoded,
-    }
-    headers = {
-        "Authorization": f"Bearer {bearer_key}",
-        "Accept": "application/json",
-        "Content-Type": "application/json",
-    }
-    if ENABLE_LOGGING:
-        logger.debug(f"Запрос карточек: url={url}, params={params}, headers={_maybe_mask_headers(headers)}")
+
+    def swimlanes(self, board_id):
+        data = self.get_json(f"/boards/{board_id}/lanes", endpoint="lanes")
+        return [
+            {
+                "id": str(lane["id"]),
+                "title": lane.get("title") or lane.get("name", ""),
+            }
+            for lane in data
+        ]
+
+
+_CLIENTS: Dict[tuple, KaitenClient] = {}
+_CLIENTS_LOCK = threading.Lock()
+
+# Потоки предзагрузки следующей страницы для KaitenClient.paginate
+_PREFETCH_POOL = ThreadPoolExecutor(max_workers=HTTP_CONCURRENCY, thread_name_prefix="kaiten-prefetch")
+
+
+def get_kaiten_client(domain, bearer_key) -> KaitenClient:
+    """Клиент для (domain, bearer_key), один на процесс: соединения и TLS переиспользуются между запросами."""
+    key = (domain, bearer_key)
+    client = _CLIENTS.get(key)
+    if client is None:
+        with _CLIENTS_LOCK:
+            client = _CLIENTS.get(key)
+            if client is None:
+                client = _CLIENTS[key] = KaitenClient(domain, bearer_key)
+    return client
+
+
+# -----------------------------------------------------------------------------
+# Кэш метаданных (spaces, boards, roles, columns, lanes, select values, users)
+# -----------------------------------------------------------------------------
+_METADATA_CACHE = TwoTierCache("kaiten", l1_size=CACHE_L1_SIZE, fresh_ttl=CACHE_FRESH_TTL, stale_ttl=CACHE_STALE_TTL, lkg_ttl=CACHE_LKG_TTL)
+
+
+def _is_outage(exc: Exception) -> bool:
+    """Ошибка говорит о недоступности Kaiten (а не, например, о неверном ключе)."""
+    if isinstance(exc, (KaitenUnavailableError, KaitenDeadlineExceeded, requests.ConnectionError, requests.Timeout)):
+        return True
+    response = getattr(exc, "response", None)
+    return isinstance(exc, requests.HTTPError) and response is not None and response.status_code in _RETRY_STATUSES
+
+
+def _cached(domain, bearer_key, kind: str, args: tuple, method: str):
+    """
+    Результат KaitenClient.<method>(*args) через кэш; фоновые обновления идут с приоритетом BACKGROUND.
+    Пока Kaiten недоступен (разомкнут circuit breaker эндпоинта или запрос упал по сети/5xx),
+    отдаётся last-known-good, помеченный как устаревший (см. is_stale).
+    """
+    client = get_kaiten_client(domain, bearer_key)
+
+    def fetch():
+        return getattr(client, method)(*args)
+
+    if not CACHE_ENABLED:
+        return fetch()
+
+    def refresh():
+        with kaiten_priority(PRIORITY_BACKGROUND):
+            return fetch()
+
+    credentials = hashlib.sha256(f"{domain}:{bearer_key}".encode()).hexdigest()[:16]
+    key_parts = (credentials,) + tuple(str(a) for a in args)
     try:
-        response, dt = _http_get_full("GET", url, headers=headers, params=params, timeout=HTTP_TIMEOUT)
+        if BREAKER_ENABLED and _breaker(client.base_url, kind).is_open():
+            raise KaitenUnavailableError(f"{kind}: Kaiten недоступен")
+        return _METADATA_CACHE.get_or_fetch(kind, key_parts, fetch, refresh=refresh)
+    except Exception as e:
+        if not _is_outage(e):
+            raise
+        last_good = _METADATA_CACHE.last_good(kind, key_parts)
+        if last_good is None:
+            raise
+        value, age = last_good
+        metrics.inc("kaiten_cache_requests_total", namespace=kind, result="last_good")
         if ENABLE_LOGGING:
-            logger.debug(f"HTTP GET {url} -> {response.status_code} за {dt:.2f}s (params hash={_hash_payload(params)})")
-        refused, reason = _is_api_refusal(response)
-        if refused:
-            raise KaitenApiRefusedError(f"API refusal on cards: {reason}")
-        response.raise_for_status()
-        cards = response.json()
+            logger.warning(f"{kind}: Kaiten недоступен ({e}), отдаются данные {age:.0f}s давности")
+        return mark_stale(value)
+
+
+def is_kaiten_degraded(domain) -> bool:
+    """True, если хотя бы у одного эндпоинта домена сейчас разомкнут circuit breaker."""
+    prefix = f"{KAITEN_BASE_URL.format(domain=domain).split('/')[2]}:"
+    return any(name.startswith(prefix) and breaker.is_open() for name, breaker in list(_BREAKERS.items()))
+
+
+def invalidate_kaiten_cache(kind: str = None):
+    """
+    Сбрасывает кэш метаданных (весь или один вид: 'boards', 'lanes', ...) во всех воркерах
+    и валидаторы условных запросов того же вида (вид кэша совпадает с именем эндпоинта).
+    """
+    _METADATA_CACHE.invalidate(kind or "*")
+    _VALIDATORS.clear(kind)
+
+
+# -----------------------------------------------------------------------------
+# Функции API: тонкие обёртки над KaitenClient, при ошибке возвращают []
+# -----------------------------------------------------------------------------
+
+def fetch_kaiten_boards(domain, bearer_key, space_id):
+    try:
+        return _cached(domain, bearer_key, "boards", (space_id,), "boards")
+    except Exception as e:
         if ENABLE_LOGGING:
-            logger.debug(f"Ответ карточек (hash={_hash_payload(cards)}, "
-                         f"type={'list' if isinstance(cards, list) else type(cards).__name__}, "
-                         f"len={len(cards) if isinstance(cards, list) else 'n/a'})")
-            logger.info(f"Получено карточек: {len(cards) if isinstance(cards, list) else 'n/a'}")
-        return cards
+            logger.error(f"Ошибка при получении досок для пространства {space_id}: {e}", exc_info=True)
+        return []
+
+
+def fetch_kaiten_cards(domain, bearer_key, project_id, billing_field_id, billing_field_value):
+    # Получение списка карточек (задач) по проекту, отфильтрованных по кастомному полю Billing (дата фильтруется вне класса)
+    try:
+        return get_kaiten_client(domain, bearer_key).cards(project_id, billing_field_id, billing_field_value)
     except Exception as e:
         if ENABLE_LOGGING:
             logger.error(f"Ошибка при получении карточек: {e}", exc_info=True)
         return []
 
 
-def fetch_kaiten_time_logs(domain, bearer_key, card_id):
-    # Получение списка списаний времени для конкретной карточки.
-    url = f"https://{domain}.kaiten.ru/api/latest/cards/{card_id}/time-logs"
-    headers = {
-        "Authorization": f"Bearer {bearer_key}",
-        "Accept": "application/json",
-        "Content-Type": "application/json",
-    }
-    if ENABLE_LOGGING:
-        logger.debug(f"Запрос списаний времени: url={url}, headers={_maybe_mask_headers(headers)}")
-    if HTTP_DEBUG:
-        print(f"Запрос списаний времени: url={url}, headers={_maybe_mask_headers(headers)}")  # исходная печать сохранена (под флагом)
-
-    # Корреляционный id
-    _req_id = f"{card_id}-{int(time.time()*1000)%100000}"
-
+def fetch_kaiten_filtered_cards(domain, bearer_key, card_filter: CardFilter):
+    # Карточки по CardFilter: доска/дорожка/колонка/кастомные поля/даты фильтруются на стороне Kaiten
     try:
-        if HTTP_DEBUG:
-            print(f"[TIMELOG] ▶ start req={_req_id} GET {url}")
-        t0 = time.monotonic()
-        response, _ = _http_get_full("GET", url, headers=headers, params=None, timeout=HTTP_TIMEOUT)
-        dt = time.monotonic() - t0
+        return get_kaiten_client(domain, bearer_key).find_cards(card_filter)
+    except Exception as e:
         if ENABLE_LOGGING:
-            logger.debug(f"HTTP GET {url} -> {response.status_code} за {dt:.2f}s")
-        if HTTP_DEBUG:
-            print(f"[TIMELOG] ◀ done  req={_req_id} status={response.status_code} time={dt:.2f}s")
+            logger.error(f"Ошибка при получении карточек ({card_filter!r}): {e}", exc_info=True)
+        return []
 
-        refused, reason = _is_api_refusal(response)
-        if refused:
-            raise KaitenApiRefusedError(f"API refusal on time-logs: {reason}")
-        response.raise_for_status()
-        time_logs = response.json()
-        if ENABLE_LOGGING:
-            logger.debug(f"Ответ time-logs (hash={_hash_payload(time_logs)}, "
-                         f"type={'list' if isinstance(time_logs, list) else type(time_logs).__name__}, "
-                         f"len={len(time_logs) if isinstance(time_logs, list) else 'n/a'})")
-
-        _len = len(time_logs) if isinstance(time_logs, list) else "n/a"
-        _hash = _hash_payload(time_logs)
-        if HTTP_DEBUG:
-            print(f"[TIMELOG] ✔ req={_req_id} len={_len} hash={_hash}")
-        if ENABLE_LOGGING:
-            logger.info(f"Получено списаний времени для карточки {card_id}: {_len}")
-        return time_logs
+
+def fetch_kaiten_time_logs(domain, bearer_key, card_id):
+    # Получение списка списаний времени для конкретной карточки.
+    try:
+        return get_kaiten_client(domain, bearer_key).time_logs(card_id)
     except Exception as e:
         if ENABLE_LOGGING:
             logger.error(f"Ошибка при получении списаний времени для карточки {card_id}: {e}", exc_info=True)
-        if HTTP_DEBUG:
-            print(f"[TIMELOG] ✖ req={_req_id} error={e}")
         return []
 
 
+def iter_kaiten_time_logs(domain, bearer_key, card_ids, max_workers=None):
+    """
+    Параллельная загрузка списаний времени для набора карточек.
+    Отдаёт кортежи (card_id, logs, error) по мере готовности: при ошибке logs = [],
+    error — исключение. Общий темп запросов по-прежнему ограничен троттлингом,
+    поэтому время загрузки определяется допустимой частотой запросов, а не числом карточек.
+    """
+    card_ids = list(card_ids)
+    if not card_ids:
+        return
+    client = get_kaiten_client(domain, bearer_key)
+    workers = max(1, min(max_workers or HTTP_CONCURRENCY, len(card_ids)))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="kaiten-timelogs") as pool:
+        # контекст (приоритет и т.п.) копируется в каждую задачу пула
+        futures = {
+            pool.submit(contextvars.copy_context().run, client.time_logs, card_id): card_id
+            for card_id in card_ids
+        }
+        for future in as_completed(futures):
+            card_id = futures[future]
+            try:
+                yield card_id, future.result(), None
+            except Exception as e:
+                if ENABLE_LOGGING:
+                    logger.error(f"Ошибка при получении списаний времени для карточки {card_id}: {e}")
+                yield card_id, [], e
+
+
+def fetch_kaiten_time_logs_bulk(domain, bearer_key, card_ids, max_workers=None, on_logs=None):
+    """
+    Списания времени для набора карточек.
+    Возвращает (logs_by_card, failures): {card_id: [логи]} и {card_id: исключение}.
+    on_logs(card_id, logs) вызывается в вызывающем потоке для каждой загруженной карточки
+    (например, чтобы сохранить прогресс до того, как загрузятся остальные).
+    """
+    logs_by_card, failures = {}, {}
+    for card_id, logs, error in iter_kaiten_time_logs(domain, bearer_key, card_ids, max_workers=max_workers):
+        if error is not None:
+            failures[card_id] = error
+        else:
+            logs_by_card[card_id] = logs
+            if on_logs is not None:
+                on_logs(card_id, logs)
+    return logs_by_card, failures
+
+
+# Домены, где /time-logs не поддержан: domain -> monotonic-время следующей попытки
+_BULK_UNSUPPORTED: Dict[str, float] = {}
+# Статусы, означающие «такого запроса нет» (а не сбой): списковый эндпоинт недоступен этому аккаунту
+_UNSUPPORTED_STATUSES = (400, 403, 404, 405, 501)
+
+
+def _bulk_unsupported(exc: Exception) -> bool:
+    if isinstance(exc, KaitenUnreliableListError):
+        # эндпоинт есть, но не учитывает offset или период — для отчёта это то же, что его отсутствие
+        return True
+    if isinstance(exc, KaitenApiRefusedError):
+        # 403 — у ключа нет доступа к списку списаний; 429 — это не отказ от эндпоинта
+        return "HTTP 403" in str(exc)
+    response = getattr(exc, "response", None)
+    return isinstance(exc, requests.HTTPError) and response is not None and response.status_code in _UNSUPPORTED_STATUSES
+
+
+def _period_bounds(start_date, end_date):
+    """
+    Допустимые даты создания списаний из /time-logs за период: ('YYYY-MM-DD', 'YYYY-MM-DD')
+    с запасом в сутки (сервер считает даты в часовом поясе компании); None — даты не разобрать.
+    """
+    try:
+        lo, hi = (date.fromisoformat(_iso(value)[:10]) for value in (start_date, end_date))
+    except ValueError:
+        return None
+    return (lo - timedelta(days=1)).isoformat(), (hi + timedelta(days=1)).isoformat()
+
+
+def _cross_check_time_logs(client, logs_by_card, start_date, end_date):
+    """
+    Сверка ответа /time-logs за период с /cards/{id}/time-logs по одной карточке — той, чьи
+    списания в ответе начинаются раньше всех (при равенстве — где их больше): если сервер
+    отбирает период по другому полю (например, for_date), теряются списания у начала периода.
+    Все списания карточки с датой создания в [start_date, end_date] должны быть в ответе за
+    период, иначе — KaitenUnreliableListError. Ошибка самой сверки — KaitenApiError: ответу
+    не доверяем, но эндпоинт неподдержанным не считаем.
+    """
+    if not logs_by_card:
+        return
+
+    def first_created(card_id):
+        logs = logs_by_card[card_id]
+        return (min(str(log.created or "") for log in logs), -len(logs)) if logs else ("\uffff", 0)
+
+    card_id = min(logs_by_card, key=first_created)
+    try:
+        logs = client.time_logs(card_id)
+    except (KaitenUnavailableError, KaitenDeadlineExceeded):
+        raise
+    except Exception as e:
+        raise KaitenApiError(f"сверка /time-logs по карточке {card_id} не удалась: {e}") from e
+    start, end = _iso(start_date)[:10], _iso(end_date)[:10]
+    expected = {log.id for log in logs if start <= str(log.created or "")[:10] <= end}
+    missing = expected - {log.id for log in logs_by_card[card_id]}
+    if missing:
+        raise KaitenUnreliableListError(f"/time-logs за период пропустил списания карточки {card_id}: {len(missing)} из {len(expected)}")
+
+
+def fetch_kaiten_time_logs_between(domain, bearer_key, card_ids, start_date, end_date, space_id=None, board_id=None, max_workers=None, on_logs=None, per_card=None):
+    """
+    Списания карточек card_ids с датой создания в [start_date, end_date] (даты 'YYYY-MM-DD').
+    Сначала — постранично через /time-logs за период (число запросов зависит от числа
+    списаний за период, а не от числа карточек); если эндпоинт не поддержан, не дал
+    ответа или карточек мало — как раньше, по карточке (fetch_kaiten_time_logs_bulk).
+    Возвращает (logs_by_card, failures) в формате fetch_kaiten_time_logs_bulk;
+    по карточкам, которые отдаются по одной, приходят все списания — дата фильтруется вызывающим.
+
+    Период запрашивается с запасом в сутки с каждой стороны (_period_bounds): сервер может
+    считать даты в часовом поясе компании; лишнее отсекает вызывающий по дате создания.
+    Ответу /time-logs доверяем, только если он учёл параметры: страница, повторяющая
+    элементы предыдущей (offset проигнорирован), списание вне запрошенного периода или
+    расхождение со списаниями одной карточки (_cross_check_time_logs) означают, что
+    эндпоинт для отчёта не годится, — как и 404, это откат на загрузку по карточкам.
+
+    per_card(card_ids) -> card_ids сужает список только для загрузки по карточкам (например,
+    без неактивных в периоде): там каждая карточка — запрос, а /time-logs за период стоит
+    одинаково при любом их числе. Отсеянных карточек в logs_by_card нет.
+
+    on_logs — как у fetch_kaiten_time_logs_bulk; вызывается только при загрузке по карточкам.
+    Запрос за период упорядочен по датам, а не по карточкам: списания карточки полны лишь
+    после последней страницы, когда результат сразу возвращается целиком, поэтому сохранять
+    промежуточно (контрольная точка отчёта) нечего, а прерванный запрос не даёт ни одной карточки.
+    """
+    card_ids = list(card_ids)
+    retry_at = _BULK_UNSUPPORTED.get(domain)
+    use_bulk = (
+        TIME_LOGS_BULK and len(card_ids) >= TIME_LOGS_BULK_MIN_CARDS
+        and (retry_at is None or time.monotonic() >= retry_at)
+    )
+    if use_bulk:
+        wanted = {str(card_id): card_id for card_id in card_ids}
+        logs_by_card = {card_id: [] for card_id in card_ids}
+        bounds = _period_bounds(start_date, end_date)
+        try:
+            client = get_kaiten_client(domain, bearer_key)
+            window = bounds or (start_date, end_date)
+            for log in client.iter_time_logs_between(*window, space_id=space_id, board_id=board_id, strict=True):
+                created = str(log.created or "")[:10]
+                if bounds and created and not bounds[0] <= created <= bounds[1]:
+                    raise KaitenUnreliableListError(f"/time-logs: списание {log.id} от {created} вне периода {window[0]}..{window[1]}")
+                # сервер мог не учесть фильтр по доске — чужие карточки отбрасываются
+                card_id = wanted.get(str(log.card_id))
+                if card_id is not None:
+                    logs_by_card[card_id].append(log)
+            _cross_check_time_logs(client, logs_by_card, start_date, end_date)
+        except (KaitenUnavailableError, KaitenDeadlineExceeded) as e:
+            # по карточкам было бы то же самое, только дольше
+            return {}, {card_id: e for card_id in card_ids}
+        except Exception as e:
+            if _bulk_unsupported(e):
+                _BULK_UNSUPPORTED[domain] = time.monotonic() + TIME_LOGS_BULK_RETRY
+            if ENABLE_LOGGING:
+                logger.warning(f"/time-logs за период недоступен ({e}), списания загружаются по карточкам")
+        else:
+            _BULK_UNSUPPORTED.pop(domain, None)
+            if ENABLE_LOGGING:
+                logger.info(f"Получено списаний за {start_date}..{end_date}: {sum(map(len, logs_by_card.values()))} по {len(card_ids)} карточкам")
+            return logs_by_card, {}
+    if per_card is not None:
+        card_ids = per_card(card_ids)
+    return fetch_kaiten_time_logs_bulk(domain, bearer_key, card_ids, max_workers=max_workers, on_logs=on_logs)
+
+
 def fetch_kaiten_roles(domain, bearer_key):
     # Получние списка ролей из Kaiten API по заданному домену и Bearer key. (Исключает роль с id = -1)
-    url = f"https://{domain}.kaiten.ru/api/latest/user-roles"
-    headers = {
-        "Authorization": f"Bearer {bearer_key}",
-        "Accept": "application/json",
-        "Content-Type": "application/json",
-    }
-    if ENABLE_LOGGING:
-        logger.debug(f"Запрос ролей: url={url}, headers={_maybe_mask_headers(headers)}")
     try:
-        response, dt = _http_get_full("GET", url, headers=headers, params=None, timeout=HTTP_TIMEOUT)
-        if ENABLE_LOGGING:
-            logger.debug(f"HTTP GET {url} -> {response.status_code} за {dt:.2f}s")
-        refused, reason = _is_api_refusal(response)
-        if refused:
-            raise KaitenApiRefusedError(f"API refusal on user-roles: {reason}")
-        response.raise_for_status()
-        roles_raw = response.json()
-        if ENABLE_LOGGING:
-            logger.debug(f"Ответ API по ролям (hash={_hash_payload(roles_raw)}, "
-                         f"type={'list' if isinstance(roles_raw, list) else type(roles_raw).__name__}, "
-                         f"len={len(roles_raw) if isinstance(roles_raw, list) else 'n/a'})")
-        roles = [
-            {"id": str(role.get("id")), "name": role.get("name")}
-            for role in roles_raw
-            if str(role.get("id")) != "-1"
-        ]
-        if ENABLE_LOGGING:
-            logger.info(f"Получено ролей (без id=-1): {len(roles)}")
-        return roles
+        return _cached(domain, bearer_key, "user-roles", (), "roles")
     except Exception as e:
         if ENABLE_LOGGING:
             logger.error(f"Ошибка при получении ролей: {e}", exc_info=True)
@@ -383,31 +1447,8 @@ def fetch_kaiten_roles(domain, bearer_key):
 
 def fetch_kaiten_projects(domain, bearer_key):
     # Получение списка проектов из Kaiten API
-    url = f"https://{domain}.kaiten.ru/api/latest/spaces"
-    headers = {
-        "Authorization": f"Bearer {bearer_key}",
-        "Accept": "application/json",
-        "Content-Type": "application/json",
-    }
-    if ENABLE_LOGGING:
-        logger.debug(f"Запрос проектов: url={url}, headers={_maybe_mask_headers(headers)}")
     try:
-        response, dt = _http_get_full("GET", url, headers=headers, params=None, timeout=HTTP_TIMEOUT)
-        if ENABLE_LOGGING:
-            logger.debug(f"HTTP GET {url} -> {response.status_code} за {dt:.2f}s")
-        refused, reason = _is_api_refusal(response)
-        if refused:
-            raise KaitenApiRefusedError(f"API refusal on spaces: {reason}")
-        response.raise_for_status()
-        data = response.json()
-        if ENABLE_LOGGING:
-            logger.debug(f"Ответ проектов (hash={_hash_payload(data)}, "
-                         f"type={'list' if isinstance(data, list) else type(data).__name__}, "
-                         f"len={len(data) if isinstance(data, list) else 'n/a'})")
-        projects = [{"id": project.get("id"), "title": project.get("title")} for project in data]
-        if ENABLE_LOGGING:
-            logger.info(f"Получено проектов: {len(projects)}")
-        return projects
+        return _cached(domain, bearer_key, "spaces", (), "spaces")
     except Exception as e:
         if ENABLE_LOGGING:
             logger.error(f"Ошибка при получении проектов: {e}", exc_info=True)
@@ -415,39 +1456,8 @@ def fetch_kaiten_projects(domain, bearer_key):
 
 
 def fetch_kaiten_users(domain, bearer_key, timeout=10):
-    url = f"https://{domain}.kaiten.ru/api/latest/users"
-    headers = {
-        "Authorization": f"Bearer {bearer_key}",
-        "Accept": "application/json",
-        "Content-Type": "application/json",
-    }
-    if ENABLE_LOGGING:
-        logger.debug(f"Запрос пользователей: url={url}, timeout={timeout}, headers={_maybe_mask_headers(headers)}")
     try:
-        response, dt = _http_get_full("GET", url, headers=headers, params=None, timeout=timeout)
-        if ENABLE_LOGGING:
-            logger.debug(f"HTTP GET {url} -> {response.status_code} за {dt:.2f}s")
-        refused, reason = _is_api_refusal(response)
-        if refused:
-            raise KaitenApiRefusedError(f"API refusal on users: {reason}")
-        response.raise_for_status()
-        data = response.json()
-        if ENABLE_LOGGING:
-            logger.debug(f"Ответ пользователей (hash={_hash_payload(data)}, "
-                         f"type={'list' if isinstance(data, list) else type(data).__name__})")
-        if isinstance(data, dict):
-            users = data.get("users", [])
-            if ENABLE_LOGGING:
-                logger.info(f"Получено пользователей (dict.users): {len(users)}")
-            return users
-        elif isinstance(data, list):
-            if ENABLE_LOGGING:
-                logger.info(f"Получено пользователей (list): {len(data)}")
-            return data
-        else:
-            if ENABLE_LOGGING:
-                logger.warning("Неожиданный тип ответа пользователей, возвращаю []")
-            return []
+        return _cached(domain, bearer_key, "users", (timeout,), "users")
     except Exception as e:
         if ENABLE_LOGGING:
             logger.error(f"Ошибка при получении пользователей: {e}", exc_info=True)
@@ -459,28 +1469,8 @@ def fetch_kaiten_board_roles(domain, bearer_key, space_id, board_id):
     Получение списка ролей (roles) конкретной доски в проекте (space).
     Каждый элемент — словарь с 'id' и 'name'.
     """
-    url = f"https://{domain}.kaiten.ru/api/latest/spaces/{space_id}/boards/{board_id}/roles"
-    headers = {
-        "Authorization": f"Bearer {bearer_key}",
-        "Accept": "application/json",
-        "Content-Type": "application/json",
-    }
-    if ENABLE_LOGGING:
-        logger.debug(f"Запрос ролей доски: url={url}, headers={_maybe_mask_headers(headers)}")
     try:
-        resp, dt = _http_get_full("GET", url, headers=headers, params=None, timeout=10)
-        if ENABLE_LOGGING:
-            logger.debug(f"HTTP GET {url} -> {resp.status_code} за {dt:.2f}s")
-        refused, reason = _is_api_refusal(resp)
-        if refused:
-            raise KaitenApiRefusedError(f"API refusal on board roles: {reason}")
-        resp.raise_for_status()
-        roles = resp.json()
-        if ENABLE_LOGGING:
-            logger.debug(f"Ответ ролей доски (hash={_hash_payload(roles)}, "
-                         f"type={'list' if isinstance(roles, list) else type(roles).__name__}, "
-                         f"len={len(roles) if isinstance(roles, list) else 'n/a'})")
-        return roles  # список {"id": ..., "name": ...}
+        return _cached(domain, bearer_key, "board-roles", (space_id, board_id), "board_roles")
     except Exception as e:
         if ENABLE_LOGGING:
             logger.error(f"Ошибка при получении ролей доски {board_id}: {e}", exc_info=True)
@@ -491,32 +1481,8 @@ def fetch_kaiten_custom_property_values(domain, bearer_key, space_id, property_i
     """
     Получение списка значений select-поля custom_property по его ID в контексте space_id.
     """
-    url = f"https://{domain}.kaiten.ru/api/latest/company/custom-properties/{property_id}/select-values"
-    headers = {
-        "Authorization": f"Bearer {bearer_key}",
-        "Accept": "application/json",
-        "Content-Type": "application/json",
-    }
-    if ENABLE_LOGGING:
-        logger.debug(f"Запрос custom property values: url={url}, headers={_maybe_mask_headers(headers)}")
     try:
-        resp, dt = _http_get_full("GET", url, headers=headers, params=None, timeout=10)
-        if ENABLE_LOGGING:
-            logger.debug(f"HTTP GET {url} -> {resp.status_code} за {dt:.2f}s")
-        refused, reason = _is_api_refusal(resp)
-        if refused:
-            raise KaitenApiRefusedError(f"API refusal on custom-property values: {reason}")
-        resp.raise_for_status()
-        raw = resp.json()
-        if ENABLE_LOGGING:
-            logger.debug(f"Ответ custom property values (hash={_hash_payload(raw)}, "
-                         f"type={'list' if isinstance(raw, list) else type(raw).__name__}, "
-                         f"len={len(raw) if isinstance(raw, list) else 'n/a'})")
-        return [
-            {"id": str(item["id"]), "name": item.get("value", "")}
-            for item in raw
-            if not item.get("deleted", False)
-        ]
+        return _cached(domain, bearer_key, "custom-property-values", (property_id,), "custom_property_values")
     except Exception as e:
         if ENABLE_LOGGING:
             logger.error(f"Ошибка fetch_custom_property_values: {e}", exc_info=True)
@@ -527,35 +1493,8 @@ def fetch_kaiten_board_statuses(domain, bearer_key, space_id, board_id):
     """
     Получение списка статусов (колонок) доски.
     """
-    url = f"https://{domain}.kaiten.ru/api/latest/boards/{board_id}/columns"
-    headers = {
-        "Authorization": f"Bearer {bearer_key}",
-        "Accept": "application/json",
-    }
-    if ENABLE_LOGGING:
-        logger.debug(f"Запрос статусов доски: url={url}, headers={_maybe_mask_headers(headers)}")
     try:
-        resp, dt = _http_get_full("GET", url, headers=headers, params=None, timeout=10)
-        if ENABLE_LOGGING:
-            logger.debug(f"HTTP GET {url} -> {resp.status_code} за {dt:.2f}s")
-        refused, reason = _is_api_refusal(resp)
-        if refused:
-            raise KaitenApiRefusedError(f"API refusal on board statuses: {reason}")
-        resp.raise_for_status()
-        data = resp.json()
-        if ENABLE_LOGGING:
-            logger.debug(f"Ответ статусов (hash={_hash_payload(data)}, "
-                         f"type={'list' if isinstance(data, list) else type(data).__name__}, "
-                         f"len={len(data) if isinstance(data, list) else 'n/a'})")
-
-        # Преобразуем: id и название — в Kaiten в колонках поле называется "name"
-        return [
-            {
-                "id":   str(col["id"]),
-                "title": col.get("name") or col.get("title","")
-            }
-            for col in data
-        ]
+        return _cached(domain, bearer_key, "columns", (board_id,), "board_statuses")
     except Exception as e:
         if ENABLE_LOGGING:
             logger.error(f"Ошибка при получении статусов доски {board_id}: {e}", exc_info=True)
@@ -566,35 +1505,19 @@ def fetch_kaiten_swimlanes(domain, bearer_key, board_id):
     """
     Получение списка swimlane’ов (дорожек) доски по endpoint /boards/{board_id}/lanes.
     """
-    url = f"https://{domain}.kaiten.ru/api/latest/boards/{board_id}/lanes"
-    headers = {
-        "Authorization": f"Bearer {bearer_key}",
-        "Accept": "application/json",
-    }
-    if ENABLE_LOGGING:
-        logger.debug(f"Запрос дорожек: url={url}, headers={_maybe_mask_headers(headers)}")
     try:
-        resp, dt = _http_get_full("GET", url, headers=headers, params=None, timeout=10)
-        if ENABLE_LOGGING:
-            logger.debug(f"HTTP GET {url} -> {resp.status_code} за {dt:.2f}s")
-        refused, reason = _is_api_refusal(resp)
-        if refused:
-            raise KaitenApiRefusedError(f"API refusal on swimlanes: {reason}")
-        resp.raise_for_status()
-        data = resp.json()
+        return _cached(domain, bearer_key, "lanes", (board_id,), "swimlanes")
+    except Exception as e:
         if ENABLE_LOGGING:
-            logger.debug(f"Ответ дорожек (hash={_hash_payload(data)}, "
-                         f"type={'list' if isinstance(data, list) else type(data).__name__}, "
-                         f"len={len(data) if isinstance(data, list) else 'n/a'})")
+            logger.error(f"Ошибка при получении дорожек для доски {board_id}: {e}", exc_info=True)
+        return []
 
-        lanes = []
-        for lane in data:
-            lanes.append({
-                "id": str(lane["id"]),
-                "title": lane.get("title") or lane.get("name", ""),
-            })
-        return lanes
+
+def fetch_all_kaiten_cards(domain, bearer_key, space_id):
+    # Все карточки пространства (без фильтра по кастомному полю)
+    try:
+        return get_kaiten_client(domain, bearer_key).all_cards(space_id)
     except Exception as e:
         if ENABLE_LOGGING:
-            logger.error(f"Ошибка при получении дорожек для доски {board_id}: {e}", exc_info=True)
+            logger.error(f"Ошибка при получении карточек пространства {space_id}: {e}", exc_info=True)
         return []
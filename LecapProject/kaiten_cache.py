@@ -0,0 +1,227 @@
+"""
+Двухуровневый кэш для метаданных Kaiten.
+
+L1 — LRU в памяти процесса с TTL, L2 — Django cache (CACHES['default']), общий
+для всех воркеров gunicorn. Запись живёт в двух режимах:
+  - свежая (fresh_ttl): отдаётся как есть;
+  - устаревшая (до stale_ttl): отдаётся сразу, а в фоне запускается обновление
+    (stale-while-revalidate), так что страница не ждёт Kaiten.
+Инвалидация — через счётчики поколений в L2: увеличение поколения делает
+недоступными все ключи пространства имён во всех процессах.
+
+Отдельно (при lkg_ttl > 0) хранится последнее успешно полученное значение
+(last-known-good) — оно переживает и stale_ttl, и инвалидацию и нужно только
+как запасной вариант на время недоступности источника (см. last_good()).
+"""
+import contextvars
+import copy
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from . import metrics
+
+logger = logging.getLogger("kaiten")
+
+# Как часто L1 перечитывает поколения из L2, сек
+GENERATION_CHECK_INTERVAL = 1.0
+
+
+class StaleList(list):
+    """Список из last-known-good: данные настоящие, но источник сейчас недоступен."""
+    stale = True
+
+
+class StaleDict(dict):
+    stale = True
+
+
+def mark_stale(value):
+    if isinstance(value, list):
+        return StaleList(value)
+    if isinstance(value, dict):
+        return StaleDict(value)
+    return value
+
+
+def is_stale(value) -> bool:
+    """True, если значение отдано из last-known-good, а не получено от источника."""
+    return getattr(value, "stale", False) is True
+
+
+def _shared_cache():
+    """Django cache, если Django настроен; иначе None (работает только L1)."""
+    try:
+        from django.conf import settings
+        if not settings.configured:
+            return None
+        from django.core.cache import cache
+        return cache
+    except Exception:
+        return None
+
+
+class TwoTierCache:
+    def __init__(self, prefix: str, l1_size: int, fresh_ttl: float, stale_ttl: float, lkg_ttl: float = 0):
+        self.prefix = prefix
+        self.l1_size = l1_size
+        self.fresh_ttl = fresh_ttl
+        self.stale_ttl = max(stale_ttl, fresh_ttl)
+        self.lkg_ttl = lkg_ttl
+        self._lock = threading.Lock()
+        self._l1: "OrderedDict[str, tuple]" = OrderedDict()
+        self._generations = {}          # namespace -> (generation, checked_at)
+        self._refreshing = set()
+        self._refresh_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="kaiten-cache-refresh")
+        self.stats = {"l1_hit": 0, "l2_hit": 0, "stale": 0, "miss": 0}
+
+    # --- поколения ----------------------------------------------------------
+
+    def _gen_key(self, namespace: str) -> str:
+        return f"{self.prefix}:gen:{namespace}"
+
+    def _generation(self, namespace: str) -> str:
+        now = time.monotonic()
+        cached = self._generations.get(namespace)
+        if cached and now - cached[1] < GENERATION_CHECK_INTERVAL:
+            return cached[0]
+        generation = "0"
+        shared = _shared_cache()
+        if shared is not None:
+            try:
+                generation = str(shared.get(self._gen_key(namespace)) or "0")
+            except Exception as e:
+                logger.warning(f"Кэш Kaiten: не удалось прочитать поколение {namespace}: {e}")
+        self._generations[namespace] = (generation, now)
+        return generation
+
+    def invalidate(self, namespace: str = "*"):
+        """Сбрасывает пространство имён (или все, namespace='*') во всех процессах."""
+        shared = _shared_cache()
+        if shared is not None:
+            try:
+                shared.set(self._gen_key(namespace), str(time.time_ns()), timeout=None)
+            except Exception as e:
+                logger.warning(f"Кэш Kaiten: не удалось сбросить {namespace}: {e}")
+        with self._lock:
+            self._generations.clear()
+            if namespace == "*":
+                self._l1.clear()
+            else:
+                for key in [k for k in self._l1 if k.startswith(f"{self.prefix}:{namespace}:")]:
+                    del self._l1[key]
+
+    @staticmethod
+    def _digest(key_parts) -> str:
+        return hashlib.sha256(repr(key_parts).encode("utf-8")).hexdigest()[:32]
+
+    def key(self, namespace: str, key_parts) -> str:
+        return f"{self.prefix}:{namespace}:{self._generation('*')}.{self._generation(namespace)}:{self._digest(key_parts)}"
+
+    def _lkg_key(self, namespace: str, key_parts) -> str:
+        # без поколений: запасная копия не сбрасывается инвалидацией
+        return f"{self.prefix}:lkg:{namespace}:{self._digest(key_parts)}"
+
+    # --- хранение -----------------------------------------------------------
+
+    def _l1_get(self, key):
+        with self._lock:
+            entry = self._l1.get(key)
+            if entry is not None:
+                self._l1.move_to_end(key)
+            return entry
+
+    def _l1_put(self, key, entry):
+        with self._lock:
+            self._l1[key] = entry
+            self._l1.move_to_end(key)
+            while len(self._l1) > self.l1_size:
+                self._l1.popitem(last=False)
+
+    def _store(self, key, value, fresh_ttl, lkg_key=None):
+        now = time.time()
+        value = copy.deepcopy(value)
+        entries = [(key, (value, now + fresh_ttl, now + self.stale_ttl), self.stale_ttl)]
+        if lkg_key is not None and self.lkg_ttl > 0:
+            # (значение, когда получено, когда истекает)
+            entries.append((lkg_key, (value, now, now + self.lkg_ttl), self.lkg_ttl))
+        shared = _shared_cache()
+        for entry_key, entry, ttl in entries:
+            self._l1_put(entry_key, entry)
+            if shared is not None:
+                try:
+                    shared.set(entry_key, entry, timeout=int(ttl) + 1)
+                except Exception as e:
+                    logger.warning(f"Кэш Kaiten: не удалось записать {entry_key}: {e}")
+
+    def _lookup(self, key):
+        entry = self._l1_get(key)
+        if entry is not None and time.time() < entry[2]:
+            return entry, "l1_hit"
+        shared = _shared_cache()
+        if shared is not None:
+            try:
+                entry = shared.get(key)
+            except Exception as e:
+                logger.warning(f"Кэш Kaiten: не удалось прочитать {key}: {e}")
+                entry = None
+            if entry is not None and time.time() < entry[2]:
+                self._l1_put(key, entry)
+                return entry, "l2_hit"
+        return None, "miss"
+
+    # --- основное API -------------------------------------------------------
+
+    def get_or_fetch(self, namespace: str, key_parts, fetch, fresh_ttl: float = None, refresh=None):
+        """
+        Значение из кэша или fetch(). Свежее — сразу; устаревшее — сразу, с фоновым
+        обновлением через refresh() (по умолчанию fetch); отсутствующее — синхронно
+        через fetch(). Исключения не кэшируются.
+        """
+        fresh_ttl = self.fresh_ttl if fresh_ttl is None else fresh_ttl
+        key = self.key(namespace, key_parts)
+        lkg_key = self._lkg_key(namespace, key_parts)
+        entry, tier = self._lookup(key)
+        if entry is not None:
+            if time.time() >= entry[1]:
+                self._count("stale", namespace)
+                self._refresh_in_background(key, refresh or fetch, fresh_ttl, lkg_key)
+            else:
+                self._count(tier, namespace)
+            return copy.deepcopy(entry[0])
+
+        self._count("miss", namespace)
+        value = fetch()
+        self._store(key, value, fresh_ttl, lkg_key)
+        return value
+
+    def _count(self, result: str, namespace: str):
+        self.stats[result] += 1
+        metrics.inc("kaiten_cache_requests_total", namespace=namespace, result=result)
+
+    def last_good(self, namespace: str, key_parts):
+        """(значение, возраст в секундах) последнего успешного получения или None."""
+        entry, _ = self._lookup(self._lkg_key(namespace, key_parts))
+        if entry is None:
+            return None
+        return copy.deepcopy(entry[0]), time.time() - entry[1]
+
+    def _refresh_in_background(self, key, fetch, fresh_ttl, lkg_key=None):
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+
+        def refresh():
+            try:
+                self._store(key, fetch(), fresh_ttl, lkg_key)
+            except Exception as e:
+                logger.warning(f"Кэш Kaiten: фоновое обновление {key} не удалось: {e}")
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        # пустой контекст: у фонового обновления нет бюджета и приоритета исходного запроса
+        self._refresh_pool.submit(contextvars.Context().run, refresh)
@@ -0,0 +1,187 @@
+"""
+Запись и воспроизведение HTTP-обмена с Kaiten (кассеты).
+
+Кассета — каталог из двух файлов:
+  index.jsonl — по строке на ответ: ключ запроса, статус, значимые заголовки,
+                смещение и длина тела в bodies.bin, время ответа при записи;
+  bodies.bin  — тела ответов подряд, каждое сжато zlib.
+
+Ключ запроса — метод, путь, отсортированные параметры и хэш тела; домен и
+заголовок Authorization в ключ и в файлы не попадают, поэтому кассету,
+записанную на одном токене, можно проигрывать без него.
+
+Режимы (KAITEN_CASSETTE_MODE):
+  record — запросы уходят в Kaiten, ответы дописываются в кассету;
+  replay — ответы берутся из кассеты, сеть не используется. Повторные
+           одинаковые запросы получают записанные ответы по порядку (последний
+           повторяется). Опционально имитируются задержка (KAITEN_CASSETTE_LATENCY:
+           'recorded' или секунды) и доля ответов 429 (KAITEN_CASSETTE_429_RATE)
+           с детерминированным генератором (KAITEN_CASSETTE_SEED).
+
+Пример офлайн-замера отчёта:
+  KAITEN_CASSETTE_MODE=record KAITEN_CASSETTE_DIR=/tmp/kaiten-report python manage.py runserver
+  ... сформировать отчёт ...
+  KAITEN_CASSETTE_MODE=replay KAITEN_CASSETTE_DIR=/tmp/kaiten-report KAITEN_CASSETTE_LATENCY=recorded python manage.py runserver
+"""
+import hashlib
+import io
+import json
+import os
+import random
+import threading
+import time
+import zlib
+from urllib.parse import urlsplit, parse_qsl
+
+import requests
+from urllib3.response import HTTPResponse
+
+try:
+    import fcntl
+except ImportError:  # Windows: запись из нескольких процессов не синхронизируется
+    fcntl = None
+
+INDEX_FILE = "index.jsonl"
+BODIES_FILE = "bodies.bin"
+
+# Заголовки ответа, от которых зависит поведение клиента (пейсинг, условные GET)
+_KEPT_HEADERS = (
+    "content-type", "etag", "last-modified", "retry-after",
+    "x-ratelimit-limit", "x-ratelimit-remaining", "x-ratelimit-reset",
+)
+# Заголовки условного запроса в ключ не входят: при воспроизведении 304 строится по ETag
+_CONDITIONAL_HEADERS = ("If-None-Match", "If-Modified-Since")
+
+
+class CassetteMissError(RuntimeError):
+    """В кассете нет ответа на такой запрос."""
+    pass
+
+
+def request_key(method: str, url: str, params=None, json_body=None) -> str:
+    parts = urlsplit(url)
+    query = sorted(parse_qsl(parts.query, keep_blank_values=True))
+    query += sorted((str(k), str(v)) for k, v in (params or {}).items() if v is not None)
+    body = hashlib.sha256(json.dumps(json_body, sort_keys=True).encode()).hexdigest()[:16] if json_body is not None else ""
+    return f"{method.upper()} {parts.path}?{'&'.join(f'{k}={v}' for k, v in query)}#{body}"
+
+
+def _build_response(url: str, status: int, headers: dict, body: bytes) -> requests.Response:
+    resp = requests.Response()
+    resp.url = url
+    resp.status_code = status
+    resp.headers = requests.structures.CaseInsensitiveDict(headers)
+    resp.encoding = "utf-8"
+    # raw поверх BytesIO: работают и resp.json(), и потоковый iter_content
+    resp.raw = HTTPResponse(body=io.BytesIO(body), preload_content=False, status=status, headers=headers)
+    return resp
+
+
+class Cassette:
+    def __init__(self, path: str, mode: str, latency: str = "", error_rate: float = 0.0,
+                 retry_after: float = 1.0, seed: int = 0):
+        if mode not in ("record", "replay"):
+            raise ValueError(f"Неизвестный режим кассеты: {mode!r}")
+        self.path = path
+        self.mode = mode
+        self.latency = latency
+        self.error_rate = error_rate
+        self.retry_after = retry_after
+        self._lock = threading.Lock()
+        self._random = random.Random(seed)
+        self._entries = {}     # key -> [запись индекса, ...] в порядке записи
+        self._cursor = {}      # key -> сколько раз уже воспроизведён
+        if mode == "record":
+            os.makedirs(path, exist_ok=True)
+        else:
+            self._load()
+
+    def __repr__(self):
+        return f"<Cassette {self.mode} {self.path}>"
+
+    # --- файлы ----------------------------------------------------------------
+
+    def _load(self):
+        index_path = os.path.join(self.path, INDEX_FILE)
+        if not os.path.exists(index_path):
+            raise FileNotFoundError(f"Кассета не найдена: {index_path}")
+        with open(index_path, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    self._entries.setdefault(entry["k"], []).append(entry)
+
+    def _read_body(self, entry) -> bytes:
+        with open(os.path.join(self.path, BODIES_FILE), "rb") as f:
+            f.seek(entry["o"])
+            return zlib.decompress(f.read(entry["n"]))
+
+    # --- запись ---------------------------------------------------------------
+
+    def record(self, method: str, url: str, params, json_body, resp: requests.Response, elapsed: float):
+        body = zlib.compress(resp.content)   # content читается целиком; iter_content потом отдаст его же
+        headers = {k: v for k, v in resp.headers.items() if k.lower() in _KEPT_HEADERS}
+        # flock на bodies.bin: записывать могут несколько воркеров сразу
+        with self._lock, open(os.path.join(self.path, BODIES_FILE), "ab") as bodies:
+            if fcntl is not None:
+                fcntl.flock(bodies.fileno(), fcntl.LOCK_EX)
+            try:
+                offset = bodies.seek(0, os.SEEK_END)
+                bodies.write(body)
+                bodies.flush()
+                entry = {
+                    "k": request_key(method, url, params, json_body),
+                    "s": resp.status_code, "h": headers,
+                    "o": offset, "n": len(body), "t": round(elapsed, 4),
+                }
+                with open(os.path.join(self.path, INDEX_FILE), "a", encoding="utf-8") as f:
+                    f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(bodies.fileno(), fcntl.LOCK_UN)
+
+    # --- воспроизведение ------------------------------------------------------
+
+    def replay(self, method: str, url: str, params=None, json_body=None, headers=None) -> requests.Response:
+        key = request_key(method, url, params, json_body)
+        with self._lock:
+            entries = self._entries.get(key)
+            if not entries:
+                raise CassetteMissError(f"Нет записи для {key} в {self.path}")
+            n = self._cursor.get(key, 0)
+            self._cursor[key] = n + 1
+            entry = entries[min(n, len(entries) - 1)]
+            throttled = self.error_rate > 0 and self._random.random() < self.error_rate
+
+        if self.latency == "recorded":
+            time.sleep(entry["t"])
+        elif self.latency:
+            time.sleep(float(self.latency))
+
+        if throttled:
+            return _build_response(url, 429, {"Retry-After": str(self.retry_after)}, b'{"message":"Too Many Requests"}')
+        etag = requests.structures.CaseInsensitiveDict(entry["h"]).get("ETag")
+        if entry["s"] == 200 and etag and (headers or {}).get("If-None-Match") == etag:
+            return _build_response(url, 304, entry["h"], b"")
+        return _build_response(url, entry["s"], entry["h"], self._read_body(entry))
+
+
+def strip_conditional(headers: dict) -> dict:
+    """Заголовки без If-None-Match/If-Modified-Since: при записи нужны полные тела ответов."""
+    if not any(h in headers for h in _CONDITIONAL_HEADERS):
+        return headers
+    return {k: v for k, v in headers.items() if k not in _CONDITIONAL_HEADERS}
+
+
+def cassette_from_env():
+    mode = os.getenv("KAITEN_CASSETTE_MODE", "").strip().lower()
+    if mode in ("", "off", "0", "false"):
+        return None
+    return Cassette(
+        os.getenv("KAITEN_CASSETTE_DIR", "kaiten_cassette"),
+        mode,
+        latency=os.getenv("KAITEN_CASSETTE_LATENCY", ""),
+        error_rate=float(os.getenv("KAITEN_CASSETTE_429_RATE", "0")),
+        retry_after=float(os.getenv("KAITEN_CASSETTE_RETRY_AFTER", "1")),
+        seed=int(os.getenv("KAITEN_CASSETTE_SEED", "0")),
+    )
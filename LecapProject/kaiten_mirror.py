@@ -0,0 +1,251 @@
+"""
+Локальное зеркало метаданных Kaiten: пространства, доски, роли, роли досок, колонки,
+дорожки и значения select-полей (модели KaitenSpace ... KaitenPropertyValue).
+
+Страницы читают метаданные из БД (read / preload) и Kaiten не ждут. Область
+('boards:<space_id>', 'columns:<board_id>', ...) заполняется:
+  - командой manage.py sync_kaiten — всё дерево, параллельно, в БД пишутся только изменения;
+  - по требованию — при первом чтении области, которой в зеркале ещё нет, при refresh=True
+    (параметр ?refresh=1 на страницах) или если область старше MIRROR_MAX_AGE;
+  - вебхуками Kaiten: событие забывает затронутые области (forget), следующее чтение
+    перезагружает их.
+Загрузка по требованию идёт через кэш kaiten_api (_cached): если Kaiten недоступен,
+отдаются данные зеркала, а для пустой области — last-known-good или [] с пометкой is_stale.
+"""
+import contextvars
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.db import transaction
+from django.utils import timezone
+
+from .kaiten_api import _cached, HTTP_CONCURRENCY, invalidate_kaiten_cache
+from .kaiten_cache import is_stale, mark_stale
+from .models import (
+    KaitenBoard, KaitenBoardRole, KaitenColumn, KaitenLane, KaitenPropertyValue, KaitenRole, KaitenSpace,
+    KaitenSyncState,
+)
+
+logger = logging.getLogger('kaiten')
+
+MIRROR_ENABLED = os.getenv("KAITEN_MIRROR", "1") in ("1", "true", "True", "yes")
+MIRROR_MAX_AGE = float(os.getenv("KAITEN_MIRROR_MAX_AGE", "0"))   # сек; 0 — обновляют только sync_kaiten, вебхуки и refresh
+
+# Вид (как в кэше kaiten_api) -> (модель, поля области, метод KaitenClient)
+MIRRORS = {
+    "spaces": (KaitenSpace, (), "spaces"),
+    "boards": (KaitenBoard, ("space_id",), "boards"),
+    "user-roles": (KaitenRole, (), "roles"),
+    "board-roles": (KaitenBoardRole, ("space_id", "board_id"), "board_roles"),
+    "columns": (KaitenColumn, ("board_id",), "board_statuses"),
+    "lanes": (KaitenLane, ("board_id",), "swimlanes"),
+    "custom-property-values": (KaitenPropertyValue, ("property_id",), "custom_property_values"),
+}
+
+
+def scope_key(kind: str, args=()) -> str:
+    return ":".join((kind,) + tuple(str(a) for a in args))
+
+
+def _scope_filter(kind, args) -> dict:
+    return dict(zip(MIRRORS[kind][1], (str(a) for a in args)))
+
+
+def store(domain, kind, args, items):
+    """
+    Записывает область зеркала: новые элементы создаются, изменившиеся обновляются,
+    пропавшие удаляются; отметка синхронизации обновляется всегда. (создано, изменено, удалено).
+    """
+    model = MIRRORS[kind][0]
+    scope = _scope_filter(kind, args)
+    with transaction.atomic():
+        existing = {obj.kaiten_id: obj for obj in model.objects.filter(domain=domain, **scope)}
+        created, updated, seen = [], [], set()
+        for position, item in enumerate(items):
+            kaiten_id = str(item.get("id"))
+            if kaiten_id in seen:
+                continue
+            seen.add(kaiten_id)
+            title = str(item.get("title") or item.get("name") or "")[:255]
+            obj = existing.get(kaiten_id)
+            if obj is None:
+                created.append(model(domain=domain, kaiten_id=kaiten_id, title=title, position=position, data=item, **scope))
+            elif (obj.data, obj.position) != (item, position):
+                obj.data, obj.title, obj.position = item, title, position
+                updated.append(obj)
+        removed = [obj.pk for kaiten_id, obj in existing.items() if kaiten_id not in seen]
+        if created:
+            model.objects.bulk_create(created)
+        if updated:
+            model.objects.bulk_update(updated, ['data', 'title', 'position'])
+        if removed:
+            model.objects.filter(pk__in=removed).delete()
+        KaitenSyncState.objects.update_or_create(
+            domain=domain, scope=scope_key(kind, args), defaults={"synced_at": timezone.now(), "items": len(seen)},
+        )
+    return len(created), len(updated), len(removed)
+
+
+def forget(domain, kind, *args):
+    """Помечает область (или, без args, все области вида) как требующую загрузки при следующем чтении."""
+    states = KaitenSyncState.objects.filter(domain=domain)
+    if args:
+        states = states.filter(scope=scope_key(kind, args))
+    else:
+        states = states.filter(scope__startswith=f"{kind}:") | states.filter(scope=kind)
+    states.delete()
+
+
+def prune(domain, kind, keep_args):
+    """Удаляет из зеркала области вида, которых больше нет в Kaiten (доски удалённого пространства и т.п.)."""
+    model, fields, _ = MIRRORS[kind]
+    keep = {tuple(str(a) for a in args) for args in keep_args}
+    stale = {
+        values for values in model.objects.filter(domain=domain).values_list(*fields).distinct()
+        if values not in keep
+    }
+    for values in stale:
+        model.objects.filter(domain=domain, **dict(zip(fields, values))).delete()
+    KaitenSyncState.objects.filter(
+        domain=domain, scope__in=[scope_key(kind, values) for values in stale],
+    ).delete()
+    return len(stale)
+
+
+def _fetch(domain, bearer_key, kind, args):
+    """Загрузка области через кэш kaiten_api; None — Kaiten не ответил и сохранённых данных нет."""
+    try:
+        return _cached(domain, bearer_key, kind, tuple(args), MIRRORS[kind][2])
+    except Exception as e:
+        logger.error(f"Зеркало Kaiten: не удалось загрузить {scope_key(kind, args)}: {e}")
+        return None
+
+
+class MirrorView:
+    """
+    Несколько областей одного вида, прочитанные из зеркала двумя запросами (preload).
+    get(*args) отдаёт область из зеркала, а отсутствующую — загружает из Kaiten по требованию.
+    """
+
+    def __init__(self, domain, bearer_key, kind, args_list, refresh=False):
+        self.domain, self.bearer_key, self.kind, self.refresh = domain, bearer_key, kind, refresh
+        self.synced, self.items, self.loaded = {}, {}, set()
+        self._read_db([tuple(str(a) for a in args) for args in args_list])
+
+    def _read_db(self, args_list):
+        for args in args_list:
+            self.items.setdefault(args, [])
+        if not MIRROR_ENABLED or not args_list:
+            return
+        model, fields, _ = MIRRORS[self.kind]
+        synced = dict(
+            KaitenSyncState.objects
+            .filter(domain=self.domain, scope__in=[scope_key(self.kind, args) for args in args_list])
+            .values_list('scope', 'synced_at')
+        )
+        self.synced.update(synced)
+        wanted = {args for args in args_list if scope_key(self.kind, args) in synced}
+        if not wanted:
+            return
+        # по каждому полю области — IN по его значениям; лишние сочетания отсеиваются ниже
+        rows = model.objects.filter(domain=self.domain, **{
+            f"{field}__in": {args[i] for args in wanted} for i, field in enumerate(fields)
+        })
+        for row in rows.values_list(*fields, 'data'):
+            args = tuple(row[:-1])
+            if args in wanted:
+                self.items[args].append(row[-1])
+
+    def _due(self, args) -> bool:
+        if args in self.loaded:
+            return False
+        synced_at = self.synced.get(scope_key(self.kind, args))
+        if self.refresh or synced_at is None:
+            return True
+        return bool(MIRROR_MAX_AGE) and synced_at < timezone.now() - timedelta(seconds=MIRROR_MAX_AGE)
+
+    def peek(self, *args):
+        """Область из зеркала без обращения к Kaiten ([] если её нет)."""
+        return self.items.get(tuple(str(a) for a in args), [])
+
+    def missing(self):
+        return [args for args in self.items if self._due(args)]
+
+    def get(self, *args):
+        args = tuple(str(a) for a in args)
+        if args not in self.items:
+            self._read_db([args])
+        if self._due(args):
+            self._load(args, _fetch(self.domain, self.bearer_key, self.kind, args))
+        return self.items[args]
+
+    def fetch_missing(self, max_workers=None):
+        """Параллельно загружает из Kaiten все отсутствующие области (в БД пишет вызывающий поток)."""
+        missing = self.missing()
+        if not missing:
+            return
+        workers = max(1, min(max_workers or HTTP_CONCURRENCY, len(missing)))
+        contexts = [contextvars.copy_context() for _ in missing]
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="kaiten-mirror") as pool:
+            results = list(pool.map(
+                lambda args, ctx: ctx.run(_fetch, self.domain, self.bearer_key, self.kind, args), missing, contexts,
+            ))
+        for args, items in zip(missing, results):
+            self._load(args, items)
+
+    def _load(self, args, items):
+        self.loaded.add(args)
+        if items is not None and not is_stale(items):
+            if MIRROR_ENABLED:
+                store(self.domain, self.kind, args, items)
+            self.items[args] = list(items)
+        elif not self.items.get(args):
+            # в зеркале пусто, а Kaiten недоступен: last-known-good кэша или [] с пометкой устаревших
+            self.items[args] = items if items is not None else mark_stale([])
+        # иначе (Kaiten недоступен) остаются данные зеркала
+
+
+def preload(domain, bearer_key, kind, args_list, refresh=False) -> MirrorView:
+    """Области args_list вида kind из зеркала; см. MirrorView."""
+    if refresh:
+        invalidate_kaiten_cache(kind)
+    return MirrorView(domain, bearer_key, kind, args_list, refresh=refresh)
+
+
+def read(domain, bearer_key, kind, *args, refresh=False) -> list:
+    """Одна область зеркала (список словарей, как у fetch_kaiten_*)."""
+    return preload(domain, bearer_key, kind, [args], refresh=refresh).get(*args)
+
+
+# -----------------------------------------------------------------------------
+# Те же сигнатуры, что у fetch_kaiten_*, но из зеркала
+# -----------------------------------------------------------------------------
+
+def mirror_projects(domain, bearer_key, refresh=False):
+    return read(domain, bearer_key, "spaces", refresh=refresh)
+
+
+def mirror_boards(domain, bearer_key, space_id, refresh=False):
+    return read(domain, bearer_key, "boards", space_id, refresh=refresh)
+
+
+def mirror_roles(domain, bearer_key, refresh=False):
+    return read(domain, bearer_key, "user-roles", refresh=refresh)
+
+
+def mirror_board_roles(domain, bearer_key, space_id, board_id, refresh=False):
+    return read(domain, bearer_key, "board-roles", space_id, board_id, refresh=refresh)
+
+
+def mirror_board_statuses(domain, bearer_key, space_id, board_id, refresh=False):
+    return read(domain, bearer_key, "columns", board_id, refresh=refresh)
+
+
+def mirror_swimlanes(domain, bearer_key, board_id, refresh=False):
+    return read(domain, bearer_key, "lanes", board_id, refresh=refresh)
+
+
+def mirror_custom_property_values(domain, bearer_key, space_id, property_id, refresh=False):
+    return read(domain, bearer_key, "custom-property-values", property_id, refresh=refresh)
@@ -0,0 +1,186 @@
+"""
+Ограничитель частоты запросов к Kaiten, общий для всех воркеров на хосте.
+
+Token bucket хранится в маленьком файле состояния под flock: любой процесс
+(воркер gunicorn, management-команда) и любой поток внутри процесса берут
+токены из одного ведра. Нехватка токенов не отклоняет запрос, а резервирует
+слот в будущем (баланс уходит в минус) — вызывающий спит до своего слота,
+поэтому суммарный поток держится на заданной частоте без всплесков.
+
+Интервал на токен тоже хранится в файле: его подстраивает AdaptivePacer
+(kaiten_api) по заголовкам rate limit, и новая частота сразу действует для всех.
+"""
+import heapq
+import itertools
+import os
+import struct
+import tempfile
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows: ведро остаётся общим только внутри процесса
+    fcntl = None
+
+# tokens, ts последнего пересчёта, текущий интервал на токен
+_STATE = struct.Struct("<ddd")
+_STATE_V1 = struct.Struct("<dd")
+
+
+class SharedTokenBucket:
+    def __init__(self, path: str, interval: float, burst: float = 1.0):
+        self.path = path
+        self.interval = interval      # секунд на один токен
+        self.burst = max(1.0, burst)  # ёмкость ведра
+        self._lock = threading.Lock()
+        self._fd = None
+        self._pid = None
+        # состояние для режима без fcntl
+        self._local_state = (self.burst, time.time(), interval)
+
+    def _open(self):
+        # после fork дескриптор переоткрывается: flock на унаследованном описании не разделяет процессы
+        if self._fd is None or self._pid != os.getpid():
+            self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+            self._pid = os.getpid()
+        return self._fd
+
+    def close(self):
+        with self._lock:
+            if self._fd is not None and self._pid == os.getpid():
+                os.close(self._fd)
+            self._fd = None
+
+    def _read(self, fd):
+        raw = os.pread(fd, _STATE.size, 0)
+        if len(raw) == _STATE.size:
+            tokens, ts, interval = _STATE.unpack(raw)
+            return tokens, ts, interval if interval > 0 else self.interval
+        if len(raw) == _STATE_V1.size:
+            return _STATE_V1.unpack(raw) + (self.interval,)
+        return self.burst, time.time(), self.interval
+
+    def _update(self, func):
+        """Атомарно читает состояние, применяет func(tokens, ts, interval, now) и сохраняет результат."""
+        with self._lock:
+            if fcntl is None:
+                state = self._local_state
+            else:
+                fd = self._open()
+                fcntl.flock(fd, fcntl.LOCK_EX)
+            try:
+                if fcntl is not None:
+                    state = self._read(fd)
+                new_state, result = func(*state, time.time())
+                if fcntl is None:
+                    self._local_state = new_state
+                elif new_state != state:
+                    os.pwrite(fd, _STATE.pack(*new_state), 0)
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(fd, fcntl.LOCK_UN)
+        return result
+
+    def _refill(self, tokens, ts, interval, now):
+        # ts может быть в будущем (пауза) — тогда баланс уходит в минус до её конца
+        return min(self.burst, tokens + (now - ts) / interval) if now > ts else tokens - (ts - now) / interval
+
+    def acquire(self, cost: float = 1.0, max_wait: float = None) -> float:
+        """
+        Блокирует до получения токена; возвращает время ожидания в секундах.
+        Если слот выпадает позже max_wait, токен не резервируется и возвращается None.
+        """
+        def take(tokens, ts, interval, now):
+            if interval <= 0:
+                return (tokens, ts, interval), 0.0
+            state = (tokens, ts, interval)
+            tokens = self._refill(tokens, ts, interval, now) - cost
+            wait = max(0.0, -tokens * interval)
+            if max_wait is not None and wait > max_wait:
+                return state, None
+            return (tokens, now, interval), wait
+
+        wait = self._update(take)
+        if wait:
+            time.sleep(wait)
+        return wait
+
+    def current_interval(self) -> float:
+        return self._update(lambda tokens, ts, interval, now: ((tokens, ts, interval), interval))
+
+    def set_interval(self, new_interval: float) -> float:
+        """Меняет интервал на токен для всех процессов; уже выданные слоты не сдвигаются."""
+        def change(tokens, ts, interval, now):
+            if interval > 0 and abs(new_interval - interval) < interval * 0.05:
+                return (tokens, ts, interval), interval
+            if interval > 0:
+                tokens = self._refill(tokens, ts, interval, now)
+                if tokens < 1:
+                    # время ближайшего свободного слота не меняется
+                    tokens = 1 - (1 - tokens) * interval / new_interval
+                ts = now
+            return (tokens, ts, new_interval), new_interval
+        return self._update(change)
+
+    def pause_until(self, until: float):
+        """Ни один новый слот не выдаётся раньше until (unix time): например, до Retry-After."""
+        def pause(tokens, ts, interval, now):
+            if until <= now or interval <= 0:
+                return (tokens, ts, interval), None
+            # баланс к моменту until — не больше одного токена: первый слот ровно в until
+            at_until = min(self.burst, self._refill(tokens, ts, interval, now) + (until - now) / interval)
+            return (min(at_until, 1.0), until, interval), None
+        self._update(pause)
+
+
+class PriorityScheduler:
+    """
+    Очередь на токены внутри процесса: первым слот получает запрос с меньшим priority
+    (0 — интерактивный), при равных — пришедший раньше. Одновременно у ведра ждёт
+    только один поток процесса, поэтому каждый воркер держит не больше одного
+    зарезервированного слота, и интерактивный запрос из любого воркера ждёт
+    максимум по слоту на воркер, а не хвост из тысяч фоновых вызовов.
+    """
+
+    def __init__(self, bucket: SharedTokenBucket):
+        self.bucket = bucket
+        self._cond = threading.Condition()
+        self._queue = []
+        self._seq = itertools.count()
+        self._busy = False
+
+    def acquire(self, priority: int = 0, max_wait: float = None) -> float:
+        """Ждёт своей очереди и токена; None — если за max_wait секунд слот не получить."""
+        ticket = (priority, next(self._seq))
+        give_up = None if max_wait is None else time.monotonic() + max_wait
+        with self._cond:
+            heapq.heappush(self._queue, ticket)
+            while self._busy or self._queue[0] != ticket:
+                left = None if give_up is None else give_up - time.monotonic()
+                if left is not None and left <= 0:
+                    self._queue.remove(ticket)
+                    heapq.heapify(self._queue)
+                    self._cond.notify_all()
+                    return None
+                self._cond.wait(left)
+            heapq.heappop(self._queue)
+            self._busy = True
+        try:
+            left = None if give_up is None else max(0.0, give_up - time.monotonic())
+            return self.bucket.acquire(max_wait=left)
+        finally:
+            with self._cond:
+                self._busy = False
+                self._cond.notify_all()
+
+    def pending(self) -> int:
+        with self._cond:
+            return len(self._queue)
+
+
+def default_state_path() -> str:
+    return os.getenv(
+        "KAITEN_RATE_STATE_FILE",
+        os.path.join(tempfile.gettempdir(), "lecap_kaiten_ratelimit.state"),
+    )
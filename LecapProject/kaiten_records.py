@@ -0,0 +1,209 @@
+"""
+Компактные записи для больших ответов Kaiten (карточки, списания времени).
+
+Ответ разбирается потоково: элементы JSON-массива декодируются по одному по мере
+прихода байтов и сразу проецируются в объект с __slots__, содержащий только нужные
+поля. Полный список словарей (описания, участники, чек-листы) в памяти не
+собирается, поэтому пик памяти и работа сборщика мусора растут с числом
+элементов, а не с объёмом ответа.
+
+Записи совместимы с кодом, работавшим со словарями: record.get('id'),
+record['title'], 'lane_id' in record.
+"""
+import codecs
+import json
+import re
+
+# Размер куска при чтении тела ответа
+CHUNK_SIZE = 64 * 1024
+
+_decoder = json.JSONDecoder()
+_WHITESPACE = " \t\n\r"
+# Хвост буфера, которым может продолжаться число, оборванное на границе куска
+_NUMBER_TAIL = re.compile(r"[0-9.eE+-]+\Z")
+
+
+class _Record:
+    __slots__ = ()
+
+    @classmethod
+    def from_json(cls, item: dict):
+        raise NotImplementedError
+
+    def get(self, name, default=None):
+        value = getattr(self, name, None) if name in self.__slots__ else None
+        return default if value is None else value
+
+    def __getitem__(self, name):
+        if name not in self.__slots__:
+            raise KeyError(name)
+        return getattr(self, name)
+
+    def __contains__(self, name):
+        return name in self.__slots__ and getattr(self, name) is not None
+
+    def __eq__(self, other):
+        return type(other) is type(self) and self.as_tuple() == other.as_tuple()
+
+    def __hash__(self):
+        return hash((type(self), self.get("id")))
+
+    def __repr__(self):
+        return f"<{type(self).__name__} id={self.get('id')}>"
+
+    def __getstate__(self):
+        return self.as_tuple()
+
+    def __setstate__(self, state):
+        for name, value in zip(self.__slots__, state):
+            setattr(self, name, value)
+
+    def as_tuple(self):
+        return tuple(getattr(self, name) for name in self.__slots__)
+
+    def to_dict(self) -> dict:
+        return dict(zip(self.__slots__, self.as_tuple()))
+
+
+def _pick(obj, *names):
+    if not isinstance(obj, dict):
+        return None
+    return {name: obj[name] for name in names if name in obj}
+
+
+class CardRecord(_Record):
+    __slots__ = (
+        "id", "title", "board_id", "lane_id", "column_id", "custom_properties",
+        "created", "updated", "last_moved_at",
+    )
+
+    def __init__(self, id=None, title=None, board_id=None, lane_id=None, column_id=None, custom_properties=None,
+                 created=None, updated=None, last_moved_at=None):
+        self.id = id
+        self.title = title
+        self.board_id = board_id
+        self.lane_id = lane_id
+        self.column_id = column_id
+        self.custom_properties = custom_properties
+        # отметки активности (ISO) — по ним отчёт пропускает давно не менявшиеся карточки
+        self.created = created
+        self.updated = updated
+        self.last_moved_at = last_moved_at
+
+    @classmethod
+    def from_json(cls, item: dict):
+        props = item.get("custom_properties")
+        if isinstance(props, list):
+            props = [_pick(p, "id", "value") for p in props]
+        return cls(
+            item.get("id"), item.get("title"), item.get("board_id"),
+            item.get("lane_id"), item.get("column_id"), props,
+            item.get("created"), item.get("updated"), item.get("last_moved_at"),
+        )
+
+
+class TimeLogRecord(_Record):
+    __slots__ = ("id", "card_id", "created", "time_spent", "author", "role", "comment")
+
+    def __init__(self, id=None, card_id=None, created=None, time_spent=None, author=None, role=None, comment=None):
+        self.id = id
+        self.card_id = card_id
+        self.created = created
+        self.time_spent = time_spent
+        self.author = author
+        self.role = role
+        self.comment = comment
+
+    @classmethod
+    def from_json(cls, item: dict):
+        return cls(
+            item.get("id"), item.get("card_id"), item.get("created"), item.get("time_spent"),
+            _pick(item.get("author"), "id", "full_name", "name", "username"),
+            _pick(item.get("role"), "id", "name"),
+            item.get("comment"),
+        )
+
+
+def iter_json_array(chunks, project=None):
+    """
+    Элементы JSON-массива из итератора байтовых кусков, по одному, с project(item).
+    Если в корне не массив, документ дочитывается и разбирается целиком:
+    для списка — его элементы, для прочего — сам документ одним элементом.
+    """
+    project = project or (lambda item: item)
+    decode = codecs.getincrementaldecoder("utf-8")().decode
+    chunks = iter(chunks)
+    buf, pos, eof = "", 0, False
+
+    def more():
+        nonlocal buf, pos, eof
+        try:
+            chunk = next(chunks)
+        except StopIteration:
+            eof = True
+            buf = buf[pos:] + decode(b"", final=True)
+        else:
+            buf = buf[pos:] + decode(chunk)
+        pos = 0
+
+    def skip_ws():
+        nonlocal pos
+        while True:
+            while pos < len(buf) and buf[pos] in _WHITESPACE:
+                pos += 1
+            if pos < len(buf) or eof:
+                return
+            more()
+
+    skip_ws()
+    if pos >= len(buf):
+        return
+    if buf[pos] != "[":
+        while not eof:
+            more()
+        data = json.loads(buf)
+        if isinstance(data, list):
+            yield from (project(item) for item in data)
+        else:
+            yield project(data)
+        return
+    pos += 1
+
+    expect_value = True
+    while True:
+        skip_ws()
+        if pos >= len(buf):
+            raise ValueError("JSON-массив оборван")
+        if buf[pos] == "]":
+            return
+        if not expect_value:
+            if buf[pos] != ",":
+                raise ValueError(f"Ожидалась запятая в позиции {pos}")
+            pos += 1
+            expect_value = True
+            continue
+        try:
+            item, end = _decoder.raw_decode(buf, pos)
+            # значение, упёршееся в конец буфера (например, число), могло быть обрезано — дочитываем;
+            # число, за которым до конца буфера идут только ".", "e", знак или цифры ("12." | "5"), тоже
+            complete = eof or (end < len(buf) and not (
+                isinstance(item, (int, float)) and _NUMBER_TAIL.match(buf, end)
+            ))
+        except json.JSONDecodeError:
+            if eof:
+                raise
+            complete = False
+        if not complete:
+            more()
+            continue
+        pos = end
+        expect_value = False
+        yield project(item)
+
+
+def iter_response_items(resp, project=None, chunk_size: int = CHUNK_SIZE):
+    """Потоковый разбор тела requests.Response (запрос с stream=True), соединение освобождается в конце."""
+    try:
+        yield from iter_json_array(resp.iter_content(chunk_size=chunk_size), project)
+    finally:
+        resp.close()
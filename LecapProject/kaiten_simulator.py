@@ -0,0 +1,441 @@
+"""
+Локальный симулятор Kaiten API для нагрузочных замеров.
+
+Реализует эндпоинты, которые использует kaiten_api: spaces, boards, роли досок,
+user-roles, users, cards (space/board/lane/column, filter по custom_property,
+updated/created_after/before, offset/limit), time-logs карточки, списания за период
+(/time-logs?from&to&space_id&board_id, отключается --no-bulk-time-logs), columns,
+lanes и значения select-поля. Компания генерируется детерминированно по seed; списания
+не хранятся, а строятся из seed при запросе, поэтому 500k логов не занимают памяти.
+
+Поведение настраивается: задержка (логнормальная по медиане и sigma),
+лимит частоты с 429 + Retry-After и заголовками X-RateLimit-*, доля 5xx.
+GET /__stats отдаёт счётчики и перцентили обслуженных запросов.
+
+Запуск:
+  python manage.py kaiten_simulator --spaces 50 --cards 10000 --time-logs 500000 --rate 5
+  python -m LecapProject.kaiten_simulator --port 8765
+и в приложении: KAITEN_BASE_URL=http://127.0.0.1:8765/api/latest
+"""
+import argparse
+import base64
+import hashlib
+import json
+import math
+import random
+import re
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+
+API_PREFIX = "/api/latest"
+PROJECT_PROPERTY_ID = 1001   # select-поле «Проект»
+BILLING_PROPERTY_ID = 1002   # select-поле «Биллинг»
+
+_FIRST_NAMES = ("Анна", "Иван", "Мария", "Пётр", "Ольга", "Сергей", "Елена", "Дмитрий", "Наталья", "Алексей")
+_LAST_NAMES = ("Иванов", "Смирнов", "Кузнецов", "Попов", "Васильев", "Петров", "Соколов", "Михайлов")
+_ROLE_NAMES = ("Аналитик", "Разработчик", "Тестировщик", "Менеджер проекта", "Дизайнер", "Архитектор", "DevOps")
+_FILLER = "Lorem ipsum dolor sit amet, consectetur adipiscing elit. " * 8
+
+
+@dataclass
+class SimulatorConfig:
+    spaces: int = 5
+    boards_per_space: int = 3
+    cards: int = 1000
+    time_logs: int = 20000
+    users: int = 200
+    roles: int = 7
+    select_values: int = 20
+    seed: int = 1
+    latency_ms: float = 30.0      # медиана задержки
+    latency_sigma: float = 0.5    # sigma логнормального распределения (0 — фиксированная задержка)
+    rate: float = 0.0             # запросов в секунду (0 — без лимита)
+    burst: float = 10.0
+    error_rate: float = 0.0       # доля ответов 500/502/503
+    max_limit: int = 100          # потолок limit на страницу, как у Kaiten
+    bulk_time_logs: bool = True   # поддерживать /time-logs за период (False — 404, как у старых версий API)
+    bulk_offset: bool = True      # False — /time-logs игнорирует offset и всегда отдаёт первую страницу
+    bulk_date_field: str = "created"   # поле списания, по которому /time-logs отбирает период ("for_date" — день работы)
+
+
+class Company:
+    """Синтетическая компания. Карточки хранятся кортежами, списания генерируются на лету."""
+
+    def __init__(self, cfg: SimulatorConfig):
+        self.cfg = cfg
+        rng = random.Random(cfg.seed)
+        self.epoch = datetime(2025, 1, 1, tzinfo=timezone.utc)
+
+        self.roles = [{"id": 10 + i, "name": _ROLE_NAMES[i % len(_ROLE_NAMES)] + ("" if i < len(_ROLE_NAMES) else f" {i}")}
+                      for i in range(cfg.roles)]
+        self.users = [{
+            "id": 100 + i,
+            "full_name": f"{rng.choice(_FIRST_NAMES)} {rng.choice(_LAST_NAMES)}",
+            "username": f"user{i}",
+            "email": f"user{i}@example.com",
+            "avatar_url": f"https://example.com/avatars/{i}.png",
+        } for i in range(cfg.users)]
+        self.user_role = {u["id"]: rng.choice(self.roles) for u in self.users}
+        self.select_values = {
+            PROJECT_PROPERTY_ID: [{"id": 5000 + i, "value": f"Проект {i + 1}"} for i in range(cfg.select_values)],
+            BILLING_PROPERTY_ID: [{"id": 6000 + i, "value": v} for i, v in enumerate(("Да", "Нет"))],
+        }
+
+        self.spaces, self.boards, self.columns, self.lanes, self.board_roles = [], {}, {}, {}, {}
+        board_id = 1
+        for s in range(cfg.spaces):
+            space_id = 100000 + s
+            self.spaces.append({"id": space_id, "title": f"Пространство {s + 1}"})
+            self.boards[space_id] = []
+            for b in range(cfg.boards_per_space):
+                bid = 200000 + board_id
+                board_id += 1
+                self.boards[space_id].append({"id": bid, "title": f"Доска {s + 1}.{b + 1}", "space_id": space_id})
+                self.columns[bid] = [{"id": bid * 10 + c, "title": t, "type": c + 1}
+                                     for c, t in enumerate(("Очередь", "В работе", "Готово"))]
+                self.lanes[bid] = [{"id": bid * 10 + l, "title": f"Дорожка {l + 1}"} for l in range(rng.randint(1, 3))]
+                self.board_roles[bid] = rng.sample(self.roles, k=min(len(self.roles), rng.randint(2, 5)))
+        all_boards = [b for boards in self.boards.values() for b in boards]
+
+        # (id, space_id, board_id, lane_id, column_id, project_value, billing_value, created, updated, n_logs)
+        self.cards = []
+        avg_logs = cfg.time_logs / cfg.cards if cfg.cards else 0
+        for i in range(cfg.cards):
+            board = all_boards[i % len(all_boards)] if all_boards else {"id": 0, "space_id": 0}
+            bid = board["id"]
+            created = rng.randint(0, 300 * 86400)
+            self.cards.append((
+                1000000 + i, board["space_id"], bid,
+                rng.choice(self.lanes[bid])["id"] if bid else None,
+                rng.choice(self.columns[bid])["id"] if bid else None,
+                rng.choice(self.select_values[PROJECT_PROPERTY_ID])["id"],
+                rng.choice(self.select_values[BILLING_PROPERTY_ID])["id"],
+                created, created + rng.randint(0, 60 * 86400),
+                rng.randint(0, int(2 * avg_logs)) if avg_logs else 0,
+            ))
+        self.cards_by_id = {c[0]: c for c in self.cards}
+        self._windows = {}
+        self._window_lock = threading.Lock()
+
+    def _iso(self, seconds: int) -> str:
+        return (self.epoch + timedelta(seconds=seconds)).isoformat().replace("+00:00", "Z")
+
+    def card_json(self, card) -> dict:
+        cid, space_id, bid, lane_id, column_id, project, billing, created, updated, _ = card
+        return {
+            "id": cid, "title": f"Задача {cid}", "space_id": space_id, "board_id": bid,
+            "lane_id": lane_id, "column_id": column_id,
+            "created": self._iso(created), "updated": self._iso(updated),
+            "last_moved_at": self._iso(created + (updated - created) // 2),
+            "description": _FILLER,
+            "members": [{"id": 100 + (cid + k) % max(1, self.cfg.users), "type": 1} for k in range(3)],
+            "custom_properties": [{"id": PROJECT_PROPERTY_ID, "value": project}, {"id": BILLING_PROPERTY_ID, "value": billing}],
+            "properties": {f"id_{PROJECT_PROPERTY_ID}": project, f"id_{BILLING_PROPERTY_ID}": billing},
+        }
+
+    def time_logs(self, card) -> list:
+        cid, _, _, _, _, _, _, created, updated, n_logs = card
+        rng = random.Random(f"{self.cfg.seed}:{cid}")
+        # день работы (for_date) бывает раньше дня, когда списание внесли (created)
+        lag = random.Random(f"{self.cfg.seed}:{cid}:for_date")
+        logs = []
+        for j in range(n_logs):
+            user = rng.choice(self.users)
+            at = created + rng.randint(0, max(1, updated - created + 30 * 86400))
+            for_date = self._iso(at - lag.choice((0, 0, 0, 1, 3, 7)) * 86400)[:10]
+            logs.append({
+                "id": cid * 1000 + j, "card_id": cid, "user_id": user["id"],
+                "role_id": self.user_role[user["id"]]["id"],
+                "time_spent": rng.choice((15, 30, 45, 60, 90, 120, 240, 480)),
+                "for_date": for_date, "created": self._iso(at), "updated": self._iso(at),
+                "comment": f"Работа по задаче {cid}" if rng.random() < 0.7 else None,
+                "author": user, "role": self.user_role[user["id"]],
+            })
+        return logs
+
+    def time_logs_between(self, query) -> list:
+        """Списания с датой bulk_date_field в [from, to] по картам пространства/доски (результат кэшируется для страниц)."""
+        def one(name):
+            value = query.get(name, [""])[0]
+            return value or None
+
+        key = tuple(one(name) for name in ("space_id", "board_id", "from", "to"))
+        with self._window_lock:
+            cached = self._windows.get(key)
+        if cached is not None:
+            return cached
+        space_id, board_id, date_from, date_to = key
+        field = self.cfg.bulk_date_field
+        logs = []
+        for card in self.cards:
+            if (space_id is not None and card[1] != int(space_id)) or (board_id is not None and card[2] != int(board_id)):
+                continue
+            logs.extend(
+                log for log in self.time_logs(card)
+                if (date_from is None or log[field][:10] >= date_from[:10])
+                and (date_to is None or log[field][:10] <= date_to[:10])
+            )
+        with self._window_lock:
+            if len(self._windows) >= 8:
+                self._windows.pop(next(iter(self._windows)))
+            self._windows[key] = logs
+        return logs
+
+    def find_cards(self, query) -> list:
+        def one(name, cast=int):
+            value = query.get(name, [None])[0]
+            return cast(value) if value not in (None, "") else None
+
+        space_id, board_id, lane_id, column_id = one("space_id"), one("board_id"), one("lane_id"), one("column_id")
+        bounds = {name: one(name, lambda v: (datetime.fromisoformat(v.replace("Z", "+00:00")) if "T" in v
+                                             else datetime.fromisoformat(v).replace(tzinfo=timezone.utc)) - self.epoch)
+                  for name in ("created_after", "created_before", "updated_after", "updated_before")}
+        conditions = _filter_conditions(query.get("filter", [None])[0])
+        result = []
+        for card in self.cards:
+            cid, s, b, l, c, project, billing, created, updated, _ = card
+            if (space_id is not None and s != space_id) or (board_id is not None and b != board_id) \
+                    or (lane_id is not None and l != lane_id) or (column_id is not None and c != column_id):
+                continue
+            if not _in_bounds(created, bounds["created_after"], bounds["created_before"]) \
+                    or not _in_bounds(updated, bounds["updated_after"], bounds["updated_before"]):
+                continue
+            props = {PROJECT_PROPERTY_ID: project, BILLING_PROPERTY_ID: billing}
+            if all(props.get(cond["id"]) == cond["value"] for cond in conditions):
+                result.append(card)
+        return result
+
+
+def _in_bounds(seconds, after, before) -> bool:
+    return (after is None or seconds >= after.total_seconds()) and (before is None or seconds <= before.total_seconds())
+
+
+def _filter_conditions(encoded) -> list:
+    """Условия custom_property eq из base64-фильтра (деревья and раскрываются)."""
+    if not encoded:
+        return []
+    tree = json.loads(base64.b64decode(encoded))
+    out, stack = [], [tree]
+    while stack:
+        node = stack.pop()
+        if node.get("key") == "and":
+            stack.extend(node.get("value", []))
+        elif node.get("key") == "custom_property" and node.get("comparison", "eq") == "eq":
+            out.append({"id": int(node["id"]), "value": node["value"]})
+    return out
+
+
+class _RateLimiter:
+    def __init__(self, rate: float, burst: float):
+        self.rate, self.burst = rate, max(1.0, burst)
+        self.tokens, self.ts = self.burst, time.monotonic()
+        self.lock = threading.Lock()
+
+    def take(self):
+        """(разрешено, осталось токенов, секунд до следующего токена)."""
+        if self.rate <= 0:
+            return True, None, 0.0
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.ts) * self.rate)
+            self.ts = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return True, int(self.tokens), 0.0
+            return False, 0, (1 - self.tokens) / self.rate
+
+
+class _Stats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counts = {}
+        self.latencies = []
+
+    def add(self, route: str, status: int, seconds: float):
+        with self.lock:
+            key = f"{route} {status}"
+            self.counts[key] = self.counts.get(key, 0) + 1
+            self.latencies.append(seconds)
+            if len(self.latencies) > 100000:
+                del self.latencies[:50000]
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            data = sorted(self.latencies)
+            counts = dict(self.counts)
+        pct = {f"p{p}": round(data[min(len(data) - 1, int(len(data) * p / 100))] * 1000, 1) if data else None
+               for p in (50, 95, 99)}
+        return {"requests": sum(counts.values()), "by_route": counts, "latency_ms": pct}
+
+
+class KaitenSimulator:
+    def __init__(self, cfg: SimulatorConfig):
+        self.cfg = cfg
+        self.company = Company(cfg)
+        self.limiter = _RateLimiter(cfg.rate, cfg.burst)
+        self.stats = _Stats()
+        self._rng = random.Random(cfg.seed)
+        self._rng_lock = threading.Lock()
+        c = self.company
+        self.routes = [
+            ("spaces", re.compile(r"^/spaces$"), lambda m, q: c.spaces),
+            ("boards", re.compile(r"^/spaces/(\d+)/boards$"), lambda m, q: c.boards.get(int(m[1]))),
+            ("board-roles", re.compile(r"^/spaces/(\d+)/boards/(\d+)/roles$"), lambda m, q: c.board_roles.get(int(m[2]))),
+            ("user-roles", re.compile(r"^/user-roles$"), lambda m, q: [{"id": -1, "name": "Служебная"}] + c.roles),
+            ("users", re.compile(r"^/users$"), lambda m, q: self._page(c.users, q)),
+            ("cards", re.compile(r"^/cards$"), lambda m, q: [c.card_json(card) for card in self._page(c.find_cards(q), q)]),
+            ("time-logs", re.compile(r"^/cards/(\d+)/time-logs$"), self._card_time_logs),
+            ("time-logs-bulk", re.compile(r"^/time-logs$"),
+             lambda m, q: self._page(c.time_logs_between(q), q, cfg.bulk_offset) if cfg.bulk_time_logs else None),
+            ("columns", re.compile(r"^/boards/(\d+)/columns$"), lambda m, q: c.columns.get(int(m[1]))),
+            ("lanes", re.compile(r"^/boards/(\d+)/lanes$"), lambda m, q: c.lanes.get(int(m[1]))),
+            ("custom-property-values", re.compile(r"^/company/custom-properties/(\d+)/select-values$"),
+             lambda m, q: c.select_values.get(int(m[1]))),
+            ("stats", re.compile(r"^/__stats$"), lambda m, q: self.stats.snapshot()),
+        ]
+
+    def _page(self, items, query, honor_offset=True):
+        offset = int(query.get("offset", ["0"])[0] or 0) if honor_offset else 0
+        limit = min(int(query.get("limit", [str(self.cfg.max_limit)])[0] or self.cfg.max_limit), self.cfg.max_limit)
+        return items[offset:offset + limit]
+
+    def _card_time_logs(self, match, query):
+        card = self.company.cards_by_id.get(int(match[1]))
+        return None if card is None else self.company.time_logs(card)
+
+    def latency(self) -> float:
+        if self.cfg.latency_ms <= 0:
+            return 0.0
+        with self._rng_lock:
+            factor = self._rng.lognormvariate(0, self.cfg.latency_sigma) if self.cfg.latency_sigma > 0 else 1.0
+        return self.cfg.latency_ms / 1000.0 * factor
+
+    def injected_error(self):
+        if self.cfg.error_rate <= 0:
+            return None
+        with self._rng_lock:
+            return self._rng.choice((500, 502, 503)) if self._rng.random() < self.cfg.error_rate else None
+
+    def handle(self, method: str, raw_path: str, headers) -> tuple:
+        """(status, заголовки, тело в байтах, имя маршрута) для запроса."""
+        parts = urlsplit(raw_path)
+        path, query = parts.path, parse_qs(parts.query, keep_blank_values=True)
+        if path.startswith(API_PREFIX):
+            path = path[len(API_PREFIX):]
+        for name, pattern, handler in self.routes:
+            match = pattern.match(path)
+            if match:
+                break
+        else:
+            return 404, {}, b'{"message":"Not found"}', "unknown"
+        if name == "stats":
+            return 200, {}, json.dumps(handler(match, query), ensure_ascii=False).encode(), name
+        if method != "GET":
+            return 405, {}, b'{"message":"Method not allowed"}', name
+        if not (headers.get("Authorization") or "").startswith("Bearer "):
+            return 401, {}, b'{"message":"Unauthorized"}', name
+
+        allowed, remaining, retry_in = self.limiter.take()
+        limit_headers = {} if remaining is None else {
+            "X-RateLimit-Limit": str(int(self.cfg.burst)), "X-RateLimit-Remaining": str(remaining),
+            "X-RateLimit-Reset": str(int(time.time() + math.ceil(retry_in or 1 / self.cfg.rate))),
+        }
+        if not allowed:
+            return 429, {**limit_headers, "Retry-After": str(max(1, math.ceil(retry_in)))}, \
+                b'{"message":"Too Many Requests"}', name
+        time.sleep(self.latency())
+        error = self.injected_error()
+        if error:
+            return error, limit_headers, b'{"message":"Internal error"}', name
+
+        data = handler(match, query)
+        if data is None:
+            return 404, limit_headers, b'{"message":"Not found"}', name
+        body = json.dumps(data, ensure_ascii=False).encode()
+        etag = '"%s"' % hashlib.md5(body).hexdigest()
+        if headers.get("If-None-Match") == etag:
+            return 304, {**limit_headers, "ETag": etag}, b"", name
+        return 200, {**limit_headers, "ETag": etag}, body, name
+
+
+def make_server(cfg: SimulatorConfig, host: str = "127.0.0.1", port: int = 8765) -> ThreadingHTTPServer:
+    simulator = KaitenSimulator(cfg)
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"   # keep-alive, как у настоящего API
+
+        def do_GET(self):
+            t0 = time.monotonic()
+            status, headers, body, route = simulator.handle("GET", self.path, self.headers)
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(body)
+            simulator.stats.add(route, status, time.monotonic() - t0)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    server.simulator = simulator
+    return server
+
+
+def add_arguments(parser):
+    defaults = SimulatorConfig()
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--spaces", type=int, default=defaults.spaces)
+    parser.add_argument("--boards-per-space", type=int, default=defaults.boards_per_space)
+    parser.add_argument("--cards", type=int, default=defaults.cards)
+    parser.add_argument("--time-logs", type=int, default=defaults.time_logs, help="всего списаний (в среднем)")
+    parser.add_argument("--users", type=int, default=defaults.users)
+    parser.add_argument("--seed", type=int, default=defaults.seed)
+    parser.add_argument("--latency-ms", type=float, default=defaults.latency_ms, help="медиана задержки ответа")
+    parser.add_argument("--latency-sigma", type=float, default=defaults.latency_sigma, help="разброс (логнормальный), 0 — фиксированная")
+    parser.add_argument("--rate", type=float, default=defaults.rate, help="лимит запросов в секунду, 0 — без лимита")
+    parser.add_argument("--burst", type=float, default=defaults.burst)
+    parser.add_argument("--error-rate", type=float, default=defaults.error_rate, help="доля ответов 5xx")
+    parser.add_argument("--max-limit", type=int, default=defaults.max_limit, help="максимум элементов на страницу")
+    parser.add_argument("--no-bulk-time-logs", dest="bulk_time_logs", action="store_false",
+                        help="отвечать 404 на /time-logs (проверка отката на списания по карточкам)")
+    parser.add_argument("--bulk-ignores-offset", dest="bulk_offset", action="store_false",
+                        help="/time-logs игнорирует offset (проверка недоверия к такому ответу)")
+    parser.add_argument("--bulk-date-field", choices=("created", "for_date"), default=defaults.bulk_date_field,
+                        help="поле списания, по которому /time-logs отбирает период")
+
+
+def config_from_options(options: dict) -> SimulatorConfig:
+    names = SimulatorConfig.__dataclass_fields__.keys()
+    return SimulatorConfig(**{name: options[name] for name in names if options.get(name) is not None})
+
+
+def serve(options: dict, out=print):
+    t0 = time.monotonic()
+    server = make_server(config_from_options(options), options.get("host", "127.0.0.1"), options.get("port", 8765))
+    company = server.simulator.company
+    host, port = server.server_address[:2]
+    out(f"Компания: {len(company.spaces)} пространств, {len(company.cards)} карточек, "
+        f"~{sum(c[-1] for c in company.cards)} списаний (сгенерировано за {time.monotonic() - t0:.1f}s)")
+    out(f"Kaiten simulator: http://{host}:{port}{API_PREFIX}  (KAITEN_BASE_URL=http://{host}:{port}{API_PREFIX})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        out(json.dumps(server.simulator.stats.snapshot(), ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    _parser = argparse.ArgumentParser(description="Локальный симулятор Kaiten API")
+    add_arguments(_parser)
+    serve(vars(_parser.parse_args()))
@@ -0,0 +1,258 @@
+"""
+Вебхуки Kaiten: подписанный приём событий, durable-очередь и точечная инвалидация.
+
+Приём (views.kaiten_webhook_view → receive): подпись HMAC-SHA256 тела в заголовке
+WEBHOOK_SIGNATURE_HEADER ("sha256=<hex>" или просто hex) с секретом KAITEN_WEBHOOK_SECRET.
+Если отправитель подписывать не умеет (в Kaiten у вебхука задаётся только URL),
+секрет можно передать параметром ?token=. Без секрета в окружении приём выключен.
+
+Событие сначала сохраняется (KaitenWebhookEvent, повторная доставка отбрасывается
+по event_id), затем обрабатывается: сразу в запросе (WEBHOOK_INLINE) и/или командой
+manage.py process_kaiten_webhooks. Обработчики идемпотентны, поэтому событие,
+обработанное дважды (запрос и команда одновременно), ничего не ломает; упавшее
+событие остаётся в очереди до WEBHOOK_MAX_ATTEMPTS попыток.
+
+Обработчики по сущностям регистрируются через @on("card", ...):
+    card      — удалённая карточка: её отметки списаний, отпечатки аудита и контрольные точки
+    time_log  — новое/изменённое списание: отметка CardTimeLogWatermark, сброс карточки
+                в незавершённых контрольных точках отчётов (повтор перезагрузит её списания)
+    остальные — сброс соответствующих видов кэша метаданных (CACHE_KINDS) во всех воркерах
+                и затронутых областей зеркала kaiten_mirror (перезагрузятся при следующем чтении)
+
+Проверка локально: manage.py send_kaiten_webhook kaiten_webhook_samples/card_update.json
+"""
+import hashlib
+import hmac
+import json
+import logging
+import os
+import re
+from datetime import timedelta
+
+from django.utils import timezone
+
+from . import kaiten_mirror, metrics
+from .card_activity import record_time_log_watermarks
+from .kaiten_api import invalidate_kaiten_cache
+from .models import (
+    CardTimeLogWatermark, KaitenWebhookEvent, ReportCheckpointCard, TimeLogAuditSnapshot,
+)
+
+logger = logging.getLogger('kaiten')
+
+WEBHOOK_SECRET = os.getenv("KAITEN_WEBHOOK_SECRET", "")
+WEBHOOK_SIGNATURE_HEADER = os.getenv("KAITEN_WEBHOOK_SIGNATURE_HEADER", "X-Kaiten-Signature")
+WEBHOOK_INLINE = os.getenv("KAITEN_WEBHOOK_INLINE", "1") in ("1", "true", "True", "yes")
+WEBHOOK_MAX_ATTEMPTS = int(os.getenv("KAITEN_WEBHOOK_MAX_ATTEMPTS", "5"))
+WEBHOOK_RETENTION = float(os.getenv("KAITEN_WEBHOOK_RETENTION", str(7 * 86400)))  # сек хранения обработанных событий
+
+# Префикс имени события → сущность ("card:update", "card_updated", "time-log.add", ...)
+ENTITIES = {
+    "card": "card", "time_log": "time_log", "timelog": "time_log",
+    "board": "board", "column": "column", "lane": "lane", "swimlane": "lane",
+    "space": "space", "role": "role", "user": "user", "member": "user",
+    "custom_property": "custom_property", "property": "custom_property",
+}
+DELETE_ACTIONS = ("delete", "deleted", "remove", "removed", "archive", "archived")
+
+# Сущность → виды кэша метаданных kaiten_api, которые она затрагивает
+CACHE_KINDS = {
+    "board": ("boards", "columns", "lanes", "board-roles"),
+    "column": ("columns",),
+    "lane": ("lanes",),
+    "space": ("spaces", "boards"),
+    "role": ("user-roles", "board-roles"),
+    "user": ("users",),
+    "custom_property": ("custom-property-values",),
+}
+
+HANDLERS = {}   # сущность -> [handler(event: KaitenWebhookEvent, data: dict)]
+
+
+class WebhookRejected(Exception):
+    """Запрос не принят: status — HTTP-код ответа."""
+
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+def on(*entities):
+    """Регистрирует обработчик событий указанных сущностей."""
+    def decorator(handler):
+        for entity in entities:
+            HANDLERS.setdefault(entity, []).append(handler)
+        return handler
+    return decorator
+
+
+def sign(body: bytes, secret: str = None) -> str:
+    """Значение заголовка подписи для тела запроса (для отправителя и тестов)."""
+    digest = hmac.new((secret or WEBHOOK_SECRET).encode(), body, hashlib.sha256).hexdigest()
+    return f"sha256={digest}"
+
+
+def verify(body: bytes, signature: str = "", token: str = "") -> bool:
+    if not WEBHOOK_SECRET:
+        return False
+    if signature:
+        digest = sign(body).split("=", 1)[1]
+        return hmac.compare_digest(signature.strip().split("=", 1)[-1].encode(), digest.encode())
+    return bool(token) and hmac.compare_digest(token.encode(), WEBHOOK_SECRET.encode())
+
+
+def parse_event(name: str):
+    """Имя события → (сущность или 'other', действие)."""
+    lowered = str(name or "").lower().replace("-", "_")
+    for prefix in sorted(ENTITIES, key=len, reverse=True):
+        if lowered.startswith(prefix):
+            action = re.sub(r"^[_:.]+", "", lowered[len(prefix):])
+            return ENTITIES[prefix], action
+    return "other", lowered
+
+
+def _data(payload: dict, *keys) -> dict:
+    """Объект сущности из тела события: data.<key> или сама data."""
+    data = payload.get("data") if isinstance(payload.get("data"), dict) else payload
+    for key in keys:
+        if isinstance(data.get(key), dict):
+            return data[key]
+    return data
+
+
+def enqueue(body: bytes, event_id: str = ""):
+    """Сохраняет событие в очередь. (KaitenWebhookEvent, создано ли)."""
+    try:
+        payload = json.loads(body)
+    except ValueError:
+        raise WebhookRejected(400, "тело не JSON")
+    if not isinstance(payload, dict):
+        raise WebhookRejected(400, "ожидается JSON-объект")
+    name = str(payload.get("event") or payload.get("type") or "")
+    entity, _ = parse_event(name)
+    event_id = str(event_id or payload.get("id") or hashlib.sha256(body).hexdigest())[:64]
+    event, created = KaitenWebhookEvent.objects.get_or_create(
+        event_id=event_id, defaults={"event": name[:100], "entity": entity, "payload": payload},
+    )
+    metrics.inc("kaiten_webhook_events_total", entity=entity, result="queued" if created else "duplicate")
+    return event, created
+
+
+def receive(body: bytes, headers, query) -> KaitenWebhookEvent:
+    """Проверка подписи, постановка в очередь и (WEBHOOK_INLINE) немедленная обработка."""
+    if not WEBHOOK_SECRET:
+        raise WebhookRejected(404, "приём вебхуков выключен (нет KAITEN_WEBHOOK_SECRET)")
+    if not verify(body, headers.get(WEBHOOK_SIGNATURE_HEADER, ""), query.get("token", "")):
+        metrics.inc("kaiten_webhook_events_total", entity="other", result="rejected")
+        raise WebhookRejected(403, "неверная подпись")
+    event, created = enqueue(body, headers.get("X-Kaiten-Event-Id", ""))
+    if created and WEBHOOK_INLINE:
+        process(event)
+    return event
+
+
+def apply_event(event: KaitenWebhookEvent):
+    """Применяет событие к локальному состоянию (без отметки об обработке)."""
+    for kind in CACHE_KINDS.get(event.entity, ()):
+        invalidate_kaiten_cache(kind)
+    for handler in HANDLERS.get(event.entity, ()):
+        handler(event, event.payload)
+
+
+def process(event: KaitenWebhookEvent) -> bool:
+    """Обрабатывает одно событие; ошибка сохраняется в событии, событие остаётся в очереди."""
+    event.attempts += 1
+    try:
+        apply_event(event)
+    except Exception as e:
+        logger.error(f"Вебхук Kaiten {event}: ошибка обработки: {e}", exc_info=True)
+        event.error = str(e)
+        event.save(update_fields=["attempts", "error"])
+        metrics.inc("kaiten_webhook_events_total", entity=event.entity, result="failed")
+        return False
+    event.processed_at = timezone.now()
+    event.error = ""
+    event.save(update_fields=["attempts", "error", "processed_at"])
+    metrics.inc("kaiten_webhook_events_total", entity=event.entity, result="processed")
+    return True
+
+
+def process_pending(limit: int = 500):
+    """Обрабатывает очередь по порядку поступления. (обработано, с ошибкой)."""
+    events = KaitenWebhookEvent.objects.filter(processed_at__isnull=True, attempts__lt=WEBHOOK_MAX_ATTEMPTS)
+    processed = failed = 0
+    for event in events[:limit]:
+        if process(event):
+            processed += 1
+        else:
+            failed += 1
+    return processed, failed
+
+
+def purge_processed() -> int:
+    """Удаляет обработанные события старше WEBHOOK_RETENTION."""
+    cutoff = timezone.now() - timedelta(seconds=WEBHOOK_RETENTION)
+    deleted, _ = KaitenWebhookEvent.objects.filter(processed_at__lt=cutoff).delete()
+    return deleted
+
+
+def _domain():
+    from accounts.models import AdminSettings
+    return AdminSettings.objects.filter(pk=1).values_list('url_domain_value_id', flat=True).first() or ""
+
+
+@on("card")
+def _card_changed(event, payload):
+    _, action = parse_event(event.event)
+    card_id = _data(payload, "card").get("id")
+    if card_id is None or action not in DELETE_ACTIONS:
+        return
+    domain, card_id = _domain(), str(card_id)
+    CardTimeLogWatermark.objects.filter(domain=domain, card_id=card_id).delete()
+    TimeLogAuditSnapshot.objects.filter(domain=domain, card_id=card_id).delete()
+    ReportCheckpointCard.objects.filter(checkpoint__domain=domain, card_id=card_id).delete()
+
+
+@on("time_log")
+def _time_log_changed(event, payload):
+    log = _data(payload, "time_log", "timelog", "time-log")
+    card = _data(payload).get("card")
+    card_id = log.get("card_id") or (card.get("id") if isinstance(card, dict) else None)
+    if card_id is None:
+        return
+    domain, card_id = _domain(), str(card_id)
+    # незавершённые отчёты перезагрузят списания карточки, а не возьмут устаревшие из контрольной точки
+    ReportCheckpointCard.objects.filter(checkpoint__domain=domain, card_id=card_id).delete()
+    record_time_log_watermarks(domain, {card_id: [log]})
+
+
+def _mirror_scopes(entity, item):
+    """Области зеркала, затронутые событием: [(вид, ключ)], ключ None — все области вида."""
+    item_id, space_id, board_id = (str(item[k]) if item.get(k) is not None else None for k in ("id", "space_id", "board_id"))
+    if entity == "space":
+        return [("spaces", ()), ("boards", (item_id,) if item_id else None)]
+    if entity == "board":
+        return [
+            ("boards", (space_id,) if space_id else None),
+            ("columns", (item_id,) if item_id else None),
+            ("lanes", (item_id,) if item_id else None),
+            ("board-roles", (space_id, item_id) if space_id and item_id else None),
+        ]
+    if entity in ("column", "lane"):
+        return [(f"{entity}s", (board_id,) if board_id else None)]
+    if entity == "role":
+        return [("user-roles", ()), ("board-roles", None)]
+    if entity == "custom_property":
+        return [("custom-property-values", None)]
+    return []
+
+
+@on("space", "board", "column", "lane", "role", "custom_property")
+def _mirror_changed(event, payload):
+    domain = _domain()
+    item = _data(payload, event.entity, "swimlane" if event.entity == "lane" else event.entity)
+    for kind, key in _mirror_scopes(event.entity, item):
+        if key is None:
+            kaiten_mirror.forget(domain, kind)
+        else:
+            kaiten_mirror.forget(domain, kind, *key)
@@ -0,0 +1,165 @@
+"""
+Обработчики логов для нескольких воркеров gunicorn.
+
+ProcessSafeTimedRotatingFileHandler — ротация по времени, безопасная при записи
+в один файл из нескольких процессов: ротацию выполняет тот, кто первым взял
+flock, остальные видят, что файл уже переименован, и просто открывают новый.
+Стандартный TimedRotatingFileHandler в такой ситуации удаляет чужой архив и
+переименовывает файл повторно.
+
+queued_handler() — фабрика для LOGGING: запись уходит в очередь, а форматирование
+и запись на диск выполняет QueueListener в отдельном потоке, поэтому логирование
+не блокирует обработку запроса.
+"""
+import atexit
+import copy
+import logging
+import logging.handlers
+import os
+import queue
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows: межпроцессной блокировки нет, ротация как у стандартного обработчика
+    fcntl = None
+
+
+class ProcessSafeTimedRotatingFileHandler(logging.handlers.TimedRotatingFileHandler):
+    def __init__(self, filename, *args, **kwargs):
+        os.makedirs(os.path.dirname(os.path.abspath(filename)), exist_ok=True)
+        super().__init__(filename, *args, **kwargs)
+        self._lock_path = self.baseFilename + ".lock"
+
+    def _stream_is_stale(self) -> bool:
+        """Файл под нашим дескриптором уже переименован другим процессом."""
+        if self.stream is None:
+            return False
+        try:
+            return os.fstat(self.stream.fileno()).st_ino != os.stat(self.baseFilename).st_ino
+        except OSError:
+            return True
+
+    def emit(self, record):
+        if self._stream_is_stale():
+            self.stream.close()
+            self.stream = None   # откроется заново (delay) при записи
+        super().emit(record)
+
+    def doRollover(self):
+        current_time = int(time.time())
+        time_tuple = time.gmtime(self.rolloverAt - self.interval) if self.utc else time.localtime(self.rolloverAt - self.interval)
+        target = self.rotation_filename(self.baseFilename + "." + time.strftime(self.suffix, time_tuple))
+
+        if self.stream:
+            self.stream.close()
+            self.stream = None
+        lock_fd = os.open(self._lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if fcntl is not None:
+                fcntl.flock(lock_fd, fcntl.LOCK_EX)
+            # архив за этот период уже создан другим процессом — переименовывать нечего
+            if not os.path.exists(target) and os.path.exists(self.baseFilename):
+                self.rotate(self.baseFilename, target)
+                if self.backupCount > 0:
+                    for old in self.getFilesToDelete():
+                        try:
+                            os.remove(old)
+                        except OSError:
+                            pass
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_fd, fcntl.LOCK_UN)
+            os.close(lock_fd)
+
+        if not self.delay:
+            self.stream = self._open()
+        new_rollover = self.computeRollover(current_time)
+        while new_rollover <= current_time:
+            new_rollover += self.interval
+        self.rolloverAt = new_rollover
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler без форматирования в вызывающем потоке: msg и args (в том числе
+    LazyHash/LazyPreview) форматируются уже в потоке слушателя. В вызывающем потоке
+    фиксируются только данные, которые позже будут недоступны: текст исключения
+    и фильтры (correlation id из contextvar).
+    """
+
+    dropped = 0
+
+    def __init__(self, sink: logging.Handler, queue_size: int = 10000):
+        super().__init__(queue.Queue(maxsize=queue_size))
+        self.sink = sink
+        self.queue_size = queue_size
+        self.listener = None
+        self._pid = None
+        self.start()
+
+    def start(self):
+        self.listener = logging.handlers.QueueListener(self.queue, self.sink, respect_handler_level=True)
+        self.listener.start()
+        self._pid = os.getpid()
+
+    def stop(self):
+        if self.listener is not None and self._pid == os.getpid():
+            self.listener.stop()
+            self.listener = None
+
+    def enqueue(self, record):
+        if self._pid != os.getpid():
+            # после fork (gunicorn --preload) поток слушателя в дочернем процессе не существует
+            self.queue = queue.Queue(maxsize=self.queue_size)
+            self.start()
+        # при переполнении очереди запись отбрасывается, а не блокирует запрос
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+_handlers = []
+
+
+def _stop_listeners():
+    # дописать в файл всё, что осталось в очередях
+    while _handlers:
+        _handlers.pop().stop()
+
+
+def queued_handler(target: dict, queue_size: int = 10000):
+    """
+    Фабрика для LOGGING ('()': 'LecapProject.log_handlers.queued_handler'):
+    target — описание конечного обработчика (class + параметры; formatter — ссылка
+    cfg://formatters.<имя>). Возвращает DeferredQueueHandler, чей QueueListener
+    запущен и останавливается при выходе процесса. level и filters задаются
+    самому обработчику, как обычно в LOGGING: фильтры выполняются в потоке запроса.
+    """
+    target = {key: target[key] for key in target}   # ConvertingDict: доступ по ключу разрешает cfg://
+    handler_class = target.pop("class")
+    if isinstance(handler_class, str):
+        module_name, _, class_name = handler_class.rpartition(".")
+        handler_class = getattr(__import__(module_name, fromlist=[class_name]), class_name)
+    formatter = target.pop("formatter", None)
+    target_level = target.pop("level", logging.NOTSET)
+    if isinstance(formatter, dict):
+        formatter = logging.Formatter(formatter.get("format"), formatter.get("datefmt"), formatter.get("style", "%"))
+    sink = handler_class(**target)
+    sink.setLevel(target_level)
+    if formatter is not None:
+        sink.setFormatter(formatter)
+
+    handler = DeferredQueueHandler(sink, queue_size=queue_size)
+    if not _handlers:
+        atexit.register(_stop_listeners)
+    _handlers.append(handler)
+    return handler
@@ -0,0 +1,110 @@
+import hashlib
+import json
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from accounts.models import AdminSettings
+from LecapProject.kaiten_api import (
+    CardFilter, HTTP_CONCURRENCY, PRIORITY_BACKGROUND, get_kaiten_client, iter_kaiten_time_logs, kaiten_priority,
+)
+from LecapProject.models import TimeLogAuditSnapshot
+
+
+def time_logs_digest(logs) -> str:
+    """Хэш содержимого списаний карточки, не зависящий от порядка элементов в ответе."""
+    rows = sorted(
+        (log.to_dict() if hasattr(log, 'to_dict') else log for log in logs),
+        key=lambda row: str(row.get('id')),
+    )
+    payload = json.dumps(rows, ensure_ascii=False, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.blake2b(payload.encode(), digest_size=16).hexdigest()
+
+
+class Command(BaseCommand):
+    help = (
+        "Аудит согласованности списаний времени Kaiten по пространству или доске: каждая карточка "
+        "запрашивается --runs раз (параллельно, не больше --concurrency запросов), выводятся только "
+        "карточки, чьи списания различаются между прогонами или изменились с прошлого аудита."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--space", help="ID пространства (проекта)")
+        parser.add_argument("--board", help="ID доски (только её карточки)")
+        parser.add_argument("--card", action="append", default=[], help="ID карточки (можно несколько раз, вместо --space)")
+        parser.add_argument("--runs", type=int, default=2, help="прогонов по каждой карточке (по умолчанию %(default)s)")
+        parser.add_argument("--delay", type=float, default=0.0, help="пауза между прогонами, сек")
+        parser.add_argument("--concurrency", type=int, default=HTTP_CONCURRENCY, help="одновременных запросов")
+        parser.add_argument("--dry-run", action="store_true", help="не сохранять отпечатки")
+
+    def handle(self, *args, **options):
+        if not (options["space"] or options["card"]):
+            raise CommandError("Укажите --space (и, при необходимости, --board) или --card")
+        if options["runs"] < 1:
+            raise CommandError("--runs должно быть не меньше 1")
+        admin_settings = AdminSettings.objects.filter(pk=1).first()
+        if admin_settings is None or not admin_settings.api_auth_key:
+            raise CommandError("Не заданы домен и ключ Kaiten в настройках администратора")
+        domain, bearer_key = admin_settings.url_domain_value_id, admin_settings.api_auth_key
+
+        with kaiten_priority(PRIORITY_BACKGROUND):
+            card_ids = options["card"] or self._card_ids(domain, bearer_key, options["space"], options["board"])
+            self.stdout.write(f"Карточек: {len(card_ids)}, прогонов: {options['runs']}")
+
+            digests = {card_id: [] for card_id in card_ids}   # card_id -> [хэш по прогонам]
+            items, errors = {}, {}
+            t0 = time.monotonic()
+            for run in range(options["runs"]):
+                if run and options["delay"]:
+                    time.sleep(options["delay"])
+                for card_id, logs, error in iter_kaiten_time_logs(domain, bearer_key, card_ids, max_workers=options["concurrency"]):
+                    if error is not None:
+                        errors[card_id] = error
+                        digests[card_id].append(None)
+                        continue
+                    digests[card_id].append(time_logs_digest(logs))
+                    items[card_id] = len(logs)
+        elapsed = time.monotonic() - t0
+
+        previous = dict(
+            TimeLogAuditSnapshot.objects
+            .filter(domain=domain, card_id__in=[str(card_id) for card_id in card_ids])
+            .values_list('card_id', 'digest')
+        )
+        unstable, changed, snapshots = [], [], []
+        for card_id, values in digests.items():
+            seen = {value for value in values if value is not None}
+            if len(seen) > 1:
+                unstable.append(card_id)
+            if not seen:
+                continue
+            latest = next(value for value in reversed(values) if value is not None)
+            if str(card_id) in previous and previous[str(card_id)] != latest:
+                changed.append(card_id)
+            snapshots.append(TimeLogAuditSnapshot(domain=domain, card_id=str(card_id), digest=latest, items=items[card_id]))
+
+        for card_id in unstable:
+            self.stdout.write(self.style.ERROR(f"✖ {card_id}: ответы различаются между прогонами: {digests[card_id]}"))
+        for card_id in changed:
+            self.stdout.write(self.style.WARNING(
+                f"~ {card_id}: изменились с прошлого аудита ({previous[str(card_id)]} → {digests[card_id][-1]}, списаний {items[card_id]})"
+            ))
+        for card_id, error in errors.items():
+            self.stdout.write(self.style.WARNING(f"! {card_id}: ошибка запроса: {error}"))
+
+        if not options["dry_run"] and snapshots:
+            TimeLogAuditSnapshot.objects.bulk_create(
+                snapshots, update_conflicts=True,
+                unique_fields=['domain', 'card_id'], update_fields=['digest', 'items', 'audited_at'],
+            )
+        summary = (
+            f"Проверено карточек: {len(card_ids)} за {elapsed:.1f}s; нестабильных: {len(unstable)}, "
+            f"изменившихся с прошлого аудита: {len(changed)}, с ошибками: {len(errors)}"
+        )
+        self.stdout.write(self.style.SUCCESS(summary) if not (unstable or errors) else summary)
+
+    def _card_ids(self, domain, bearer_key, space_id, board_id):
+        if not space_id:
+            raise CommandError("--board требует --space")
+        card_filter = CardFilter(space_id).board(board_id)
+        return [card.get('id') for card in get_kaiten_client(domain, bearer_key).iter_cards(card_filter)]
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from LecapProject.kaiten_simulator import add_arguments, serve
+
+
+class Command(BaseCommand):
+    help = "Запускает локальный симулятор Kaiten API (нагрузочные замеры без настоящего Kaiten)"
+
+    def add_arguments(self, parser):
+        add_arguments(parser)
+
+    def handle(self, *args, **options):
+        serve(options, out=self.stdout.write)
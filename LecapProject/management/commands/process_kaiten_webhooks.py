@@ -0,0 +1,27 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from LecapProject.kaiten_webhooks import process_pending, purge_processed
+
+
+class Command(BaseCommand):
+    help = (
+        "Обрабатывает очередь вебхуков Kaiten (события, не обработанные при приёме или упавшие) "
+        "и удаляет давно обработанные. С --loop работает постоянно."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--loop", action="store_true", help="не завершаться, проверять очередь каждые --interval сек")
+        parser.add_argument("--interval", type=float, default=5.0, help="пауза между проверками в режиме --loop")
+        parser.add_argument("--limit", type=int, default=500, help="событий за один проход")
+
+    def handle(self, *args, **options):
+        while True:
+            processed, failed = process_pending(options["limit"])
+            purged = purge_processed()
+            if processed or failed or purged or not options["loop"]:
+                self.stdout.write(f"Обработано: {processed}, с ошибкой: {failed}, удалено старых: {purged}")
+            if not options["loop"]:
+                return
+            time.sleep(options["interval"])
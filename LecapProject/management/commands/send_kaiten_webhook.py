@@ -0,0 +1,36 @@
+import uuid
+from pathlib import Path
+
+import requests
+from django.core.management.base import BaseCommand, CommandError
+
+from LecapProject.kaiten_webhooks import WEBHOOK_SECRET, WEBHOOK_SIGNATURE_HEADER, sign
+
+
+class Command(BaseCommand):
+    help = (
+        "Отправляет записанные события вебхуков Kaiten (JSON-файлы) на приёмник с подписью — "
+        "локальная проверка без настоящего Kaiten. Пример: "
+        "manage.py send_kaiten_webhook LecapProject/kaiten_webhook_samples/*.json"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("files", nargs="+", help="файлы с телами событий")
+        parser.add_argument("--url", default="http://127.0.0.1:8000/webhooks/kaiten/", help="адрес приёмника")
+        parser.add_argument("--secret", default=WEBHOOK_SECRET, help="секрет подписи (по умолчанию KAITEN_WEBHOOK_SECRET)")
+        parser.add_argument("--new-id", action="store_true", help="новый X-Kaiten-Event-Id на каждую отправку (иначе повтор — дубликат)")
+
+    def handle(self, *args, **options):
+        if not options["secret"]:
+            raise CommandError("Не задан секрет: --secret или KAITEN_WEBHOOK_SECRET")
+        for name in options["files"]:
+            body = Path(name).read_bytes()
+            headers = {"Content-Type": "application/json", WEBHOOK_SIGNATURE_HEADER: sign(body, options["secret"])}
+            if options["new_id"]:
+                headers["X-Kaiten-Event-Id"] = uuid.uuid4().hex
+            try:
+                response = requests.post(options["url"], data=body, headers=headers, timeout=10)
+            except requests.RequestException as e:
+                raise CommandError(f"{name}: {e}")
+            style = self.style.SUCCESS if response.status_code == 202 else self.style.ERROR
+            self.stdout.write(style(f"{name}: {response.status_code} {response.text}"))
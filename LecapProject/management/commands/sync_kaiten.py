@@ -0,0 +1,130 @@
+import contextvars
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from accounts.models import AdminSettings
+from LecapProject.kaiten_api import (
+    HTTP_CONCURRENCY, PRIORITY_BACKGROUND, get_kaiten_client, invalidate_kaiten_cache, kaiten_priority,
+)
+from LecapProject.kaiten_mirror import MIRRORS, prune, scope_key, store
+from LecapProject.models import KaitenSyncState
+
+
+class Command(BaseCommand):
+    help = (
+        "Синхронизирует локальное зеркало метаданных Kaiten (пространства, доски, роли, роли досок, "
+        "колонки, дорожки, значения select-полей): запросы идут параллельно, в БД пишутся только изменения, "
+        "в конце сохраняется отметка синхронизации."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--concurrency", type=int, default=HTTP_CONCURRENCY, help="одновременных запросов")
+        parser.add_argument("--property", action="append", default=[], help="ID select-поля (в дополнение к полям из настроек)")
+        parser.add_argument(
+            "--max-age", type=float, default=0,
+            help="не перезагружать области, синхронизированные не раньше чем столько секунд назад (продолжение прерванной синхронизации)",
+        )
+
+    def handle(self, *args, **options):
+        admin_settings = AdminSettings.objects.filter(pk=1).first()
+        if admin_settings is None or not admin_settings.api_auth_key:
+            raise CommandError("Не заданы домен и ключ Kaiten в настройках администратора")
+        self.domain, self.client = admin_settings.url_domain_value_id, get_kaiten_client(
+            admin_settings.url_domain_value_id, admin_settings.api_auth_key,
+        )
+        self.concurrency = max(1, options["concurrency"])
+        self.fresh = set()
+        if options["max_age"]:
+            cutoff = timezone.now() - timedelta(seconds=options["max_age"])
+            self.fresh = set(
+                KaitenSyncState.objects.filter(domain=self.domain, synced_at__gte=cutoff).values_list('scope', flat=True)
+            )
+        self.stats = {kind: Counter() for kind in MIRRORS}
+        self.errors = []
+
+        properties = [admin_settings.project_custom_field_id, admin_settings.billing_custom_field_id, *options["property"]]
+        t0 = time.monotonic()
+        with kaiten_priority(PRIORITY_BACKGROUND):
+            top = self._sync(
+                [("spaces", ())] + [("user-roles", ())]
+                + [("custom-property-values", (p,)) for p in dict.fromkeys(filter(None, properties))]
+            )
+            spaces = [(str(space.get("id")),) for space in top.get(("spaces", ()), [])]
+            boards = self._sync([("boards", space) for space in spaces])
+            board_keys = [
+                (space_id, str(board.get("id")))
+                for (_, (space_id,)), items in boards.items() for board in items
+            ]
+            board_ids = list(dict.fromkeys((board_id,) for _, board_id in board_keys))
+            self._sync(
+                [("board-roles", key) for key in board_keys]
+                + [("columns", key) for key in board_ids] + [("lanes", key) for key in board_ids]
+            )
+            if ("spaces", ()) in top and len(boards) == len(spaces):
+                # дерево загружено целиком — области удалённых пространств и досок больше не нужны
+                self.stats["boards"]["pruned"] += prune(self.domain, "boards", spaces)
+                for kind, keep in (("board-roles", board_keys), ("columns", board_ids), ("lanes", board_ids)):
+                    if not any(error_kind == kind for error_kind, _, _ in self.errors):
+                        self.stats[kind]["pruned"] += prune(self.domain, kind, keep)
+
+        for kind, counts in self.stats.items():
+            if sum(counts[k] for k in ("created", "updated", "deleted", "pruned")):
+                invalidate_kaiten_cache(kind)
+            self.stdout.write(
+                f"{kind}: областей {counts['scopes']} (пропущено свежих {counts['skipped']}), "
+                f"+{counts['created']} ~{counts['updated']} -{counts['deleted']}, удалено областей {counts['pruned']}"
+            )
+        for kind, key, error in self.errors:
+            self.stdout.write(self.style.WARNING(f"! {scope_key(kind, key)}: {error}"))
+        if not self.errors:
+            KaitenSyncState.objects.update_or_create(
+                domain=self.domain, scope="sync",
+                defaults={"synced_at": timezone.now(), "items": sum(c["scopes"] for c in self.stats.values())},
+            )
+        summary = f"Синхронизация {self.domain} за {time.monotonic() - t0:.1f}s, ошибок: {len(self.errors)}"
+        self.stdout.write(self.style.SUCCESS(summary) if not self.errors else summary)
+
+    def _sync(self, tasks):
+        """Загружает области параллельно и записывает их в зеркало. {(вид, ключ): элементы} для успешных."""
+        results, pending = {}, []
+        for kind, key in tasks:
+            if scope_key(kind, key) in self.fresh:
+                model, fields, _ = MIRRORS[kind]
+                rows = model.objects.filter(domain=self.domain, **dict(zip(fields, key)))
+                results[(kind, key)] = list(rows.values_list('data', flat=True))
+                self.stats[kind]["skipped"] += 1
+            else:
+                pending.append((kind, key))
+        if not pending:
+            return results
+
+        def fetch(kind, key):
+            try:
+                return getattr(self.client, MIRRORS[kind][2])(*key), None
+            except Exception as e:
+                return None, e
+
+        workers = min(self.concurrency, len(pending))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="kaiten-sync") as pool:
+            futures = [
+                pool.submit(contextvars.copy_context().run, fetch, kind, key)
+                for kind, key in pending
+            ]
+            for (kind, key), future in zip(pending, futures):
+                items, error = future.result()
+                if error is not None:
+                    self.errors.append((kind, key, error))
+                    continue
+                created, updated, deleted = store(self.domain, kind, key, items)
+                counts = self.stats[kind]
+                counts["scopes"] += 1
+                counts["created"] += created
+                counts["updated"] += updated
+                counts["deleted"] += deleted
+                results[(kind, key)] = items
+        return results
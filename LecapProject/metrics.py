@@ -0,0 +1,336 @@
+"""
+Метрики процесса в формате Prometheus (text exposition 0.0.4), общие для воркеров.
+
+Каждый процесс копит счётчики и гистограммы в памяти (инкремент — под локом,
+без I/O) и периодически сбрасывает снимок в свой файл <pid>-<token>.json в METRICS_DIR;
+token случаен для каждого процесса. Представление /metrics/ сбрасывает снимок своего
+процесса и суммирует файлы всех воркеров. Снимки завершившихся процессов collect()
+переносит в общий archive.json (под flock, чтобы воркеры не перенесли один снимок
+дважды): их счётчики продолжают учитываться, а файлы перезапущенных воркеров не
+копятся. pid завершившегося воркера может достаться новому процессу, пока снимок
+ещё не перенесён: новый процесс переносит чужие снимки своего pid в архив до первой
+записи своего. Снимки, не обновлявшиеся дольше METRICS_RETENTION, удаляются.
+
+Использование:
+    metrics.inc("kaiten_requests_total", endpoint="cards", status="200")
+    metrics.observe("kaiten_request_duration_seconds", 0.42, endpoint="cards")
+    with metrics.timer("report_phase_duration_seconds", phase="time_logs"): ...
+    phases = metrics.PhaseTimer("report_phase_duration_seconds"); ...; phases.mark("cards")
+"""
+import atexit
+import functools
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: снимки завершившихся процессов удаляются только по METRICS_RETENTION
+    fcntl = None
+
+METRICS_DIR = os.getenv("KAITEN_METRICS_DIR", os.path.join(tempfile.gettempdir(), "lecap_metrics"))
+FLUSH_INTERVAL = float(os.getenv("KAITEN_METRICS_FLUSH_INTERVAL", "5"))
+METRICS_RETENTION = float(os.getenv("KAITEN_METRICS_RETENTION", "86400"))
+ARCHIVE_FILE = "archive.json"   # сумма снимков завершившихся процессов
+_SNAPSHOT_NAME = re.compile(r"(\d+)(?:-[0-9a-f]+)?\.json")   # <pid>-<token>.json (и <pid>.json прежних версий)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+REPORT_BUCKETS = (0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+# name -> (тип, описание, границы бакетов)
+METRICS = {
+    "kaiten_requests_total": ("counter", "HTTP-ответы Kaiten по эндпоинтам и статусам", None),
+    "kaiten_request_duration_seconds": ("histogram", "Время HTTP-обмена с Kaiten (без ожидания в очереди)", DEFAULT_BUCKETS),
+    "kaiten_request_errors_total": ("counter", "Сетевые ошибки и таймауты запросов к Kaiten", None),
+    "kaiten_throttle_wait_seconds": ("histogram", "Ожидание слота в ограничителе частоты", DEFAULT_BUCKETS),
+    "kaiten_retries_total": ("counter", "Повторы запросов к Kaiten по причинам", None),
+    "kaiten_retry_sleep_seconds_total": ("counter", "Суммарные паузы перед повторами", None),
+    "kaiten_refusals_total": ("counter", "Отказы API (401/403/429, исчерпанный лимит)", None),
+    "kaiten_circuit_rejections_total": ("counter", "Запросы, отклонённые разомкнутым circuit breaker", None),
+    "kaiten_cache_requests_total": ("counter", "Обращения к кэшу метаданных по результату", None),
+    "kaiten_webhook_events_total": ("counter", "События вебхуков Kaiten по сущностям и результату", None),
+    "report_phase_duration_seconds": ("histogram", "Длительность фаз generate_report", REPORT_BUCKETS),
+    "report_total": ("counter", "Запуски generate_report по исходу", None),
+}
+
+_lock = threading.Lock()
+_counters = {}     # (name, labels) -> float
+_histograms = {}   # (name, labels) -> [counts по бакетам..., +Inf], sum
+_flusher = None
+_pid = None
+_token = None      # отличает снимок процесса от снимка прежнего владельца того же pid
+_claimed = False   # снимки прежнего владельца pid уже перенесены в архив
+
+
+def _labels(labels: dict) -> tuple:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def inc(name: str, value: float = 1.0, **labels):
+    key = (name, _labels(labels))
+    with _lock:
+        _counters[key] = _counters.get(key, 0.0) + value
+    _ensure_flusher()
+
+
+def observe(name: str, value: float, **labels):
+    buckets = METRICS[name][2]
+    key = (name, _labels(labels))
+    with _lock:
+        entry = _histograms.get(key)
+        if entry is None:
+            entry = _histograms[key] = [[0] * (len(buckets) + 1), 0.0]
+        counts = entry[0]
+        for i, bound in enumerate(buckets):
+            if value <= bound:
+                counts[i] += 1
+                break
+        else:
+            counts[-1] += 1
+        entry[1] += value
+    _ensure_flusher()
+
+
+@contextmanager
+def timer(name: str, **labels):
+    t0 = time.monotonic()
+    try:
+        yield
+    finally:
+        observe(name, time.monotonic() - t0, **labels)
+
+
+class PhaseTimer:
+    """
+    Секундомер фаз длинной операции без лишних уровней вложенности:
+    mark(phase) записывает время, прошедшее с предыдущей отметки.
+    """
+
+    def __init__(self, name: str, **labels):
+        self.name = name
+        self.labels = labels
+        self._t = time.monotonic()
+
+    def mark(self, phase: str):
+        now = time.monotonic()
+        observe(self.name, now - self._t, phase=phase, **self.labels)
+        self._t = now
+
+
+def count_outcomes(name: str):
+    """
+    Декоратор представления: считает вызовы по исходу — ok (2xx), redirect
+    (отказ с сообщением и возвратом на форму), error (исключение или иной статус).
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            try:
+                response = view(*args, **kwargs)
+            except Exception:
+                inc(name, outcome="error")
+                raise
+            status = getattr(response, "status_code", 200)
+            inc(name, outcome="ok" if status < 300 else "redirect" if status < 400 else "error")
+            return response
+        return wrapper
+    return decorator
+
+
+# --- снимки процессов ----------------------------------------------------------
+
+def _snapshot() -> dict:
+    with _lock:
+        return {
+            "counters": [[name, list(labels), value] for (name, labels), value in _counters.items()],
+            "histograms": [[name, list(labels), list(entry[0]), entry[1]] for (name, labels), entry in _histograms.items()],
+        }
+
+
+def _snapshot_pid(name: str):
+    match = _SNAPSHOT_NAME.fullmatch(name)
+    return int(match.group(1)) if match else None
+
+
+def flush():
+    """Записывает снимок текущего процесса (атомарно: через временный файл)."""
+    global _claimed
+    # после fork, до первого инкремента, в памяти счётчики родителя — не наши
+    if _pid != os.getpid() or (not _counters and not _histograms):
+        return
+    os.makedirs(METRICS_DIR, exist_ok=True)
+    name = f"{_pid}-{_token}.json"
+    if not _claimed:
+        _archive([other for other in os.listdir(METRICS_DIR) if _snapshot_pid(other) == _pid and other != name])
+        _claimed = True
+    path = os.path.join(METRICS_DIR, name)
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(_snapshot(), f)
+    os.replace(tmp, path)
+
+
+def _flush_loop():
+    while True:
+        time.sleep(FLUSH_INTERVAL)
+        try:
+            flush()
+        except OSError:
+            pass
+
+
+def _ensure_flusher():
+    global _flusher, _pid, _token, _claimed
+    if _pid == os.getpid():
+        return
+    with _lock:
+        if _pid == os.getpid():
+            return
+        if _pid is not None:
+            # после fork в дочернем процессе — свои счётчики с нуля, иначе родительские посчитаются дважды
+            _counters.clear()
+            _histograms.clear()
+        _pid, _token, _claimed = os.getpid(), uuid.uuid4().hex[:12], False
+        _flusher = threading.Thread(target=_flush_loop, name="metrics-flush", daemon=True)
+        _flusher.start()
+    atexit.register(flush)
+
+
+def _accumulate(counters: dict, histograms: dict, data: dict):
+    for name, labels, value in data.get("counters", []):
+        key = (name, tuple(tuple(pair) for pair in labels))
+        counters[key] = counters.get(key, 0.0) + value
+    for name, labels, counts, total in data.get("histograms", []):
+        key = (name, tuple(tuple(pair) for pair in labels))
+        entry = histograms.setdefault(key, [[0] * len(counts), 0.0])
+        entry[0] = [a + b for a, b in zip(entry[0], counts)]
+        entry[1] += total
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+@contextmanager
+def _dir_lock(exclusive: bool):
+    """flock каталога снимков: перенос в архив — эксклюзивно, чтение — совместно."""
+    if fcntl is None:
+        yield
+        return
+    with open(os.path.join(METRICS_DIR, ".lock"), "a") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        yield
+
+
+def _archive(dead):
+    """Переносит снимки завершившихся процессов в ARCHIVE_FILE и удаляет их файлы."""
+    if not dead or fcntl is None:
+        return
+    archive = os.path.join(METRICS_DIR, ARCHIVE_FILE)
+    with _dir_lock(exclusive=True):
+        counters, histograms = {}, {}
+        for path in [archive] + [os.path.join(METRICS_DIR, name) for name in dead]:
+            try:
+                with open(path, encoding="utf-8") as f:
+                    _accumulate(counters, histograms, json.load(f))
+            except (OSError, ValueError):
+                continue   # уже перенесён другим воркером
+        tmp = f"{archive}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({
+                "counters": [[name, list(labels), value] for (name, labels), value in counters.items()],
+                "histograms": [[name, list(labels), list(entry[0]), entry[1]] for (name, labels), entry in histograms.items()],
+            }, f)
+        os.replace(tmp, archive)
+        for name in dead:
+            try:
+                os.remove(os.path.join(METRICS_DIR, name))
+            except FileNotFoundError:
+                pass
+
+
+def collect() -> dict:
+    """Суммарные значения по всем процессам: {"counters": {...}, "histograms": {...}}."""
+    try:
+        flush()
+    except OSError:
+        pass
+    counters, histograms = {}, {}
+    now = time.time()
+    try:
+        _archive([
+            name for name in os.listdir(METRICS_DIR)
+            if _snapshot_pid(name) is not None and not _pid_alive(_snapshot_pid(name))
+        ])
+    except OSError:
+        pass   # каталога ещё нет или перенос не удался — повторится при следующем сборе
+    try:
+        # совместная блокировка: снимок не пропадёт между чтением архива и своего файла
+        with _dir_lock(exclusive=False):
+            for file_name in os.listdir(METRICS_DIR):
+                if not file_name.endswith(".json"):
+                    continue
+                path = os.path.join(METRICS_DIR, file_name)
+                try:
+                    if file_name != ARCHIVE_FILE and now - os.path.getmtime(path) > METRICS_RETENTION:
+                        os.remove(path)
+                        continue
+                    with open(path, encoding="utf-8") as f:
+                        data = json.load(f)
+                except (OSError, ValueError):
+                    continue
+                _accumulate(counters, histograms, data)
+    except FileNotFoundError:
+        pass
+    return {"counters": counters, "histograms": histograms}
+
+
+def _format_labels(labels, extra=()) -> str:
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (
+        f'{k}="' + str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") + '"'
+        for k, v in pairs
+    )
+    return "{" + ",".join(escaped) + "}"
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def render(data: dict = None) -> str:
+    """Текст в формате Prometheus."""
+    data = data or collect()
+    lines = []
+    for name, (kind, help_text, buckets) in METRICS.items():
+        if kind == "counter":
+            series = sorted((k, v) for k, v in data["counters"].items() if k[0] == name)
+        else:
+            series = sorted((k, v) for k, v in data["histograms"].items() if k[0] == name)
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for (_, labels), value in series:
+            if kind == "counter":
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+                continue
+            counts, total = value
+            cumulative = 0
+            for bound, count in zip(list(buckets) + ["+Inf"], counts):
+                cumulative += count
+                lines.append(f"{name}_bucket{_format_labels(labels, [('le', bound)])} {cumulative}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(total)}")
+            lines.append(f"{name}_count{_format_labels(labels)} {cumulative}")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,26 @@
+# Generated by Django 5.1.7 on 2026-10-18 10:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('LecapProject', '0006_projectrate_last_sync'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CardTimeLogWatermark',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('domain', models.CharField(max_length=100, verbose_name='Домен Kaiten')),
+                ('card_id', models.CharField(max_length=50, verbose_name='ID карточки')),
+                ('last_log_at', models.DateTimeField(verbose_name='Последнее списание')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Обновлено')),
+            ],
+            options={
+                'unique_together': {('domain', 'card_id')},
+            },
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.1.7 on 2026-10-18 10:46
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('LecapProject', '0007_cardtimelogwatermark'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReportCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=64, unique=True, verbose_name='Ключ параметров отчёта')),
+                ('domain', models.CharField(max_length=100, verbose_name='Домен Kaiten')),
+                ('params', models.JSONField(default=dict, verbose_name='Параметры отчёта')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Создан')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Обновлён')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ReportCheckpointCard',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('card_id', models.CharField(max_length=50, verbose_name='ID карточки')),
+                ('logs', models.JSONField(default=list, verbose_name='Списания')),
+                ('checkpoint', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='cards', to='LecapProject.reportcheckpoint')),
+            ],
+            options={
+                'unique_together': {('checkpoint', 'card_id')},
+            },
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.1.7 on 2026-10-18 10:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('LecapProject', '0008_reportcheckpoint'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TimeLogAuditSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('domain', models.CharField(max_length=100, verbose_name='Домен Kaiten')),
+                ('card_id', models.CharField(max_length=50, verbose_name='ID карточки')),
+                ('digest', models.CharField(max_length=32, verbose_name='Хэш списаний')),
+                ('items', models.IntegerField(default=0, verbose_name='Число списаний')),
+                ('audited_at', models.DateTimeField(auto_now=True, verbose_name='Время аудита')),
+            ],
+            options={
+                'unique_together': {('domain', 'card_id')},
+            },
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.1.7 on 2026-10-18 10:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('LecapProject', '0009_timelogauditsnapshot'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='KaitenWebhookEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('event_id', models.CharField(max_length=64, unique=True, verbose_name='ID события')),
+                ('event', models.CharField(max_length=100, verbose_name='Тип события')),
+                ('entity', models.CharField(max_length=30, verbose_name='Сущность')),
+                ('payload', models.JSONField(default=dict, verbose_name='Тело события')),
+                ('received_at', models.DateTimeField(auto_now_add=True, verbose_name='Получено')),
+                ('processed_at', models.DateTimeField(blank=True, db_index=True, null=True, verbose_name='Обработано')),
+                ('attempts', models.IntegerField(default=0, verbose_name='Попыток обработки')),
+                ('error', models.TextField(blank=True, default='', verbose_name='Последняя ошибка')),
+            ],
+            options={
+                'ordering': ['id'],
+            },
+        ),
+    ]
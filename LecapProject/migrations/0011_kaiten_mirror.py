@@ -0,0 +1,144 @@
+# Generated by Django 5.1.7 on 2026-10-18 10:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('LecapProject', '0010_kaitenwebhookevent'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='KaitenBoard',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('domain', models.CharField(max_length=100, verbose_name='Домен Kaiten')),
+                ('kaiten_id', models.CharField(max_length=50, verbose_name='ID в Kaiten')),
+                ('title', models.CharField(blank=True, default='', max_length=255, verbose_name='Название')),
+                ('position', models.IntegerField(default=0, verbose_name='Порядок')),
+                ('data', models.JSONField(default=dict, verbose_name='Данные Kaiten')),
+                ('space_id', models.CharField(max_length=50, verbose_name='ID пространства')),
+            ],
+            options={
+                'ordering': ['position'],
+                'abstract': False,
+                'unique_together': {('domain', 'space_id', 'kaiten_id')},
+            },
+        ),
+        migrations.CreateModel(
+            name='KaitenBoardRole',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('domain', models.CharField(max_length=100, verbose_name='Домен Kaiten')),
+                ('kaiten_id', models.CharField(max_length=50, verbose_name='ID в Kaiten')),
+                ('title', models.CharField(blank=True, default='', max_length=255, verbose_name='Название')),
+                ('position', models.IntegerField(default=0, verbose_name='Порядок')),
+                ('data', models.JSONField(default=dict, verbose_name='Данные Kaiten')),
+                ('space_id', models.CharField(max_length=50, verbose_name='ID пространства')),
+                ('board_id', models.CharField(max_length=50, verbose_name='ID доски')),
+            ],
+            options={
+                'ordering': ['position'],
+                'abstract': False,
+                'unique_together': {('domain', 'space_id', 'board_id', 'kaiten_id')},
+            },
+        ),
+        migrations.CreateModel(
+            name='KaitenColumn',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('domain', models.CharField(max_length=100, verbose_name='Домен Kaiten')),
+                ('kaiten_id', models.CharField(max_length=50, verbose_name='ID в Kaiten')),
+                ('title', models.CharField(blank=True, default='', max_length=255, verbose_name='Название')),
+                ('position', models.IntegerField(default=0, verbose_name='Порядок')),
+                ('data', models.JSONField(default=dict, verbose_name='Данные Kaiten')),
+                ('board_id', models.CharField(max_length=50, verbose_name='ID доски')),
+            ],
+            options={
+                'ordering': ['position'],
+                'abstract': False,
+                'unique_together': {('domain', 'board_id', 'kaiten_id')},
+            },
+        ),
+        migrations.CreateModel(
+            name='KaitenLane',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('domain', models.CharField(max_length=100, verbose_name='Домен Kaiten')),
+                ('kaiten_id', models.CharField(max_length=50, verbose_name='ID в Kaiten')),
+                ('title', models.CharField(blank=True, default='', max_length=255, verbose_name='Название')),
+                ('position', models.IntegerField(default=0, verbose_name='Порядок')),
+                ('data', models.JSONField(default=dict, verbose_name='Данные Kaiten')),
+                ('board_id', models.CharField(max_length=50, verbose_name='ID доски')),
+            ],
+            options={
+                'ordering': ['position'],
+                'abstract': False,
+                'unique_together': {('domain', 'board_id', 'kaiten_id')},
+            },
+        ),
+        migrations.CreateModel(
+            name='KaitenPropertyValue',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('domain', models.CharField(max_length=100, verbose_name='Домен Kaiten')),
+                ('kaiten_id', models.CharField(max_length=50, verbose_name='ID в Kaiten')),
+                ('title', models.CharField(blank=True, default='', max_length=255, verbose_name='Название')),
+                ('position', models.IntegerField(default=0, verbose_name='Порядок')),
+                ('data', models.JSONField(default=dict, verbose_name='Данные Kaiten')),
+                ('property_id', models.CharField(max_length=50, verbose_name='ID кастомного поля')),
+            ],
+            options={
+                'ordering': ['position'],
+                'abstract': False,
+                'unique_together': {('domain', 'property_id', 'kaiten_id')},
+            },
+        ),
+        migrations.CreateModel(
+            name='KaitenRole',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('domain', models.CharField(max_length=100, verbose_name='Домен Kaiten')),
+                ('kaiten_id', models.CharField(max_length=50, verbose_name='ID в Kaiten')),
+                ('title', models.CharField(blank=True, default='', max_length=255, verbose_name='Название')),
+                ('position', models.IntegerField(default=0, verbose_name='Порядок')),
+                ('data', models.JSONField(default=dict, verbose_name='Данные Kaiten')),
+            ],
+            options={
+                'ordering': ['position'],
+                'abstract': False,
+                'unique_together': {('domain', 'kaiten_id')},
+            },
+        ),
+        migrations.CreateModel(
+            name='KaitenSpace',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('domain', models.CharField(max_length=100, verbose_name='Домен Kaiten')),
+                ('kaiten_id', models.CharField(max_length=50, verbose_name='ID в Kaiten')),
+                ('title', models.CharField(blank=True, default='', max_length=255, verbose_name='Название')),
+                ('position', models.IntegerField(default=0, verbose_name='Порядок')),
+                ('data', models.JSONField(default=dict, verbose_name='Данные Kaiten')),
+            ],
+            options={
+                'ordering': ['position'],
+                'abstract': False,
+                'unique_together': {('domain', 'kaiten_id')},
+            },
+        ),
+        migrations.CreateModel(
+            name='KaitenSyncState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('domain', models.CharField(max_length=100, verbose_name='Домен Kaiten')),
+                ('scope', models.CharField(max_length=200, verbose_name='Область')),
+                ('synced_at', models.DateTimeField(verbose_name='Синхронизировано')),
+                ('items', models.IntegerField(default=0, verbose_name='Элементов')),
+            ],
+            options={
+                'unique_together': {('domain', 'scope')},
+            },
+        ),
+    ]
@@ -38,4 +38,164 @@ class DefaultRoleRate(models.Model):
     last_sync = models.DateTimeField(default=timezone.now, verbose_name="Последнее обновление")
 
     def __str__(self):
-        return f"{self.role_name} ({self.default_rate})"
\ No newline at end of file
+        return f"{self.role_name} ({self.default_rate})"
+
+
+class CardTimeLogWatermark(models.Model):
+    """
+    Самое позднее списание, увиденное по карточке Kaiten. Вместе с датами изменения
+    и перемещения карточки показывает, могла ли у неё быть активность в периоде отчёта.
+    """
+    domain = models.CharField(max_length=100, verbose_name="Домен Kaiten")
+    card_id = models.CharField(max_length=50, verbose_name="ID карточки")
+    last_log_at = models.DateTimeField(verbose_name="Последнее списание")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Обновлено")
+
+    class Meta:
+        unique_together = ('domain', 'card_id')
+
+    def __str__(self):
+        return f"{self.domain}/{self.card_id}: {self.last_log_at:%Y-%m-%d}"
+
+
+class ReportCheckpoint(models.Model):
+    """
+    Незавершённая загрузка списаний для отчёта: повтор с теми же параметрами
+    продолжает с места остановки, а не начинает заново.
+    """
+    key = models.CharField(max_length=64, unique=True, verbose_name="Ключ параметров отчёта")
+    domain = models.CharField(max_length=100, verbose_name="Домен Kaiten")
+    params = models.JSONField(default=dict, verbose_name="Параметры отчёта")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Создан")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Обновлён")
+
+    def __str__(self):
+        return f"{self.domain}: {self.params}"
+
+
+class ReportCheckpointCard(models.Model):
+    """Загруженные списания одной карточки (в компактном виде TimeLogRecord.to_dict())."""
+    checkpoint = models.ForeignKey(ReportCheckpoint, on_delete=models.CASCADE, related_name='cards')
+    card_id = models.CharField(max_length=50, verbose_name="ID карточки")
+    logs = models.JSONField(default=list, verbose_name="Списания")
+
+    class Meta:
+        unique_together = ('checkpoint', 'card_id')
+
+
+class TimeLogAuditSnapshot(models.Model):
+    """Отпечаток списаний карточки на момент последнего аудита (manage.py audit_time_logs)."""
+    domain = models.CharField(max_length=100, verbose_name="Домен Kaiten")
+    card_id = models.CharField(max_length=50, verbose_name="ID карточки")
+    digest = models.CharField(max_length=32, verbose_name="Хэш списаний")
+    items = models.IntegerField(default=0, verbose_name="Число списаний")
+    audited_at = models.DateTimeField(auto_now=True, verbose_name="Время аудита")
+
+    class Meta:
+        unique_together = ('domain', 'card_id')
+
+    def __str__(self):
+        return f"{self.domain}/{self.card_id}: {self.digest} ({self.items})"
+
+
+class KaitenWebhookEvent(models.Model):
+    """
+    Событие вебхука Kaiten в очереди на обработку (kaiten_webhooks.process_pending).
+    Повторная доставка того же события (event_id) не создаёт новую запись.
+    """
+    event_id = models.CharField(max_length=64, unique=True, verbose_name="ID события")
+    event = models.CharField(max_length=100, verbose_name="Тип события")
+    entity = models.CharField(max_length=30, verbose_name="Сущность")
+    payload = models.JSONField(default=dict, verbose_name="Тело события")
+    received_at = models.DateTimeField(auto_now_add=True, verbose_name="Получено")
+    processed_at = models.DateTimeField(null=True, blank=True, db_index=True, verbose_name="Обработано")
+    attempts = models.IntegerField(default=0, verbose_name="Попыток обработки")
+    error = models.TextField(blank=True, default="", verbose_name="Последняя ошибка")
+
+    class Meta:
+        ordering = ['id']
+
+    def __str__(self):
+        return f"{self.event} ({self.event_id})"
+
+
+class KaitenMirrorItem(models.Model):
+    """
+    Элемент локального зеркала метаданных Kaiten (kaiten_mirror). data — элемент в том виде,
+    в каком его отдаёт KaitenClient; position — порядок в ответе Kaiten.
+    """
+    domain = models.CharField(max_length=100, verbose_name="Домен Kaiten")
+    kaiten_id = models.CharField(max_length=50, verbose_name="ID в Kaiten")
+    title = models.CharField(max_length=255, blank=True, default="", verbose_name="Название")
+    position = models.IntegerField(default=0, verbose_name="Порядок")
+    data = models.JSONField(default=dict, verbose_name="Данные Kaiten")
+
+    class Meta:
+        abstract = True
+        ordering = ['position']
+
+    def __str__(self):
+        return f"{self.title} ({self.kaiten_id})"
+
+
+class KaitenSpace(KaitenMirrorItem):
+    class Meta(KaitenMirrorItem.Meta):
+        unique_together = ('domain', 'kaiten_id')
+
+
+class KaitenBoard(KaitenMirrorItem):
+    space_id = models.CharField(max_length=50, verbose_name="ID пространства")
+
+    class Meta(KaitenMirrorItem.Meta):
+        unique_together = ('domain', 'space_id', 'kaiten_id')
+
+
+class KaitenRole(KaitenMirrorItem):
+    class Meta(KaitenMirrorItem.Meta):
+        unique_together = ('domain', 'kaiten_id')
+
+
+class KaitenBoardRole(KaitenMirrorItem):
+    space_id = models.CharField(max_length=50, verbose_name="ID пространства")
+    board_id = models.CharField(max_length=50, verbose_name="ID доски")
+
+    class Meta(KaitenMirrorItem.Meta):
+        unique_together = ('domain', 'space_id', 'board_id', 'kaiten_id')
+
+
+class KaitenColumn(KaitenMirrorItem):
+    board_id = models.CharField(max_length=50, verbose_name="ID доски")
+
+    class Meta(KaitenMirrorItem.Meta):
+        unique_together = ('domain', 'board_id', 'kaiten_id')
+
+
+class KaitenLane(KaitenMirrorItem):
+    board_id = models.CharField(max_length=50, verbose_name="ID доски")
+
+    class Meta(KaitenMirrorItem.Meta):
+        unique_together = ('domain', 'board_id', 'kaiten_id')
+
+
+class KaitenPropertyValue(KaitenMirrorItem):
+    property_id = models.CharField(max_length=50, verbose_name="ID кастомного поля")
+
+    class Meta(KaitenMirrorItem.Meta):
+        unique_together = ('domain', 'property_id', 'kaiten_id')
+
+
+class KaitenSyncState(models.Model):
+    """
+    Отметка синхронизации зеркала: scope — вид и ключ ('boards:123', 'columns:45'),
+    'sync' — последний полный прогон manage.py sync_kaiten. Нет записи — данных в зеркале нет.
+    """
+    domain = models.CharField(max_length=100, verbose_name="Домен Kaiten")
+    scope = models.CharField(max_length=200, verbose_name="Область")
+    synced_at = models.DateTimeField(verbose_name="Синхронизировано")
+    items = models.IntegerField(default=0, verbose_name="Элементов")
+
+    class Meta:
+        unique_together = ('domain', 'scope')
+
+    def __str__(self):
+        return f"{self.domain}/{self.scope}: {self.synced_at:%Y-%m-%d %H:%M:%S}"
@@ -0,0 +1,89 @@
+"""
+Контрольные точки загрузки списаний для generate_report.
+
+Списания загруженных карточек сохраняются в БД пачками по мере загрузки
+(ReportCheckpointCard). Если отчёт не успел (таймаут gunicorn, серия 429,
+перезапуск воркера), повтор с теми же параметрами берёт готовые карточки из
+контрольной точки и запрашивает у Kaiten только оставшиеся. После успешного
+отчёта контрольная точка удаляется: следующий отчёт читает свежие данные.
+"""
+import hashlib
+import json
+import os
+from datetime import timedelta
+
+from django.db import transaction
+from django.utils import timezone
+
+from .kaiten_records import TimeLogRecord
+from .models import ReportCheckpoint, ReportCheckpointCard
+
+CHECKPOINT_BATCH = int(os.getenv("REPORT_CHECKPOINT_BATCH", "25"))        # карточек на одну запись в БД
+CHECKPOINT_TTL = float(os.getenv("REPORT_CHECKPOINT_TTL", str(6 * 3600)))  # сек, после которых точка не используется
+
+
+def checkpoint_key(domain, **params) -> str:
+    payload = json.dumps({"domain": domain, **params}, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class ReportProgress:
+    """
+    Прогресс загрузки списаний для одного набора параметров отчёта.
+    done — {card_id (str): [TimeLogRecord]} из прошлых попыток; add() копит новые
+    карточки и пишет их пачками, flush() — остаток, complete() — удаляет точку.
+    Запись ReportCheckpoint создаётся только при первой сохраняемой пачке, поэтому
+    отчёт, загрузивший списания за один проход, в таблицы точек не пишет.
+    """
+
+    def __init__(self, domain, **params):
+        self.domain = domain
+        self.params = json.loads(json.dumps(params, default=str))
+        self.key = checkpoint_key(domain, **params)
+        self.checkpoint = ReportCheckpoint.objects.filter(key=self.key).first()
+        if self.checkpoint is not None and self.checkpoint.updated_at < timezone.now() - timedelta(seconds=CHECKPOINT_TTL):
+            # слишком старая точка: списания могли измениться, начинаем заново
+            self.checkpoint.delete()
+            self.checkpoint = None
+        self.done = {}
+        if self.checkpoint is not None:
+            self.done = {
+                card_id: [TimeLogRecord(**log) for log in logs]
+                for card_id, logs in self.checkpoint.cards.values_list('card_id', 'logs')
+            }
+        self.resumed = len(self.done)
+        self._pending = []
+
+    def __repr__(self):
+        return f"<ReportProgress {self.key[:12]} done={len(self.done)}>"
+
+    def add(self, card_id, logs):
+        card_id = str(card_id)
+        self.done[card_id] = logs
+        self._pending.append((card_id, [log.to_dict() if hasattr(log, 'to_dict') else log for log in logs]))
+        if len(self._pending) >= CHECKPOINT_BATCH:
+            self.flush()
+
+    def flush(self):
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, []
+        with transaction.atomic():
+            if self.checkpoint is None:
+                # заодно убираем брошенные точки других отчётов
+                ReportCheckpoint.objects.filter(updated_at__lt=timezone.now() - timedelta(seconds=CHECKPOINT_TTL)).delete()
+                self.checkpoint, _ = ReportCheckpoint.objects.get_or_create(
+                    key=self.key, defaults={"domain": self.domain, "params": self.params},
+                )
+            else:
+                ReportCheckpoint.objects.filter(pk=self.checkpoint.pk).update(updated_at=timezone.now())
+            ReportCheckpointCard.objects.bulk_create(
+                [ReportCheckpointCard(checkpoint=self.checkpoint, card_id=card_id, logs=logs) for card_id, logs in pending],
+                ignore_conflicts=True,
+            )
+
+    def complete(self):
+        self._pending = []
+        if self.checkpoint is not None:
+            self.checkpoint.delete()
+            self.checkpoint = None
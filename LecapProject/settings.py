@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 import os
+import tempfile
 from pathlib import Path
 
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -24,21 +25,32 @@ LOGGING = {
     'disable_existing_loggers': False,
     'formatters': {
         'verbose': {
-            'format': '[%(asctime)s] %(levelname)s [%(name)s:%(lineno)s] %(message)s',
+            'format': '[%(asctime)s] %(levelname)s [%(name)s:%(lineno)s] [%(correlation_id)s] %(message)s',
             'datefmt': '%Y-%m-%d %H:%M:%S'
         },
     },
+    'filters': {
+        'correlation_id': {
+            '()': 'LecapProject.instrumentation.CorrelationIdFilter',
+        },
+    },
     'handlers': {
+        # Запись в файл выполняет отдельный поток (QueueListener): запрос не ждёт диска.
+        # Ротацию между воркерами синхронизирует flock, архивы не затираются.
         'kaiten_file': {
+            '()': 'LecapProject.log_handlers.queued_handler',
             'level': 'INFO',  # Now it will log INFO and higher level messages
-            'class': 'logging.handlers.TimedRotatingFileHandler',
-            'filename': os.path.join(BASE_DIR, 'logs', 'kaiten_api.log'),
-            'when': 'D',
-            'interval': 1,
-            'backupCount': 7,
-            'delay': True,  # Добавлено, чтобы попытаться избежать блокировки файла? 
-            'formatter': 'verbose',
-            'encoding': 'utf-8',
+            'filters': ['correlation_id'],
+            'target': {
+                'class': 'LecapProject.log_handlers.ProcessSafeTimedRotatingFileHandler',
+                'filename': os.path.join(BASE_DIR, 'logs', 'kaiten_api.log'),
+                'when': 'D',
+                'interval': 1,
+                'backupCount': 7,
+                'delay': True,
+                'formatter': 'cfg://formatters.verbose',
+                'encoding': 'utf-8',
+            },
         },
     },
     'loggers': {
@@ -99,6 +111,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'LecapProject.instrumentation.CorrelationIdMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -138,6 +151,19 @@ DATABASES = {
     }
 }
 
+# Cache
+# Файловый кэш общий для всех воркеров gunicorn (метаданные Kaiten и т.п.)
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.environ.get('DJANGO_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'lecap_django_cache')),
+        'TIMEOUT': 3600,
+        'OPTIONS': {
+            'MAX_ENTRIES': 5000,
+        },
+    }
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
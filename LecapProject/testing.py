@@ -0,0 +1,157 @@
+"""
+Тестовая обвязка: поддельный Kaiten и бюджеты обращений к Kaiten и к БД.
+
+fake_kaiten() подменяет сетевой обмен клиента kaiten_api встроенным симулятором
+(kaiten_simulator.KaitenSimulator, без задержек и лимитов) — через ту же точку,
+что и кассеты, поэтому проходят весь стек: кэш, single-flight, повторы, парсинг.
+Каждый обмен считается по маршруту (spaces, boards, board-roles, ...).
+
+kaiten_budget() считает обращения к Kaiten и SQL-запросы внутри блока и падает
+с AssertionError, если превышен заявленный бюджет; @with_kaiten_budget — то же
+для всего теста. В сообщении об ошибке — разбивка вызовов по маршрутам и SQL,
+чтобы N+1 был виден сразу.
+
+    with fake_kaiten() as kaiten, kaiten_budget(kaiten, kaiten_calls=5, queries=12):
+        self.client.get(reverse('reports'))
+"""
+import functools
+import os
+import shutil
+import tempfile
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from unittest import mock
+
+import requests
+from django.db import connections, DEFAULT_DB_ALIAS
+from django.test.utils import CaptureQueriesContext
+from requests.structures import CaseInsensitiveDict
+
+from . import kaiten_api
+from .kaiten_cassette import _build_response
+from .kaiten_ratelimit import PriorityScheduler, SharedTokenBucket
+from .kaiten_simulator import KaitenSimulator, SimulatorConfig
+
+
+class FakeKaiten:
+    """Бэкенд для kaiten_api._send в режиме replay: ответы строит симулятор, вызовы считаются."""
+    mode = "replay"
+
+    def __init__(self, config: SimulatorConfig = None):
+        self.simulator = KaitenSimulator(config or SimulatorConfig(latency_ms=0, rate=0))
+        self.company = self.simulator.company
+        self.calls = Counter()
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return f"<FakeKaiten {sum(self.calls.values())} calls>"
+
+    @property
+    def total(self) -> int:
+        return sum(self.calls.values())
+
+    def reset(self):
+        with self._lock:
+            self.calls.clear()
+
+    def replay(self, method: str, url: str, params=None, json_body=None, headers=None):
+        request = requests.Request(method, url, params=params).prepare()
+        path = request.path_url
+        status, response_headers, body, route = self.simulator.handle(method.upper(), path, CaseInsensitiveDict(headers or {}))
+        with self._lock:
+            self.calls[route] += 1
+        return _build_response(request.url, status, {"Content-Type": "application/json", **response_headers}, body)
+
+
+@contextmanager
+def isolated_rate_limiter():
+    """
+    Токен-бакет, очередь приоритетов и AdaptivePacer kaiten_api с состоянием во временном
+    каталоге: паузы и интервалы, выставленные тестами, не достаются запущенному рядом серверу.
+    """
+    state_dir = tempfile.mkdtemp(prefix="lecap-kaiten-state-")
+    limiter = kaiten_api._RATE_LIMITER
+    bucket = SharedTokenBucket(os.path.join(state_dir, "ratelimit.state"), interval=limiter.interval, burst=limiter.burst)
+    try:
+        with mock.patch.object(kaiten_api, "_RATE_LIMITER", bucket), \
+                mock.patch.object(kaiten_api, "_SCHEDULER", PriorityScheduler(bucket)), \
+                mock.patch.object(kaiten_api._PACER, "bucket", bucket):
+            yield bucket
+    finally:
+        bucket.close()
+        shutil.rmtree(state_dir, ignore_errors=True)
+
+
+@contextmanager
+def fake_kaiten(config: SimulatorConfig = None):
+    """
+    Направляет все запросы kaiten_api в симулятор на время блока. Кэш метаданных
+    и валидаторы сбрасываются на входе, троттлинг отключается: тест меряет число
+    обращений, а не темп. Состояние троттлинга — временное (isolated_rate_limiter).
+    """
+    backend = FakeKaiten(config)
+    kaiten_api.invalidate_kaiten_cache()
+    with mock.patch.object(kaiten_api, "_CASSETTE", backend), \
+            mock.patch.object(kaiten_api, "_throttle", lambda: 0.0), \
+            mock.patch.dict(kaiten_api._BULK_UNSUPPORTED, clear=True), \
+            isolated_rate_limiter():
+        try:
+            yield backend
+        finally:
+            kaiten_api.invalidate_kaiten_cache()
+
+
+class Budget:
+    """Итог блока kaiten_budget: kaiten_calls, routes (Counter) и queries (список SQL)."""
+
+    def __init__(self):
+        self.kaiten_calls = 0
+        self.routes = Counter()
+        self.queries = []
+
+
+def _describe(budget: Budget) -> str:
+    routes = ", ".join(f"{route}={n}" for route, n in budget.routes.most_common())
+    sql = "\n".join(f"  {q['sql']}" for q in budget.queries)
+    return f"Kaiten: {budget.kaiten_calls} ({routes or '—'})\nSQL: {len(budget.queries)}\n{sql}"
+
+
+@contextmanager
+def kaiten_budget(kaiten: FakeKaiten = None, kaiten_calls: int = None, queries: int = None, using: str = DEFAULT_DB_ALIAS):
+    """
+    Бюджет блока: не больше kaiten_calls обращений к kaiten (FakeKaiten) и не больше
+    queries SQL-запросов. None — не проверять. Превышение — AssertionError.
+    """
+    budget = Budget()
+    before = Counter(kaiten.calls) if kaiten is not None else Counter()
+    with CaptureQueriesContext(connections[using]) as captured:
+        yield budget
+    if kaiten is not None:
+        budget.routes = Counter(kaiten.calls)
+        budget.routes.subtract(before)
+        budget.routes = +budget.routes
+        budget.kaiten_calls = sum(budget.routes.values())
+    budget.queries = list(captured.captured_queries)
+
+    errors = []
+    if kaiten_calls is not None and budget.kaiten_calls > kaiten_calls:
+        errors.append(f"обращений к Kaiten {budget.kaiten_calls} > {kaiten_calls}")
+    if queries is not None and len(budget.queries) > queries:
+        errors.append(f"SQL-запросов {len(budget.queries)} > {queries}")
+    if errors:
+        raise AssertionError("Превышен бюджет: " + "; ".join(errors) + "\n" + _describe(budget))
+
+
+def with_kaiten_budget(kaiten_calls: int = None, queries: int = None, config: SimulatorConfig = None):
+    """
+    Декоратор теста: тело выполняется с fake_kaiten() внутри kaiten_budget().
+    Поддельный Kaiten передаётся в тест аргументом kaiten.
+    """
+    def decorator(test):
+        @functools.wraps(test)
+        def wrapper(self, *args, **kwargs):
+            with fake_kaiten(config) as kaiten, kaiten_budget(kaiten, kaiten_calls=kaiten_calls, queries=queries):
+                return test(self, *args, kaiten=kaiten, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,1356 @@
+import asyncio
+import base64
+import contextvars
+import io
+import json
+import logging
+import os
+from pathlib import Path
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta, timezone
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.core.files.base import ContentFile
+from django.db import connection
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from docx import Document
+import requests
+
+from accounts.models import AdminSettings
+from docxTemplate.models import TemplateFile
+from .kaiten_simulator import BILLING_PROPERTY_ID, Company, KaitenSimulator, SimulatorConfig, PROJECT_PROPERTY_ID
+from . import (
+    instrumentation, kaiten_api, kaiten_cache, kaiten_cassette, kaiten_mirror, kaiten_ratelimit, kaiten_records,
+    kaiten_webhooks, log_handlers, metrics, views,
+)
+from .kaiten_api import CardFilter, KaitenClient, KaitenDeadlineExceeded, fetch_kaiten_boards, use_kaiten_cassette
+from .kaiten_records import TimeLogRecord
+from .models import (
+    CardTimeLogWatermark, DefaultRoleRate, KaitenBoard, KaitenSyncState, KaitenWebhookEvent, ProjectRate,
+    ReportCheckpoint, ReportCheckpointCard, TimeLogAuditSnapshot,
+)
+from .testing import fake_kaiten, isolated_rate_limiter, kaiten_budget, with_kaiten_budget
+from .views import check_board_rates, load_rate_tables
+
+# Небольшая компания: 2 пространства по 3 доски, 60 карточек, ~600 списаний
+COMPANY = SimulatorConfig(
+    spaces=2, boards_per_space=3, cards=60, time_logs=600, users=10, roles=5,
+    latency_ms=0, rate=0,
+)
+MEDIA_ROOT = tempfile.mkdtemp(prefix="lecap-tests-")
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class ViewBudgetTests(TestCase):
+    """
+    Бюджеты обращений к Kaiten и SQL-запросов на view. Число запросов к БД не должно
+    зависеть от числа ролей, досок и списаний. Метаданные страницы читают из зеркала
+    (синхронизировано в setUpTestData), поэтому к Kaiten обращается только сам отчёт.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(
+            "staff@example.com", "password", first_name="Анна", last_name="Иванова", is_staff=True,
+        )
+        AdminSettings.objects.create(
+            pk=1, url_domain_value_id="lecap", api_auth_key="token",
+            project_custom_field_id=str(PROJECT_PROPERTY_ID),
+            billing_custom_field_id="1002", billing_custom_field_value_id="6000",
+        )
+        with fake_kaiten(COMPANY) as kaiten:
+            cls.space_id = str(kaiten.company.spaces[0]["id"])
+            cls.board_id = str(kaiten.company.boards[int(cls.space_id)][0]["id"])
+            for role in kaiten.company.roles:
+                DefaultRoleRate.objects.create(role_id=str(role["id"]), role_name=role["name"], default_rate=1000)
+            call_command("sync_kaiten", stdout=io.StringIO())
+
+        buffer = io.BytesIO()
+        document = Document()
+        document.add_paragraph("Отчёт по проекту {project_title} за {start_date} – {end_date}")
+        document.add_paragraph("{table}")
+        document.save(buffer)
+        cls.template = TemplateFile.objects.create(file=ContentFile(buffer.getvalue(), name="report.docx"))
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    # Бюджеты SQL — верхние границы, не зависящие от числа проектов, досок и ролей:
+    # сессия и пользователь (2) + AdminSettings (1) + по виду зеркала отметки и строки (2 на вид) +
+    # DefaultRoleRate по ролям Kaiten (выборка, вставка, переименование — до 3) + таблицы ставок (2).
+
+    # + зеркало: spaces, user-roles, boards, board-roles (8) + шаблоны (1)
+    @with_kaiten_budget(kaiten_calls=0, queries=2 + 1 + 8 + 3 + 2 + 1, config=COMPANY)
+    def test_reports_view(self, kaiten):
+        response = self.client.get(reverse("reports"))
+        self.assertEqual(response.status_code, 200)
+
+    # + зеркало: boards, board-roles, user-roles (6) + удаление устаревших DefaultRoleRate (1)
+    @with_kaiten_budget(kaiten_calls=0, queries=2 + 1 + 6 + 3 + 1 + 2, config=COMPANY)
+    def test_get_boards_for_report(self, kaiten):
+        response = self.client.get(reverse("get_boards"), {"space_id": self.space_id, "for_report": "1"})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(all(board["has_rates"] for board in response.json()["boards"]))
+
+    # AdminSettings.update_or_create в savepoint (3) + зеркало: spaces, boards, user-roles (6) +
+    # ставки доски: выборка и вставка недостающих (2) + удаление устаревших DefaultRoleRate (1) +
+    # formset ставок доски и ставок по умолчанию (3)
+    @with_kaiten_budget(kaiten_calls=0, queries=2 + 3 + 6 + 2 + 3 + 1 + 3, config=COMPANY)
+    def test_rates_view(self, kaiten):
+        response = self.client.get(reverse("rates"), {"project_id": self.space_id, "board_id": self.board_id})
+        self.assertEqual(response.status_code, 200)
+
+    # AJAX — async-представления: AdminSettings (1) + зеркало: columns или lanes (2)
+    @with_kaiten_budget(kaiten_calls=0, queries=2 * (2 + 1 + 2), config=COMPANY)
+    def test_ajax_statuses_and_lanes(self, kaiten):
+        self.assertTrue(asyncio.iscoroutinefunction(views.get_statuses))
+        statuses = self.client.get(reverse("get_statuses"), {"space_id": self.space_id, "board_id": self.board_id})
+        lanes = self.client.get(reverse("get_swimlanes"), {"board_id": self.board_id})
+        self.assertEqual(len(statuses.json()["statuses"]), len(kaiten.company.columns[int(self.board_id)]))
+        self.assertEqual(len(lanes.json()["lanes"]), len(kaiten.company.lanes[int(self.board_id)]))
+
+    def test_ajax_budget_reaches_sync_mirror_call(self):
+        budgets = []
+        with mock.patch.object(views, "mirror_swimlanes", lambda *args, **kwargs: budgets.append(kaiten_api.remaining_budget()) or []):
+            response = self.client.get(reverse("get_swimlanes"), {"board_id": self.board_id})
+        self.assertEqual(response.json(), {"lanes": []})
+        self.assertTrue(0 < budgets[0] <= kaiten_api.AJAX_BUDGET)
+
+    def _generate_report(self, start_date="2025-03-01", end_date="2025-08-31"):
+        return self.client.post(reverse("reports"), {
+            "project": self.space_id, "board": self.board_id, "template": self.template.id,
+            "start_date": start_date, "end_date": end_date,
+            "custom_project": "all", "swimlane": "all", "status": "all",
+        })
+
+    @staticmethod
+    def _report_rows(response):
+        table = Document(io.BytesIO(response.content)).tables[0]
+        return [[cell.text for cell in row.cells] for row in table.rows]
+
+    def test_generate_report(self):
+        with fake_kaiten(COMPANY) as kaiten:
+            # карточки доски одной страницей + списания за период одной-двумя страницами +
+            # сверка со списаниями одной карточки;
+            # SQL: reports_view до обработки формы (как в test_reports_view, 17) + AdminSettings (1) +
+            # зеркало: boards, user-roles (4) + переопределения ролей (1) + таблицы ставок (2) +
+            # контрольная точка (1) + отметки списаний: выборка и запись (2)
+            with kaiten_budget(kaiten, kaiten_calls=1 + 2 + 1, queries=17 + 1 + 4 + 1 + 2 + 1 + 2) as budget:
+                response = self._generate_report()
+        self.assertEqual(response.status_code, 200, response.headers.get("Location"))
+        self.assertEqual(budget.routes["time-logs"], 1)
+
+    def test_generate_report_without_bulk_time_logs(self):
+        with fake_kaiten(COMPANY) as kaiten:
+            bulk_rows = self._report_rows(self._generate_report())
+        # Kaiten без /time-logs за период: откат на списания по карточкам, отчёт тот же
+        with fake_kaiten(SimulatorConfig(**{**COMPANY.__dict__, "bulk_time_logs": False})) as kaiten:
+            cards = [c for c in kaiten.company.cards if str(c[2]) == self.board_id]
+            with kaiten_budget(kaiten, kaiten_calls=1 + 1 + len(cards)) as budget:
+                response = self._generate_report()
+        self.assertEqual(response.status_code, 200, response.headers.get("Location"))
+        self.assertTrue(0 < budget.routes["time-logs"] <= len(cards))
+        self.assertEqual(self._report_rows(response), bulk_rows)
+        self.assertGreater(len(bulk_rows), 1)
+
+    def test_generate_report_distrusts_bulk_time_logs_ignoring_offset(self):
+        with fake_kaiten(COMPANY):
+            bulk_rows = self._report_rows(self._generate_report())
+        # /time-logs отдаёт первую страницу при любом offset: ответ отбрасывается, списания — по карточкам
+        with fake_kaiten(SimulatorConfig(**{**COMPANY.__dict__, "bulk_offset": False})) as kaiten, \
+                mock.patch.object(kaiten_api, "PAGE_SIZE", 10):
+            response = self._generate_report()
+        self.assertEqual(response.status_code, 200, response.headers.get("Location"))
+        self.assertEqual(kaiten.calls["time-logs-bulk"], 2)
+        self.assertGreater(kaiten.calls["time-logs"], 0)
+        self.assertEqual(self._report_rows(response), bulk_rows)
+
+    def test_generate_report_distrusts_bulk_time_logs_filtered_by_for_date(self):
+        with fake_kaiten(COMPANY):
+            bulk_rows = self._report_rows(self._generate_report())
+        # /time-logs отбирает период по дню работы, а отчёт — по дате создания: сверка с карточкой
+        # или списание вне периода выдают расхождение, списания загружаются по карточкам
+        with fake_kaiten(SimulatorConfig(**{**COMPANY.__dict__, "bulk_date_field": "for_date"})) as kaiten:
+            response = self._generate_report()
+        self.assertEqual(response.status_code, 200, response.headers.get("Location"))
+        self.assertGreater(kaiten.calls["time-logs"], 1)
+        self.assertEqual(self._report_rows(response), bulk_rows)
+
+    def test_generate_report_skips_idle_cards(self):
+        per_card = SimulatorConfig(**{**COMPANY.__dict__, "bulk_time_logs": False})
+        with fake_kaiten(per_card), mock.patch("LecapProject.card_activity.ACTIVITY_PREFILTER", False):
+            all_rows = self._report_rows(self._generate_report("2025-11-01", "2025-11-30"))
+        CardTimeLogWatermark.objects.all().delete()
+
+        with fake_kaiten(per_card) as kaiten, mock.patch("LecapProject.card_activity.ACTIVITY_PREFILTER", True), \
+                self.assertLogs("kaiten", "INFO") as logs:
+            # активны карточки, созданные до конца ноября и менявшиеся не раньше чем за 30 дней до его начала
+            epoch, start, end = (datetime(*ymd, tzinfo=timezone.utc) for ymd in ((2025, 1, 1), (2025, 11, 1), (2025, 12, 1)))
+            board_cards = [c for c in kaiten.company.cards if str(c[2]) == self.board_id]
+            active = [
+                c for c in board_cards
+                if epoch + timedelta(seconds=c[7]) < end and epoch + timedelta(seconds=c[8]) >= start - timedelta(days=30)
+            ]
+            response = self._generate_report("2025-11-01", "2025-11-30")
+        self.assertEqual(kaiten.calls["time-logs"], len(active))
+        self.assertLess(len(active), len(board_cards))
+        self.assertIn(f"без активности в периоде пропущено {len(board_cards) - len(active)}", "\n".join(logs.output))
+        self.assertEqual(self._report_rows(response), all_rows)
+        self.assertTrue(CardTimeLogWatermark.objects.filter(domain="lecap").exists())
+
+    def test_generate_report_rejects_bad_dates(self):
+        with fake_kaiten(COMPANY) as kaiten:
+            for start_date, end_date in (("2025-13-01", "2025-11-30"), ("01.11.2025", "2025-11-30"), ("2025-11-30", "2025-11-01")):
+                response = self._generate_report(start_date, end_date)
+                self.assertEqual(response.status_code, 200)
+                self.assertContains(response, "Некорректный период дат.")
+        self.assertEqual(kaiten.calls["cards"], 0)
+
+    def test_generate_report_keeps_idle_cards_with_bulk_time_logs(self):
+        # /time-logs за период стоит одинаково при любом числе карточек: отбор по активности не нужен
+        with fake_kaiten(COMPANY), mock.patch("LecapProject.views.prefilter_active_cards") as prefilter:
+            response = self._generate_report("2025-11-01", "2025-11-30")
+        self.assertEqual(response.status_code, 200, response.headers.get("Location"))
+        prefilter.assert_not_called()
+
+    @mock.patch("LecapProject.report_checkpoint.CHECKPOINT_BATCH", 2)
+    def test_generate_report_resumes_from_checkpoint(self):
+        per_card = SimulatorConfig(**{**COMPANY.__dict__, "bulk_time_logs": False})
+        with fake_kaiten(per_card), mock.patch("LecapProject.card_activity.ACTIVITY_PREFILTER", False):
+            expected_rows = self._report_rows(self._generate_report())
+
+        # первая попытка: после четырёх карточек Kaiten «перестаёт успевать»
+        time_logs, served, lock = KaitenClient.time_logs, [], threading.Lock()
+
+        def slow_time_logs(client, card_id):
+            with lock:
+                if len(served) >= 4:
+                    raise KaitenDeadlineExceeded("бюджет исчерпан")
+                served.append(card_id)
+            return time_logs(client, card_id)
+
+        with fake_kaiten(per_card), mock.patch("LecapProject.card_activity.ACTIVITY_PREFILTER", False), \
+                mock.patch.object(KaitenClient, "time_logs", slow_time_logs, create=False):
+            response = self._generate_report()
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(ReportCheckpoint.objects.get().cards.count(), 4)
+
+        # повтор с теми же параметрами запрашивает только оставшиеся карточки
+        with fake_kaiten(per_card) as kaiten, mock.patch("LecapProject.card_activity.ACTIVITY_PREFILTER", False):
+            cards = [c for c in kaiten.company.cards if str(c[2]) == self.board_id]
+            response = self._generate_report()
+        self.assertEqual(response.status_code, 200, response.headers.get("Location"))
+        self.assertEqual(kaiten.calls["time-logs"], len(cards) - 4)
+        self.assertEqual(self._report_rows(response), expected_rows)
+        self.assertFalse(ReportCheckpoint.objects.exists())
+
+    def test_mirror_fills_on_demand(self):
+        KaitenSyncState.objects.all().delete()
+        with fake_kaiten(COMPANY) as kaiten:
+            self.assertEqual(self.client.get(reverse("reports")).status_code, 200)
+            self.assertGreater(kaiten.total, 0)
+            with kaiten_budget(kaiten, kaiten_calls=0):
+                self.assertEqual(self.client.get(reverse("reports")).status_code, 200)
+            # ?refresh=1 перечитывает метаданные страницы из Kaiten
+            with kaiten_budget(kaiten) as budget:
+                self.client.get(reverse("rates"), {"project_id": self.space_id, "refresh": "1"})
+        self.assertEqual(budget.routes["spaces"], 1)
+
+    def test_reports_view_loads_missing_mirror_scopes_concurrently(self):
+        KaitenSyncState.objects.all().delete()
+        fetch, threads = kaiten_mirror._fetch, []
+
+        def recording_fetch(domain, bearer_key, kind, args):
+            threads.append((kind, threading.current_thread().name.startswith("kaiten-mirror")))
+            return fetch(domain, bearer_key, kind, args)
+
+        with fake_kaiten(COMPANY), mock.patch.object(kaiten_mirror, "_fetch", recording_fetch):
+            self.assertEqual(self.client.get(reverse("reports")).status_code, 200)
+        # доски и роли досок — пачками в пуле зеркала, а не по одной из цикла по проектам
+        pooled = {kind for kind, in_pool in threads if kind in ("boards", "board-roles")}
+        self.assertEqual(pooled, {"boards", "board-roles"})
+        self.assertTrue(all(in_pool for kind, in_pool in threads if kind in pooled))
+
+    def test_sync_kaiten_writes_only_changes(self):
+        with fake_kaiten(COMPANY) as kaiten:
+            out = io.StringIO()
+            call_command("sync_kaiten", stdout=out)
+            self.assertIn("boards: областей 2 (пропущено свежих 0), +0 ~0 -0", out.getvalue())
+            kaiten.company.boards[int(self.space_id)][0]["title"] = "Переименованная доска"
+            out = io.StringIO()
+            call_command("sync_kaiten", stdout=out)
+        self.assertIn("boards: областей 2 (пропущено свежих 0), +0 ~1 -0", out.getvalue())
+        self.assertEqual(KaitenBoard.objects.get(domain="lecap", kaiten_id=self.board_id).title, "Переименованная доска")
+        self.assertTrue(KaitenSyncState.objects.filter(domain="lecap", scope="sync").exists())
+
+        # продолжение: свежие области не перезагружаются
+        with fake_kaiten(COMPANY) as kaiten:
+            call_command("sync_kaiten", max_age=3600, stdout=io.StringIO())
+        self.assertEqual(kaiten.total, 0)
+
+    def test_custom_administration_syncs_default_rates_in_bulk(self):
+        role_ids = list(DefaultRoleRate.objects.values_list("role_id", flat=True))
+        DefaultRoleRate.objects.filter(role_id=role_ids[0]).delete()
+        with fake_kaiten(COMPANY), CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse("custom_administration"))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(sorted(DefaultRoleRate.objects.values_list("role_id", flat=True)), sorted(role_ids))
+        # выборка, вставка недостающих и удаление устаревших — не по запросу на роль
+        # (ещё одна выборка — formset ставок на странице)
+        rate_queries = [q for q in queries if "defaultrolerate" in q["sql"].lower()]
+        self.assertLessEqual(len(rate_queries), 4)
+
+    def test_check_board_rates_queries_do_not_depend_on_roles(self):
+        roles = [{"id": str(i)} for i in range(50)]
+        for role in roles[:25]:
+            ProjectRate.objects.create(project_id=self.space_id, board_id=self.board_id, role_id=role["id"], rate=1500)
+        with kaiten_budget(queries=2):
+            valid, _ = check_board_rates({"id": self.board_id}, self.space_id, roles)
+        self.assertFalse(valid)
+        rate_tables = load_rate_tables([self.space_id])
+        with kaiten_budget(queries=0):
+            valid, _ = check_board_rates({"id": self.board_id}, self.space_id, roles[:25], rate_tables)
+        self.assertTrue(valid)
+
+    def test_budget_overrun_is_reported(self):
+        with fake_kaiten(COMPANY) as kaiten:
+            with self.assertRaisesMessage(AssertionError, "board-roles"):
+                with kaiten_budget(kaiten, kaiten_calls=1):
+                    self.client.get(reverse("get_boards"), {"space_id": self.space_id, "for_report": "1", "refresh": "1"})
+
+    def test_audit_time_logs_reports_only_drift(self):
+        with fake_kaiten(COMPANY) as kaiten:
+            cards = [c for c in kaiten.company.cards if str(c[2]) == self.board_id]
+            out = io.StringIO()
+            call_command("audit_time_logs", space=self.space_id, board=self.board_id, runs=2, stdout=out)
+        # карточки доски одной страницей + по два запроса списаний на карточку
+        self.assertEqual(kaiten.calls["time-logs"], 2 * len(cards))
+        self.assertEqual(TimeLogAuditSnapshot.objects.filter(domain="lecap").count(), len(cards))
+        self.assertNotIn("✖", out.getvalue())
+        self.assertNotIn("~", out.getvalue())
+
+        # у одной карточки списания изменились с прошлого аудита
+        changed_id, time_logs = cards[0][0], Company.time_logs
+
+        def edited_time_logs(company, card):
+            logs = time_logs(company, card)
+            if card[0] == changed_id and logs:
+                logs[0] = {**logs[0], "time_spent": logs[0]["time_spent"] + 15}
+            return logs
+
+        with fake_kaiten(COMPANY), mock.patch.object(Company, "time_logs", edited_time_logs):
+            out = io.StringIO()
+            call_command("audit_time_logs", space=self.space_id, board=self.board_id, runs=1, stdout=out)
+        drifted = [line for line in out.getvalue().splitlines() if line.startswith("~")]
+        self.assertEqual(len(drifted), 1)
+        self.assertIn(str(changed_id), drifted[0])
+
+
+WEBHOOK_SAMPLES = Path(__file__).resolve().parent / "kaiten_webhook_samples"
+
+
+@mock.patch.object(kaiten_webhooks, "WEBHOOK_SECRET", "webhook-secret")
+class KaitenWebhookTests(TestCase):
+    """Записанные события Kaiten, отправленные на приёмник, как их отправил бы Kaiten."""
+
+    @classmethod
+    def setUpTestData(cls):
+        AdminSettings.objects.create(pk=1, url_domain_value_id="lecap", api_auth_key="token")
+
+    def _post(self, name, signature=None):
+        body = (WEBHOOK_SAMPLES / name).read_bytes()
+        return self.client.post(
+            reverse("kaiten_webhook"), body, content_type="application/json",
+            headers={"X-Kaiten-Signature": signature or kaiten_webhooks.sign(body)},
+        )
+
+    def test_rejects_bad_signature(self):
+        response = self._post("time_log_add.json", signature="sha256=" + "0" * 64)
+        self.assertEqual(response.status_code, 403)
+        self.assertFalse(KaitenWebhookEvent.objects.exists())
+
+    def test_time_log_event_updates_watermark_and_checkpoints(self):
+        checkpoint = ReportCheckpoint.objects.create(key="k", domain="lecap")
+        ReportCheckpointCard.objects.create(checkpoint=checkpoint, card_id="1001", logs=[])
+        ReportCheckpointCard.objects.create(checkpoint=checkpoint, card_id="1002", logs=[])
+
+        response = self._post("time_log_add.json")
+        self.assertEqual(response.status_code, 202)
+        self.assertTrue(response.json()["processed"])
+        watermark = CardTimeLogWatermark.objects.get(domain="lecap", card_id="1001")
+        self.assertEqual(watermark.last_log_at, datetime(2025, 11, 5, 12, tzinfo=timezone.utc))
+        self.assertEqual(list(checkpoint.cards.values_list("card_id", flat=True)), ["1002"])
+
+        # повторная доставка не ставит событие в очередь второй раз
+        self.assertEqual(self._post("time_log_add.json").status_code, 202)
+        self.assertEqual(KaitenWebhookEvent.objects.count(), 1)
+
+        self.assertEqual(self._post("card_delete.json").status_code, 202)
+        self.assertFalse(CardTimeLogWatermark.objects.filter(card_id="1001").exists())
+
+    def test_board_event_invalidates_cached_boards(self):
+        with fake_kaiten(COMPANY) as kaiten:
+            space_id = kaiten.company.spaces[0]["id"]
+            fetch_kaiten_boards("lecap", "token", space_id)
+            fetch_kaiten_boards("lecap", "token", space_id)
+            self.assertEqual(kaiten.calls["boards"], 1)
+            self.assertEqual(self._post("board_update.json").status_code, 202)
+            fetch_kaiten_boards("lecap", "token", space_id)
+        self.assertEqual(kaiten.calls["boards"], 2)
+
+    def test_board_event_forgets_mirror_scopes(self):
+        for scope in ("boards:10", "columns:20", "lanes:20", "board-roles:10:20", "columns:21", "spaces"):
+            KaitenSyncState.objects.create(domain="lecap", scope=scope, synced_at=datetime.now(timezone.utc))
+        self.assertEqual(self._post("board_update.json").status_code, 202)
+        self.assertEqual(sorted(KaitenSyncState.objects.values_list("scope", flat=True)), ["columns:21", "spaces"])
+
+    def test_failed_event_stays_queued(self):
+        with mock.patch.object(kaiten_webhooks, "record_time_log_watermarks", side_effect=RuntimeError("БД недоступна")):
+            response = self._post("time_log_add.json")
+        self.assertEqual(response.status_code, 202)
+        self.assertFalse(response.json()["processed"])
+        event = KaitenWebhookEvent.objects.get()
+        self.assertEqual((event.attempts, event.error), (1, "БД недоступна"))
+
+        call_command("process_kaiten_webhooks", stdout=io.StringIO())
+        event.refresh_from_db()
+        self.assertIsNotNone(event.processed_at)
+        self.assertTrue(CardTimeLogWatermark.objects.filter(card_id="1001").exists())
+
+
+class TimeLogsConcurrencyTests(SimpleTestCase):
+    """Списания по карточкам загружаются параллельно, ошибка одной карточки не прерывает остальные."""
+
+    def test_cards_are_fetched_concurrently(self):
+        lock, active, peak = threading.Lock(), [0], [0]
+
+        def time_logs(client, card_id):
+            with lock:
+                active[0] += 1
+                peak[0] = max(peak[0], active[0])
+            time.sleep(0.05)
+            with lock:
+                active[0] -= 1
+            if card_id == 3:
+                raise requests.ConnectionError("обрыв")
+            return [TimeLogRecord(id=card_id, card_id=card_id)]
+
+        with mock.patch.object(KaitenClient, "time_logs", time_logs):
+            results = {card_id: (logs, error) for card_id, logs, error in kaiten_api.iter_kaiten_time_logs("lecap", "token", [1, 2, 3, 4], max_workers=4)}
+        self.assertGreater(peak[0], 1)
+        self.assertEqual(results[1], ([TimeLogRecord(id=1, card_id=1)], None))
+        self.assertEqual(results[3][0], [])
+        self.assertIsInstance(results[3][1], requests.ConnectionError)
+
+    def test_card_failure_is_logged_as_warning(self):
+        kaiten = KaitenClient("lecap", "token")
+        with mock.patch.object(kaiten, "get_records", side_effect=requests.ConnectionError("обрыв")), \
+                self.assertLogs("kaiten", "WARNING") as logs, self.assertRaises(requests.ConnectionError):
+            kaiten.time_logs(3)
+        self.assertIn("карточки 3", logs.output[0])
+
+    def test_priority_reaches_pool_threads(self):
+        seen = []
+        with mock.patch.object(KaitenClient, "time_logs", lambda client, card_id: seen.append(kaiten_api._PRIORITY.get()) or []), \
+                kaiten_api.kaiten_priority(kaiten_api.PRIORITY_REPORT):
+            list(kaiten_api.iter_kaiten_time_logs("lecap", "token", [1, 2]))
+        self.assertEqual(seen, [kaiten_api.PRIORITY_REPORT] * 2)
+
+    def test_bulk_splits_logs_and_failures(self):
+        def time_logs(client, card_id):
+            if card_id == 2:
+                raise requests.ConnectionError("обрыв")
+            return [{"id": card_id, "card_id": card_id}]
+
+        with mock.patch.object(KaitenClient, "time_logs", time_logs):
+            logs_by_card, failures = kaiten_api.fetch_kaiten_time_logs_bulk("lecap", "token", [1, 2])
+        self.assertEqual(logs_by_card, {1: [{"id": 1, "card_id": 1}]})
+        self.assertEqual(list(failures), [2])
+
+
+class KaitenClientPoolTests(SimpleTestCase):
+    """Один клиент на учётные данные, у каждого потока своя сессия поверх общего пула."""
+
+    def test_client_is_shared_per_credentials(self):
+        client = kaiten_api.get_kaiten_client("pool", "token-a")
+        self.assertIs(kaiten_api.get_kaiten_client("pool", "token-a"), client)
+        self.assertIsNot(kaiten_api.get_kaiten_client("pool", "token-b"), client)
+
+    def test_thread_sessions_share_blocking_adapter(self):
+        client = KaitenClient("pool", "token", pool_maxsize=3)
+        sessions = []
+        worker = threading.Thread(target=lambda: sessions.append(client.session))
+        worker.start()
+        worker.join()
+        self.assertIs(client.session, client.session)
+        self.assertIsNot(sessions[0], client.session)
+        adapter = client.session.get_adapter(client.base_url)
+        self.assertIs(sessions[0].get_adapter(client.base_url), adapter)
+        self.assertEqual((adapter._pool_maxsize, adapter._pool_block), (3, True))
+
+
+@override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "lecap-tests"}})
+class AsyncAjaxViewTests(TestCase):
+    """AJAX-представления асинхронные, зеркало Kaiten читается в потоке через sync_to_async."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user("staff@example.com", "password")
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def test_ajax_views_are_coroutines(self):
+        for view in (views.get_boards, views.get_statuses, views.get_swimlanes, views.get_custom_field_values):
+            self.assertTrue(asyncio.iscoroutinefunction(view))
+
+    def test_swimlanes_are_served_from_mirror(self):
+        calls = []
+
+        def swimlanes(client, board_id):
+            calls.append(board_id)
+            return [{"id": 1, "title": "Основная"}]
+
+        with mock.patch.object(KaitenClient, "swimlanes", swimlanes):
+            first = self.client.get(reverse("get_swimlanes"), {"board_id": "7"})
+            second = self.client.get(reverse("get_swimlanes"), {"board_id": "7"})
+        self.assertEqual(first.json(), {"lanes": [{"id": 1, "title": "Основная"}]})
+        self.assertEqual(second.json(), first.json())
+        self.assertEqual(len(calls), 1)
+
+    def test_kaiten_error_returns_empty_list(self):
+        with mock.patch.object(KaitenClient, "board_statuses", side_effect=requests.ConnectionError("обрыв")):
+            response = self.client.get(reverse("get_statuses"), {"space_id": "1", "board_id": "7"})
+        self.assertEqual(response.json(), {"statuses": []})
+
+
+class SharedTokenBucketTests(SimpleTestCase):
+    """Ведро в файле состояния общее для всех дескрипторов и процессов, токены восстанавливаются со временем."""
+
+    def setUp(self):
+        state_dir = tempfile.mkdtemp(prefix="lecap-ratelimit-")
+        self.addCleanup(shutil.rmtree, state_dir, ignore_errors=True)
+        self.path = os.path.join(state_dir, "ratelimit.state")
+
+    def _bucket(self, interval=0.1, burst=2):
+        bucket = kaiten_ratelimit.SharedTokenBucket(self.path, interval=interval, burst=burst)
+        self.addCleanup(bucket.close)
+        return bucket
+
+    def test_tokens_are_shared_and_refilled(self):
+        first, second = self._bucket(), self._bucket()
+        self.assertEqual(first.acquire(), 0.0)
+        self.assertEqual(first.acquire(), 0.0)
+        # ведро пусто для любого дескриптора; отказ по max_wait слот не резервирует
+        self.assertIsNone(second.acquire(max_wait=0))
+        time.sleep(0.12)
+        self.assertEqual(second.acquire(max_wait=0), 0.0)
+
+    def test_bucket_is_shared_between_processes(self):
+        code = (
+            "from LecapProject.kaiten_ratelimit import SharedTokenBucket; "
+            f"b = SharedTokenBucket({self.path!r}, interval=10, burst=2); b.acquire(); b.acquire()"
+        )
+        subprocess.run([sys.executable, "-c", code], check=True, cwd=settings.BASE_DIR)
+        self.assertIsNone(self._bucket(interval=10).acquire(max_wait=1))
+
+    def test_pause_until_delays_next_slot(self):
+        bucket = self._bucket()
+        bucket.pause_until(time.time() + 0.3)
+        self.assertIsNone(bucket.acquire(max_wait=0.1))
+        self.assertGreater(bucket.acquire(), 0.15)
+
+
+def _response(status, body=b"[]", headers=None):
+    resp = requests.Response()
+    resp.status_code, resp._content, resp.raw = status, body, io.BytesIO(body)
+    resp.headers.update(headers or {})
+    return resp
+
+
+class AdaptivePacerTests(SimpleTestCase):
+    """Интервал общего ведра подстраивается по заголовкам rate limit и ответам 429."""
+
+    def setUp(self):
+        self.bucket = self.enterContext(isolated_rate_limiter())
+        self.bucket.set_interval(0.35)
+        self.pacer = kaiten_api.AdaptivePacer(self.bucket, baseline=0.35, floor=0.1, ceiling=5)
+
+    def test_quota_headers_slow_down_at_once_and_speed_up_gradually(self):
+        self.pacer.observe(_response(200, headers={"X-RateLimit-Remaining": "11", "X-RateLimit-Reset": "10"}))
+        self.assertAlmostEqual(self.bucket.current_interval(), 1.0)
+        self.pacer.observe(_response(200, headers={"X-RateLimit-Remaining": "1000", "X-RateLimit-Reset": "10"}))
+        self.assertAlmostEqual(self.bucket.current_interval(), (1.0 + 0.1) / 2)
+
+    def test_throttled_response_doubles_interval_and_pauses(self):
+        wait = self.pacer.on_throttled(_response(429, headers={"Retry-After": "0.3"}), attempt=0)
+        self.assertEqual(wait, 0.3)
+        self.assertAlmostEqual(self.bucket.current_interval(), 0.7)
+        self.assertIsNone(self.bucket.acquire(max_wait=0.2))
+
+    def test_interval_returns_to_baseline_without_headers(self):
+        self.bucket.set_interval(0.7)
+        for _ in range(20):
+            self.pacer.observe(_response(200))
+        self.assertAlmostEqual(self.bucket.current_interval(), 0.35)
+
+
+class PrioritySchedulerTests(SimpleTestCase):
+    """Очередь на токены: интерактивные запросы обгоняют фоновые, ожидание ограничено max_wait."""
+
+    class GatedBucket:
+        """Ведро, которое не отдаёт первый слот до gate.set() и записывает порядок выдачи."""
+
+        def __init__(self):
+            self.gate, self.order = threading.Event(), []
+
+        def acquire(self, max_wait=None):
+            self.order.append(threading.current_thread().name)
+            if len(self.order) == 1:
+                self.gate.wait(5)
+            return 0.0
+
+    def _start(self, scheduler, name, priority):
+        thread = threading.Thread(target=scheduler.acquire, args=(priority,), name=name)
+        thread.start()
+        self.addCleanup(thread.join, 5)
+        return thread
+
+    def _occupy(self, scheduler, bucket):
+        self._start(scheduler, "busy", kaiten_api.PRIORITY_BACKGROUND)
+        self.addCleanup(bucket.gate.set)
+        while not bucket.order:
+            time.sleep(0.01)
+
+    def _wait_pending(self, scheduler, count):
+        for _ in range(500):
+            if scheduler.pending() == count:
+                return
+            time.sleep(0.01)
+        self.fail(f"в очереди {scheduler.pending()}, ожидалось {count}")
+
+    def test_interactive_goes_before_background(self):
+        bucket = self.GatedBucket()
+        scheduler = kaiten_ratelimit.PriorityScheduler(bucket)
+        self._occupy(scheduler, bucket)
+        self._start(scheduler, "background", kaiten_api.PRIORITY_BACKGROUND)
+        self._wait_pending(scheduler, 1)
+        self._start(scheduler, "report", kaiten_api.PRIORITY_REPORT)
+        self._start(scheduler, "interactive", kaiten_api.PRIORITY_INTERACTIVE)
+        self._wait_pending(scheduler, 3)
+        bucket.gate.set()
+        self._wait_pending(scheduler, 0)
+        for _ in range(500):
+            if len(bucket.order) == 4:
+                break
+            time.sleep(0.01)
+        self.assertEqual(bucket.order, ["busy", "interactive", "report", "background"])
+
+    def test_gives_up_after_max_wait(self):
+        bucket = self.GatedBucket()
+        scheduler = kaiten_ratelimit.PriorityScheduler(bucket)
+        self._occupy(scheduler, bucket)
+        self.assertIsNone(scheduler.acquire(kaiten_api.PRIORITY_INTERACTIVE, max_wait=0.05))
+        self.assertEqual(scheduler.pending(), 0)
+
+
+@mock.patch.object(kaiten_api, "_throttle", return_value=0.0)
+class KaitenHttpTests(SimpleTestCase):
+    """Политика повторов _do_http_request на подставленных ответах (без сети и токен-бакета)."""
+    URL = "https://http.kaiten.ru/api/latest/cards"
+
+    def setUp(self):
+        self.enterContext(isolated_rate_limiter())
+
+    def test_server_errors_are_retried_for_idempotent_methods_only(self, _throttle):
+        with mock.patch.object(kaiten_api, "_send", side_effect=[_response(503, headers={"Retry-After": "0"}), _response(200)]) as send:
+            resp, _ = kaiten_api._do_http_request("GET", self.URL, headers={})
+        self.assertEqual((resp.status_code, send.call_count), (200, 2))
+        with mock.patch.object(kaiten_api, "_send", return_value=_response(503, headers={"Retry-After": "0"})) as send:
+            resp, _ = kaiten_api._do_http_request("POST", self.URL, headers={})
+        self.assertEqual((resp.status_code, send.call_count), (503, 1))
+
+    def test_deadline_caps_timeout_and_stops_requests(self, _throttle):
+        with kaiten_api.kaiten_deadline(3), mock.patch.object(kaiten_api, "_send", return_value=_response(200)) as send:
+            kaiten_api._do_http_request("GET", self.URL, headers={}, timeout=(5, 60))
+            with kaiten_api.kaiten_deadline(60):
+                # вложенный бюджет не продлевает внешний
+                self.assertLessEqual(kaiten_api.remaining_budget(), 3)
+        self.assertTrue(all(t <= 3 for t in send.call_args.kwargs["timeout"]))
+        self.assertIsNone(kaiten_api.remaining_budget())
+
+        with kaiten_api.kaiten_deadline(kaiten_api.HTTP_MIN_ATTEMPT_BUDGET / 2), \
+                mock.patch.object(kaiten_api, "_send") as send, self.assertRaises(KaitenDeadlineExceeded):
+            kaiten_api._do_http_request("GET", self.URL, headers={})
+        send.assert_not_called()
+
+    def test_throttled_responses_are_closed_before_retry(self, _throttle):
+        throttled = _response(429, headers={"Retry-After": "0"})
+        throttled.close = mock.Mock()
+        with mock.patch.object(kaiten_api, "_send", side_effect=[throttled, _response(200)]), \
+                mock.patch.object(kaiten_api._PACER, "on_throttled", return_value=0.0):
+            resp, _ = kaiten_api._do_http_request("GET", self.URL, headers={}, endpoint="cards")
+        self.assertEqual(resp.status_code, 200)
+        throttled.close.assert_called_once_with()
+
+
+class SingleFlightTests(SimpleTestCase):
+    """Одинаковые одновременные запросы выполняются один раз, результат или ошибка достаются всем."""
+
+    def _run_concurrently(self, fn, followers=3):
+        flight, entered, release = kaiten_api.SingleFlight(), threading.Event(), threading.Event()
+        calls, results = [], []
+
+        def leader_fn():
+            calls.append(1)
+            entered.set()
+            release.wait(5)
+            return fn()
+
+        def call():
+            try:
+                results.append(flight.do("key", leader_fn))
+            except Exception as e:
+                results.append(e)
+
+        threads = [threading.Thread(target=call)]
+        threads[0].start()
+        entered.wait(5)
+        threads += [threading.Thread(target=call) for _ in range(followers)]
+        for thread in threads[1:]:
+            thread.start()
+        time.sleep(0.05)
+        release.set()
+        for thread in threads:
+            thread.join(5)
+        return len(calls), results
+
+    def test_followers_share_leader_result(self):
+        calls, results = self._run_concurrently(lambda: {"id": 1})
+        self.assertEqual(calls, 1)
+        self.assertEqual(results, [{"id": 1}] * 4)
+
+    def test_followers_receive_leader_error(self):
+        def fail():
+            raise requests.ConnectionError("обрыв")
+
+        calls, results = self._run_concurrently(fail)
+        self.assertEqual(calls, 1)
+        self.assertTrue(all(isinstance(result, requests.ConnectionError) for result in results))
+
+    def test_flight_key_depends_on_credentials_and_params(self):
+        key = kaiten_api._flight_key("GET", "https://x/cards", {"Authorization": "Bearer a"}, {"a": 1, "b": 2})
+        self.assertEqual(key, kaiten_api._flight_key("GET", "https://x/cards", {"Authorization": "Bearer a"}, {"b": 2, "a": 1}))
+        self.assertNotEqual(key, kaiten_api._flight_key("GET", "https://x/cards", {"Authorization": "Bearer b"}, {"a": 1, "b": 2}))
+
+
+@mock.patch.object(kaiten_api, "_throttle", return_value=0.0)
+class ConditionalGetTests(SimpleTestCase):
+    """Условные GET метаданных: 304 отдаёт сохранённый разобранный ответ."""
+    SPACES = [{"id": 1, "title": "Проект"}]
+
+    def setUp(self):
+        self.enterContext(isolated_rate_limiter())
+        self.addCleanup(kaiten_api._VALIDATORS.clear)
+        self.kaiten = KaitenClient("conditional", "token")
+        self.sent = []
+
+    def _send(self, *responses):
+        responses = list(responses)
+
+        def send(session, method, url, *, headers, **kwargs):
+            self.sent.append(dict(headers))
+            response = responses.pop(0)
+            return response() if callable(response) else response
+        return mock.patch.object(kaiten_api, "_send", send)
+
+    def _ok(self):
+        return _response(200, json.dumps(self.SPACES).encode(), headers={"ETag": '"v1"'})
+
+    def test_not_modified_reuses_stored_payload(self, _throttle):
+        with self._send(self._ok(), _response(304, b"", headers={"ETag": '"v1"'})):
+            first = self.kaiten.get_json("/spaces", endpoint="spaces")
+            first[0]["title"] = "изменено вызывающим"
+            second = self.kaiten.get_json("/spaces", endpoint="spaces")
+        self.assertNotIn("If-None-Match", self.sent[0])
+        self.assertEqual(self.sent[1]["If-None-Match"], '"v1"')
+        self.assertEqual(second, self.SPACES)
+
+    def test_not_modified_after_eviction_refetches_unconditionally(self, _throttle):
+        def evicted():
+            kaiten_api._VALIDATORS.clear()
+            return _response(304, b"")
+
+        with self._send(self._ok(), evicted, self._ok()):
+            self.kaiten.get_json("/spaces", endpoint="spaces")
+            data = self.kaiten.get_json("/spaces", endpoint="spaces")
+        self.assertEqual(data, self.SPACES)
+        self.assertNotIn("If-None-Match", self.sent[2])
+
+    def test_validator_store_is_bounded(self, _throttle):
+        store = kaiten_api.ValidatorStore(size=2)
+        for key in ("a", "b", "c"):
+            store.remember(key, _response(200, headers={"ETag": f'"{key}"'}), [key])
+        self.assertIsNone(store.payload("a"))
+        self.assertEqual(store.payload("c"), ["c"])
+        store.remember("d", _response(200), ["без валидаторов"])
+        self.assertEqual(store.conditional_headers("d"), {})
+
+
+@override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "lecap-tests"}})
+@mock.patch.object(kaiten_cache, "GENERATION_CHECK_INTERVAL", 0)
+class TwoTierCacheTests(SimpleTestCase):
+    """L1 в процессе + L2 общий для воркеров; устаревшее отдаётся сразу и обновляется в фоне."""
+
+    def setUp(self):
+        self.prefix = f"test-{self.id()}"
+        self.values = iter(range(100))
+
+    def _cache(self, fresh_ttl=60):
+        cache = kaiten_cache.TwoTierCache(self.prefix, l1_size=10, fresh_ttl=fresh_ttl, stale_ttl=60, lkg_ttl=60)
+        self.addCleanup(cache._refresh_pool.shutdown)
+        return cache
+
+    def _fetch(self):
+        return [next(self.values)]
+
+    def test_second_worker_reads_shared_tier(self):
+        first, second = self._cache(), self._cache()
+        self.assertEqual(first.get_or_fetch("boards", ("1",), self._fetch), [0])
+        self.assertEqual(first.get_or_fetch("boards", ("1",), self._fetch), [0])
+        self.assertEqual(second.get_or_fetch("boards", ("1",), self._fetch), [0])
+        self.assertEqual((first.stats["l1_hit"], second.stats["l2_hit"]), (1, 1))
+
+    def test_stale_value_is_served_while_refreshing(self):
+        cache = self._cache(fresh_ttl=0)
+        self.assertEqual(cache.get_or_fetch("boards", ("1",), self._fetch), [0])
+        self.assertEqual(cache.get_or_fetch("boards", ("1",), self._fetch), [0])
+        for _ in range(100):
+            if not cache._refreshing:
+                break
+            time.sleep(0.01)
+        self.assertEqual(cache.get_or_fetch("boards", ("1",), self._fetch), [1])
+        self.assertGreaterEqual(cache.stats["stale"], 2)
+
+    def test_invalidate_reaches_other_workers_but_keeps_last_good(self):
+        first, second = self._cache(), self._cache()
+        first.get_or_fetch("boards", ("1",), self._fetch)
+        second.get_or_fetch("boards", ("1",), self._fetch)
+        first.invalidate("boards")
+        self.assertEqual(second.get_or_fetch("boards", ("1",), self._fetch), [1])
+        first.invalidate()
+        value, age = first.last_good("boards", ("1",))
+        self.assertEqual(value, [1])
+        self.assertLess(age, 5)
+
+
+class KaitenMirrorTests(TestCase):
+    """Чтение областей зеркала и их обновление по ?refresh=1."""
+
+    def test_preload_reads_only_requested_scopes(self):
+        for space_id, board_id in (("1", "10"), ("1", "11"), ("2", "10")):
+            kaiten_mirror.store("lecap", "board-roles", (space_id, board_id), [{"id": int(board_id), "name": f"{space_id}/{board_id}"}])
+        with CaptureQueriesContext(connection) as queries:
+            view = kaiten_mirror.preload("lecap", "token", "board-roles", [("1", "10"), ("2", "10")])
+        self.assertEqual(view.peek("1", "10"), [{"id": 10, "name": "1/10"}])
+        self.assertEqual(view.peek("2", "10"), [{"id": 10, "name": "2/10"}])
+        self.assertIn('"board_id" IN', queries[-1]["sql"])
+        self.assertIn('"space_id" IN', queries[-1]["sql"])
+
+    def test_refresh_keeps_validators_of_other_kinds(self):
+        resp = _response(200, headers={"ETag": '"v1"'})
+        kaiten_api._VALIDATORS.remember("boards-key", resp, [], "boards")
+        kaiten_api._VALIDATORS.remember("users-key", resp, [], "users")
+        self.addCleanup(kaiten_api._VALIDATORS.clear)
+        kaiten_mirror.preload("lecap", "token", "boards", [], refresh=True)
+        self.assertEqual(kaiten_api._VALIDATORS.conditional_headers("boards-key"), {})
+        self.assertEqual(kaiten_api._VALIDATORS.conditional_headers("users-key"), {"If-None-Match": '"v1"'})
+
+
+@mock.patch.dict(kaiten_api._BULK_UNSUPPORTED, clear=True)
+class TimeLogsBetweenTests(SimpleTestCase):
+    """Ответ /time-logs за период, не учитывающий параметры, заменяется загрузкой по карточкам."""
+
+    def test_logs_outside_period_fall_back_to_per_card(self):
+        logs = [TimeLogRecord(id=1, card_id=10, created="2025-11-05T10:00:00Z"), TimeLogRecord(id=2, card_id=11, created="2024-03-01T10:00:00Z")]
+        per_card = ({10: [], 11: [], 12: []}, {})
+        with mock.patch.object(KaitenClient, "iter_time_logs_between", return_value=iter(logs)), \
+                mock.patch.object(kaiten_api, "fetch_kaiten_time_logs_bulk", return_value=per_card) as fallback:
+            result = kaiten_api.fetch_kaiten_time_logs_between("lecap", "token", [10, 11, 12], "2025-11-01", "2025-11-30")
+        self.assertEqual(result, per_card)
+        fallback.assert_called_once()
+        self.assertIn("lecap", kaiten_api._BULK_UNSUPPORTED)
+
+    def test_logs_near_period_bounds_are_accepted(self):
+        # сутки запаса: сервер считает даты в часовом поясе компании, поэтому и запрос шире периода
+        logs = [TimeLogRecord(id=1, card_id=10, created="2025-10-31T22:00:00Z"), TimeLogRecord(id=2, card_id=12, created="2025-11-30T23:00:00Z")]
+        with mock.patch.object(KaitenClient, "iter_time_logs_between", return_value=iter(logs)) as between, \
+                mock.patch.object(KaitenClient, "time_logs", return_value=[logs[0]]):
+            logs_by_card, failures = kaiten_api.fetch_kaiten_time_logs_between("lecap", "token", [10, 11, 12], "2025-11-01", "2025-11-30")
+        self.assertEqual((logs_by_card, failures), ({10: [logs[0]], 11: [], 12: [logs[1]]}, {}))
+        self.assertEqual(between.call_args.args, ("2025-10-31", "2025-12-01"))
+
+    def test_logs_missing_for_checked_card_fall_back_to_per_card(self):
+        # сервер отбирает период не по дате создания: у карточки 10 одно списание периода потеряно
+        logs = [TimeLogRecord(id=1, card_id=10, created="2025-11-05T10:00:00Z"), TimeLogRecord(id=2, card_id=11, created="2025-11-06T10:00:00Z")]
+        card_logs = [logs[0], TimeLogRecord(id=3, card_id=10, created="2025-11-20T10:00:00Z"), TimeLogRecord(id=4, card_id=10, created="2025-12-10T10:00:00Z")]
+        per_card = ({10: card_logs, 11: [logs[1]], 12: []}, {})
+        with mock.patch.object(KaitenClient, "iter_time_logs_between", return_value=iter(logs)), \
+                mock.patch.object(KaitenClient, "time_logs", return_value=card_logs) as time_logs, \
+                mock.patch.object(kaiten_api, "fetch_kaiten_time_logs_bulk", return_value=per_card) as fallback:
+            result = kaiten_api.fetch_kaiten_time_logs_between("lecap", "token", [10, 11, 12], "2025-11-01", "2025-11-30")
+        time_logs.assert_called_once_with(10)
+        self.assertEqual(result, per_card)
+        fallback.assert_called_once()
+        self.assertIn("lecap", kaiten_api._BULK_UNSUPPORTED)
+
+    def test_failed_cross_check_falls_back_without_disabling_bulk(self):
+        logs = [TimeLogRecord(id=1, card_id=10, created="2025-11-05T10:00:00Z")]
+        per_card = ({10: logs, 11: [], 12: []}, {})
+        with mock.patch.object(KaitenClient, "iter_time_logs_between", return_value=iter(logs)), \
+                mock.patch.object(KaitenClient, "time_logs", side_effect=requests.ConnectionError("обрыв")), \
+                mock.patch.object(kaiten_api, "fetch_kaiten_time_logs_bulk", return_value=per_card) as fallback:
+            result = kaiten_api.fetch_kaiten_time_logs_between("lecap", "token", [10, 11, 12], "2025-11-01", "2025-11-30")
+        self.assertEqual(result, per_card)
+        fallback.assert_called_once()
+        self.assertNotIn("lecap", kaiten_api._BULK_UNSUPPORTED)
+
+
+@mock.patch.object(kaiten_api, "_throttle", return_value=0.0)
+class CircuitBreakerTests(SimpleTestCase):
+    """
+    Разомкнутая цепь сразу отклоняет запросы, пробный запрос half-open её замыкает
+    или освобождается, если завершился без ответа.
+    Пока цепь разомкнута, метаданные отдаются из last-known-good с пометкой устаревших.
+    """
+    URL = "https://breaker.kaiten.ru/api/latest/cards"
+
+    def setUp(self):
+        self.enterContext(isolated_rate_limiter())
+        self.breaker = kaiten_api.CircuitBreaker("breaker.kaiten.ru:cards", failure_threshold=1, reset_timeout=0.05)
+        patcher = mock.patch.dict(kaiten_api._BREAKERS, {self.breaker.name: self.breaker})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.breaker.record_failure()
+        self.assertEqual(self.breaker.state, self.breaker.OPEN)
+
+    def _request(self):
+        return kaiten_api._do_http_request("GET", self.URL, headers={}, endpoint="cards")
+
+    def test_open_breaker_fails_fast(self, _throttle):
+        with mock.patch.object(kaiten_api, "_send") as send, self.assertRaises(kaiten_api.KaitenUnavailableError):
+            self._request()
+        send.assert_not_called()
+
+    def test_successful_probe_closes_breaker(self, _throttle):
+        time.sleep(0.06)
+        with mock.patch.object(kaiten_api, "_send", return_value=_response(200)):
+            resp, _ = self._request()
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(self.breaker.state, self.breaker.CLOSED)
+
+    def test_probe_answered_with_429_closes_breaker(self, _throttle):
+        responses = [_response(429, headers={"Retry-After": "0"}), _response(200)]
+        time.sleep(0.06)
+        with mock.patch.object(kaiten_api, "_send", side_effect=responses), \
+                mock.patch.object(kaiten_api._PACER, "on_throttled", return_value=0.0):
+            resp, _ = self._request()
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(self.breaker.state, self.breaker.CLOSED)
+
+    def test_probe_out_of_budget_releases_breaker(self, _throttle):
+        time.sleep(0.06)
+        _throttle.side_effect = KaitenDeadlineExceeded("очередь длиннее бюджета")
+        with self.assertRaises(KaitenDeadlineExceeded):
+            self._request()
+
+        # следующий запрос снова пробный и, получив ответ, замыкает цепь
+        _throttle.side_effect = None
+        with mock.patch.object(kaiten_api, "_send", return_value=_response(200)):
+            resp, _ = self._request()
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(self.breaker.state, self.breaker.CLOSED)
+
+    def test_lost_probe_is_replaced_after_reset_timeout(self, _throttle):
+        time.sleep(0.06)
+        self.assertTrue(self.breaker.before_call())
+        with self.assertRaises(kaiten_api.KaitenUnavailableError):
+            self.breaker.before_call()
+        time.sleep(0.06)
+        self.assertTrue(self.breaker.before_call())
+
+    @override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "lecap-breaker"}})
+    def test_open_breaker_serves_last_known_good(self, _throttle):
+        boards = [{"id": "7", "title": "Доска"}]
+        with mock.patch.object(KaitenClient, "boards", return_value=boards):
+            self.assertEqual(fetch_kaiten_boards("breaker", "token", 1), boards)
+        kaiten_api.invalidate_kaiten_cache("boards")
+        self.addCleanup(kaiten_api.invalidate_kaiten_cache)
+        boards_breaker = kaiten_api.CircuitBreaker("breaker.kaiten.ru:boards", failure_threshold=1)
+        kaiten_api._BREAKERS[boards_breaker.name] = boards_breaker
+        boards_breaker.record_failure()
+        self.assertTrue(kaiten_api.is_kaiten_degraded("breaker"))
+
+        with mock.patch.object(KaitenClient, "boards", side_effect=AssertionError("Kaiten не должен вызываться")):
+            result = fetch_kaiten_boards("breaker", "token", 1)
+        self.assertEqual(result, boards)
+        self.assertTrue(kaiten_cache.is_stale(result))
+
+
+class PaginateTests(SimpleTestCase):
+    """Постраничная загрузка: конец по неполной странице, предзагрузка следующей, защита от игнорирования offset."""
+
+    def setUp(self):
+        self.kaiten = KaitenClient("paginate", "token")
+        self.offsets = []
+
+    def _serve(self, items, ignore_offset=False):
+        def get_json(path, *, endpoint, params=None, timeout=None):
+            self.offsets.append(params["offset"])
+            offset = 0 if ignore_offset else params["offset"]
+            return items[offset:offset + params["limit"]]
+        return mock.patch.object(self.kaiten, "get_json", side_effect=get_json)
+
+    def _items(self, count):
+        return [{"id": i} for i in range(count)]
+
+    def test_short_page_ends_pagination(self):
+        with self._serve(self._items(7)):
+            items = list(self.kaiten.paginate("/users", endpoint="users", page_size=3))
+        self.assertEqual(items, self._items(7))
+        self.assertEqual(self.offsets, [0, 3, 6])
+
+    def test_empty_page_after_full_pages(self):
+        with self._serve(self._items(6)):
+            self.assertEqual(len(list(self.kaiten.paginate("/users", endpoint="users", page_size=3))), 6)
+        self.assertEqual(self.offsets, [0, 3, 6])
+
+    def test_next_page_is_prefetched(self):
+        with self._serve(self._items(7)):
+            pages = self.kaiten.paginate("/users", endpoint="users", page_size=3)
+            next(pages)
+            for _ in range(100):
+                if 3 in self.offsets:
+                    break
+                time.sleep(0.01)
+            self.assertEqual(self.offsets, [0, 3])
+            pages.close()
+
+    def test_repeated_page_stops_or_raises_in_strict_mode(self):
+        with self._serve(self._items(7), ignore_offset=True):
+            self.assertEqual(list(self.kaiten.paginate("/time-logs", endpoint="time-logs-bulk", page_size=3)), self._items(3))
+            with self.assertRaises(kaiten_api.KaitenUnreliableListError):
+                list(self.kaiten.paginate("/time-logs", endpoint="time-logs-bulk", page_size=3, strict=True))
+
+
+class CardFilterTests(SimpleTestCase):
+    """Условия CardFilter компилируются в параметры /cards и отбирают карточки на стороне Kaiten."""
+
+    def test_compile_skips_empty_values(self):
+        card_filter = (
+            CardFilter(100).board("").lane(None).column(7)
+            .created(after=date(2025, 3, 1)).custom_property(1001, "5000").custom_property(1002, "")
+        )
+        params = card_filter.compile()
+        tree = json.loads(base64.b64decode(params.pop("filter")))
+        self.assertEqual(params, {"space_id": 100, "column_id": 7, "created_after": "2025-03-01"})
+        self.assertEqual(tree, {"key": "and", "value": [{"key": "and", "value": [
+            {"key": "custom_property", "comparison": "eq", "id": 1001, "type": "select", "value": 5000},
+        ]}]})
+        self.assertNotIn("filter", CardFilter(100).compile())
+
+    def test_filtered_cards_match_board_and_property(self):
+        with fake_kaiten(COMPANY) as kaiten:
+            space_id = kaiten.company.spaces[0]["id"]
+            board_id = kaiten.company.boards[space_id][0]["id"]
+            billing = kaiten.company.select_values[BILLING_PROPERTY_ID][0]["id"]
+            card_filter = CardFilter(space_id).board(board_id).custom_property(BILLING_PROPERTY_ID, billing)
+            cards = kaiten_api.fetch_kaiten_filtered_cards("lecap", "token", card_filter)
+        expected = [c[0] for c in kaiten.company.cards if c[2] == board_id and c[6] == billing]
+        self.assertTrue(expected)
+        self.assertEqual([card.get("id") for card in cards], expected)
+
+class StreamParseTests(SimpleTestCase):
+    """Потоковый разбор JSON-массива: куски режутся где угодно, элементы проецируются в компактные записи."""
+    ITEMS = [
+        {"id": 1, "comment": "Работа по задаче — «кавычки», \\\"экранирование\\\"", "time_spent": 30},
+        {"id": 2, "nested": {"list": [1, 2.5, None, True], "empty": {}}},
+        12345,
+        "строка ] с , разделителями [",
+    ]
+
+    def _chunks(self, data: bytes, size: int):
+        return (data[i:i + size] for i in range(0, len(data), size))
+
+    def test_items_survive_any_chunk_boundary(self):
+        body = json.dumps(self.ITEMS, ensure_ascii=False, indent=1).encode()
+        for size in (1, 2, 3, 7, 64, len(body)):
+            with self.subTest(size=size):
+                self.assertEqual(list(kaiten_records.iter_json_array(self._chunks(body, size))), self.ITEMS)
+
+    def test_number_split_at_chunk_end_is_not_truncated(self):
+        self.assertEqual(list(kaiten_records.iter_json_array([b"[1, 23", b"4]"])), [1, 234])
+        self.assertEqual(list(kaiten_records.iter_json_array([b"[12.", b"5]"])), [12.5])
+        self.assertEqual(list(kaiten_records.iter_json_array([b"[1, 2.5e", b"-3, 4]"])), [1, 2.5e-3, 4])
+
+    def test_non_array_and_broken_documents(self):
+        self.assertEqual(list(kaiten_records.iter_json_array([b' {"users": ', b"[]}"])), [{"users": []}])
+        self.assertEqual(list(kaiten_records.iter_json_array([b"  ", b""])), [])
+        with self.assertRaises(ValueError):
+            list(kaiten_records.iter_json_array([b'[{"id": 1}, {"id"']))
+
+    def test_time_log_record_keeps_only_needed_fields(self):
+        item = {
+            "id": 5, "card_id": 9, "time_spent": 60, "description": "лишнее",
+            "author": {"id": 100, "full_name": "Анна Иванова", "avatar_url": "https://example.com/a.png"},
+            "role": {"id": 10, "name": "Аналитик", "company_id": 1},
+        }
+        record = list(kaiten_records.iter_json_array([json.dumps([item]).encode()], TimeLogRecord.from_json))[0]
+        self.assertEqual(record.get("author"), {"id": 100, "full_name": "Анна Иванова"})
+        self.assertEqual(record["role"], {"id": 10, "name": "Аналитик"})
+        self.assertIsNone(record.get("description"))
+        self.assertNotIn("comment", record)
+        self.assertEqual(record.get("comment", ""), "")
+
+
+@mock.patch.object(kaiten_api, "_throttle", return_value=0.0)
+class CassetteTests(SimpleTestCase):
+    """Записанный обмен воспроизводится без сети: по порядку, с 304 на условный запрос и с имитацией 429."""
+    URL = "https://cassette.kaiten.ru/api/latest/spaces"
+
+    def setUp(self):
+        self.enterContext(isolated_rate_limiter())
+        self.addCleanup(kaiten_api._VALIDATORS.clear)
+        self.path = tempfile.mkdtemp(prefix="lecap-cassette-")
+        self.addCleanup(shutil.rmtree, self.path, ignore_errors=True)
+        recorder = kaiten_cassette.Cassette(self.path, "record")
+        for version in ("v1", "v2"):
+            body = json.dumps([{"id": 1, "title": version}]).encode()
+            resp = _response(200, body, headers={"ETag": f'"{version}"', "Set-Cookie": "secret"})
+            recorder.record("GET", self.URL, None, None, resp, 0.01)
+
+    def test_replay_returns_recorded_responses_in_order(self, _throttle):
+        cassette = kaiten_cassette.Cassette(self.path, "replay")
+        # домен и токен в ключ не входят
+        titles = [cassette.replay("GET", "https://other.kaiten.ru/api/latest/spaces").json()[0]["title"] for _ in range(3)]
+        self.assertEqual(titles, ["v1", "v2", "v2"])
+        self.assertNotIn("Set-Cookie", cassette.replay("GET", self.URL).headers)
+        with self.assertRaises(kaiten_cassette.CassetteMissError):
+            cassette.replay("GET", self.URL, params={"offset": 100})
+
+    def test_conditional_replay_produces_not_modified(self, _throttle):
+        kaiten = KaitenClient("cassette", "token")
+        with use_kaiten_cassette(self.path) as cassette:
+            first = kaiten.get_json("/spaces", endpoint="spaces")
+            # снова с начала кассеты: записанный ETag совпадает с If-None-Match — ответ 304 без тела
+            cassette._cursor.clear()
+            with mock.patch.object(cassette, "_read_body", side_effect=AssertionError("тело не читается на 304")):
+                second = kaiten.get_json("/spaces", endpoint="spaces")
+        self.assertEqual(first, second)
+
+    def test_replay_injects_throttling(self, _throttle):
+        cassette = kaiten_cassette.Cassette(self.path, "replay", error_rate=1.0, retry_after=2)
+        resp = cassette.replay("GET", self.URL)
+        self.assertEqual((resp.status_code, resp.headers["Retry-After"]), (429, "2"))
+
+
+class KaitenSimulatorTests(SimpleTestCase):
+    """Симулятор отвечает как Kaiten: авторизация, страницы с потолком limit, ETag/304 и лимит частоты."""
+    AUTH = {"Authorization": "Bearer token"}
+
+    def _simulator(self, **options):
+        return KaitenSimulator(SimulatorConfig(**{**vars(COMPANY), **options}))
+
+    def test_same_seed_builds_same_company(self):
+        self.assertEqual(self._simulator().company.cards, self._simulator().company.cards)
+        self.assertNotEqual(self._simulator().company.cards, self._simulator(seed=2).company.cards)
+
+    def test_auth_routes_and_pages(self):
+        simulator = self._simulator(max_limit=7)
+        self.assertEqual(simulator.handle("GET", "/api/latest/spaces", {})[0], 401)
+        self.assertEqual(simulator.handle("GET", "/api/latest/unknown", self.AUTH)[0], 404)
+        status, _, body, route = simulator.handle("GET", "/api/latest/cards?offset=5&limit=100", self.AUTH)
+        cards = json.loads(body)
+        self.assertEqual((status, route, len(cards)), (200, "cards", 7))
+        self.assertEqual(cards[0]["id"], simulator.company.cards[5][0])
+
+    def test_etag_and_rate_limit(self):
+        simulator = self._simulator(rate=1, burst=2)
+        _, headers, _, _ = simulator.handle("GET", "/api/latest/spaces", self.AUTH)
+        status, _, body, _ = simulator.handle("GET", "/api/latest/spaces", {**self.AUTH, "If-None-Match": headers["ETag"]})
+        self.assertEqual((status, body), (304, b""))
+        status, headers, _, _ = simulator.handle("GET", "/api/latest/spaces", self.AUTH)
+        self.assertEqual(status, 429)
+        self.assertEqual(headers["X-RateLimit-Remaining"], "0")
+        self.assertGreaterEqual(int(headers["Retry-After"]), 1)
+
+    def test_bulk_time_logs_can_be_disabled(self):
+        path = "/api/latest/time-logs?from=2025-01-01&to=2025-12-31"
+        self.assertEqual(self._simulator().handle("GET", path, self.AUTH)[0], 200)
+        self.assertEqual(self._simulator(bulk_time_logs=False).handle("GET", path, self.AUTH)[0], 404)
+
+
+class LogPipelineTests(SimpleTestCase):
+    """Correlation id на запрос, форматирование записей в потоке слушателя и ротация из нескольких процессов."""
+
+    class Sink(logging.Handler):
+        def __init__(self):
+            super().__init__()
+            self.lines, self.threads = [], set()
+
+        def emit(self, record):
+            self.lines.append(self.format(record))
+            self.threads.add(threading.current_thread().name)
+
+    def test_middleware_sets_request_id(self):
+        middleware = instrumentation.CorrelationIdMiddleware(lambda request: HttpResponse(instrumentation.get_correlation_id()))
+        factory = RequestFactory()
+        response = middleware(factory.get("/", HTTP_X_REQUEST_ID="abc-123"))
+        self.assertEqual((response["X-Request-ID"], response.content), ("abc-123", b"abc-123"))
+        response = middleware(factory.get("/", HTTP_X_REQUEST_ID="bad id\n"))
+        self.assertNotEqual(response["X-Request-ID"], "bad id\n")
+        self.assertEqual(response.content.decode(), response["X-Request-ID"])
+        self.assertEqual(instrumentation.get_correlation_id(), "-")
+
+    def test_records_are_formatted_in_listener_thread(self):
+        sink = self.Sink()
+        sink.setFormatter(logging.Formatter("[%(correlation_id)s] %(message)s"))
+        handler = log_handlers.DeferredQueueHandler(sink)
+        handler.addFilter(instrumentation.CorrelationIdFilter())
+        logger = logging.Logger("lecap-tests")
+        logger.addHandler(handler)
+        payload = [{"id": 1}]
+        with instrumentation.correlation_scope("req1"):
+            with ThreadPoolExecutor(max_workers=1) as pool:
+                pool.submit(contextvars.copy_context().run, logger.info, "hash=%s", instrumentation.LazyHash(payload)).result()
+        handler.stop()
+        self.assertEqual(sink.lines, [f"[req1] hash={instrumentation.LazyHash(payload)}"])
+        self.assertNotIn(threading.current_thread().name, sink.threads)
+
+    def test_lazy_hash_is_not_computed_for_disabled_level(self):
+        payload = mock.MagicMock()
+        logger = logging.Logger("lecap-tests", level=logging.INFO)
+        with mock.patch.object(instrumentation, "_to_bytes") as to_bytes:
+            logger.debug("hash=%s", instrumentation.LazyHash(payload))
+        to_bytes.assert_not_called()
+
+    def test_other_process_rollover_reopens_stream(self):
+        log_dir = tempfile.mkdtemp(prefix="lecap-logs-")
+        self.addCleanup(shutil.rmtree, log_dir, ignore_errors=True)
+        path = os.path.join(log_dir, "kaiten.log")
+        first, second = (log_handlers.ProcessSafeTimedRotatingFileHandler(path, when="midnight") for _ in range(2))
+        self.addCleanup(first.close)
+        self.addCleanup(second.close)
+        second.emit(logging.LogRecord("kaiten", logging.INFO, __file__, 1, "до ротации", None, None))
+        first.doRollover()
+        second.emit(logging.LogRecord("kaiten", logging.INFO, __file__, 1, "после ротации", None, None))
+        second.flush()
+        archives = [name for name in os.listdir(log_dir) if name.startswith("kaiten.log.") and not name.endswith(".lock")]
+        self.assertEqual(len(archives), 1)
+        with open(path, encoding="utf-8") as f:
+            self.assertEqual(f.read().strip(), "после ротации")
+
+
+class MetricsTests(TestCase):
+    """Сбор метрик по снимкам воркеров и их вывод в формате Prometheus."""
+
+    def setUp(self):
+        self.metrics_dir = tempfile.mkdtemp(prefix="lecap-metrics-")
+        self.addCleanup(shutil.rmtree, self.metrics_dir, ignore_errors=True)
+        self.enterContext(mock.patch.object(metrics, "METRICS_DIR", self.metrics_dir))
+
+    def _worker_snapshot(self, pid, data, token="0123abcd"):
+        path = Path(self.metrics_dir) / f"{pid}-{token}.json"
+        path.write_text(json.dumps(data))
+        return path
+
+    def _dead_worker_snapshot(self, value):
+        worker = subprocess.Popen([sys.executable, "-c", "pass"])
+        worker.wait()
+        return self._worker_snapshot(worker.pid, {"counters": [["report_total", [["outcome", "dead"]], value]], "histograms": []})
+
+    def _dead_total(self):
+        return metrics.collect()["counters"].get(("report_total", (("outcome", "dead"),)))
+
+    def test_dead_worker_snapshots_are_archived(self):
+        first = self._dead_worker_snapshot(3)
+        self.assertEqual(self._dead_total(), 3)
+        self.assertFalse(first.exists())
+        self.assertTrue((Path(self.metrics_dir) / metrics.ARCHIVE_FILE).exists())
+        # повторный сбор не удваивает перенесённое, следующий завершившийся воркер добавляется
+        self.assertEqual(self._dead_total(), 3)
+        self._dead_worker_snapshot(2)
+        self.assertEqual(self._dead_total(), 5)
+        leftovers = [p.name for p in Path(self.metrics_dir).glob("*.json") if metrics._snapshot_pid(p.name) not in (None, os.getpid())]
+        self.assertEqual(leftovers, [])
+
+    def test_reused_pid_archives_previous_snapshot(self):
+        # снимок завершившегося воркера, чей pid достался текущему процессу
+        previous = self._worker_snapshot(os.getpid(), {"counters": [["report_total", [["outcome", "dead"]], 3]], "histograms": []})
+        metrics.inc("report_total", outcome="ok")
+        with mock.patch.object(metrics, "_claimed", False):
+            metrics.flush()
+        self.assertFalse(previous.exists())
+        own = Path(self.metrics_dir) / f"{os.getpid()}-{metrics._token}.json"
+        self.assertTrue(own.exists())
+        self.assertEqual(self._dead_total(), 3)
+        metrics.flush()
+        self.assertEqual(self._dead_total(), 3)
+
+    def test_live_workers_are_summed_and_rendered(self):
+        worker = subprocess.Popen([sys.executable, "-c", "import time; time.sleep(30)"])
+        self.addCleanup(worker.wait)
+        self.addCleanup(worker.kill)
+        labels = [["endpoint", 'sim"cards']]
+        # длительности 0.004, 0.2 и 100 с: бакеты 0.005, 0.25 и +Inf
+        self._worker_snapshot(os.getppid(), {
+            "counters": [["kaiten_requests_total", labels, 2]],
+            "histograms": [["kaiten_request_duration_seconds", labels, [1] + [0] * 13, 0.004]],
+        })
+        self._worker_snapshot(worker.pid, {
+            "counters": [["kaiten_requests_total", labels, 3]],
+            "histograms": [["kaiten_request_duration_seconds", labels, [0] * 5 + [1] + [0] * 7 + [1], 100.2]],
+        })
+        text = metrics.render(metrics.collect())
+        self.assertIn('kaiten_requests_total{endpoint="sim\\"cards"} 5', text)
+        self.assertIn('kaiten_request_duration_seconds_bucket{endpoint="sim\\"cards",le="0.005"} 1', text)
+        self.assertIn('kaiten_request_duration_seconds_bucket{endpoint="sim\\"cards",le="0.25"} 2', text)
+        self.assertIn('kaiten_request_duration_seconds_bucket{endpoint="sim\\"cards",le="+Inf"} 3', text)
+        self.assertIn('kaiten_request_duration_seconds_count{endpoint="sim\\"cards"} 3', text)
+        self.assertFalse((Path(self.metrics_dir) / metrics.ARCHIVE_FILE).exists())
+
+    def test_outcomes_are_counted_by_status(self):
+        statuses = {"ok": 200, "redirect": 302, "error": 500}
+        with mock.patch.object(metrics, "inc") as inc:
+            for status in statuses.values():
+                metrics.count_outcomes("report_total")(lambda request: HttpResponse(status=status))(None)
+            with self.assertRaises(ValueError):
+                metrics.count_outcomes("report_total")(mock.Mock(side_effect=ValueError))(None)
+        self.assertEqual(
+            [call.kwargs["outcome"] for call in inc.call_args_list],
+            list(statuses) + ["error"],
+        )
+
+    def test_metrics_route(self):
+        staff = get_user_model().objects.create_user("metrics@example.com", "password", is_staff=True)
+        self.client.force_login(staff)
+        response = self.client.get("/metrics/")
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("# TYPE kaiten_requests_total counter", response.content.decode())
@@ -38,6 +38,8 @@ urlpatterns = [
     #path('get_swimlanes/', views.get_swimlanes, name='get_swimlanes'),
     path('ajax/swimlanes/', views.get_swimlanes, name='get_swimlanes'),
     path('ajax/statuses/', views.get_statuses, name='get_statuses'),
+    path('metrics/', views.metrics_view, name='metrics'),
+    path('webhooks/kaiten/', views.kaiten_webhook_view, name='kaiten_webhook'),
     path('home/', home_view, name='home'),
     path('', home_view, name='home'),
     
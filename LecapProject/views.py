@@ -1,4 +1,3 @@
-import requests
 import io
 import logging
 from django.contrib.auth.decorators import login_required
@@ -11,10 +10,8 @@ from django import forms
 from accounts.models import AdminSettings, KaitenUserRoleOverride
 from .models import  ProjectRate, DefaultRoleRate
 from accounts.forms import AdminSettingsForm, CustomUserForm
-from LecapProject.kaiten_api import fetch_kaiten_roles, fetch_kaiten_projects, fetch_kaiten_cards, \
-        fetch_kaiten_time_logs, fetch_kaiten_boards, fetch_kaiten_board_roles
 from django.forms import modelformset_factory, ModelForm, HiddenInput
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
 import pytz
 from django.http import HttpResponse, JsonResponse
 from docx import Document
@@ -31,14 +28,28 @@ from django.db.models import CharField
 from urllib.parse import urlencode
 from docx.enum.table import WD_ALIGN_VERTICAL
 from docx.enum.text import WD_ALIGN_PARAGRAPH
-from .kaiten_api import fetch_kaiten_roles, fetch_kaiten_users
 from django.urls import reverse
 from .kaiten_api import (
-    fetch_kaiten_roles, fetch_kaiten_projects, fetch_kaiten_boards, fetch_kaiten_board_roles,
-    fetch_kaiten_custom_property_values, fetch_kaiten_swimlanes, fetch_kaiten_board_statuses,
-    fetch_kaiten_cards, fetch_kaiten_time_logs
+    fetch_kaiten_users, fetch_kaiten_time_logs_between,
+    kaiten_priority, PRIORITY_REPORT, with_kaiten_deadline, KaitenDeadlineExceeded, VIEW_BUDGET, AJAX_BUDGET,
+    invalidate_kaiten_cache, is_stale, is_kaiten_degraded, KaitenUnavailableError,
+    CardFilter, fetch_kaiten_filtered_cards
 )
-from django.views.decorators.http import require_GET
+from asgiref.sync import sync_to_async
+import hmac
+import os
+from django.core.exceptions import PermissionDenied
+from . import metrics
+from .card_activity import prefilter_active_cards, record_time_log_watermarks
+from .report_checkpoint import ReportProgress
+from . import kaiten_webhooks
+from . import kaiten_mirror
+from .kaiten_mirror import (
+    mirror_projects, mirror_boards, mirror_roles, mirror_board_statuses, mirror_swimlanes,
+    mirror_custom_property_values,
+)
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
 
 logger = logging.getLogger('kaiten')
 from docx.oxml import OxmlElement
@@ -61,53 +72,106 @@ def administration_view(request):
 
 @require_GET
 @login_required
-def get_custom_field_values(request):
-    admin_settings, _ = AdminSettings.objects.get_or_create(pk=1)
+@with_kaiten_deadline(AJAX_BUDGET)
+async def get_custom_field_values(request):
+    admin_settings, _ = await AdminSettings.objects.aget_or_create(pk=1)
     domain     = admin_settings.url_domain_value_id
     bearer_key = admin_settings.api_auth_key
 
     field_id = request.GET.get('field_id')
     space_id = request.GET.get('space_id')
-    print(f"[DEBUG] AJAX get_custom_field_values → space_id={space_id!r}, field_id={field_id!r}")
+    logger.debug("AJAX get_custom_field_values → space_id=%r, field_id=%r", space_id, field_id)
 
-    values = fetch_kaiten_custom_property_values(domain, bearer_key, space_id, field_id)
-    print(f"[DEBUG] AJAX custom_values returned → {values!r}")
+    refresh = request.GET.get('refresh') == '1'
+    values = await sync_to_async(mirror_custom_property_values)(domain, bearer_key, space_id, field_id, refresh=refresh)
+    logger.debug("AJAX custom_values returned → %r", values)
     return JsonResponse({'values': values})
 
 @require_GET
 @login_required
-def get_statuses(request):
-    admin_settings, _ = AdminSettings.objects.get_or_create(pk=1)
+@with_kaiten_deadline(AJAX_BUDGET)
+async def get_statuses(request):
+    admin_settings, _ = await AdminSettings.objects.aget_or_create(pk=1)
     domain     = admin_settings.url_domain_value_id
     bearer_key = admin_settings.api_auth_key
 
     space_id = request.GET.get("space_id")
     board_id = request.GET.get("board_id")
 
-    statuses = fetch_kaiten_board_statuses(domain, bearer_key, space_id, board_id)
+    refresh = request.GET.get('refresh') == '1'
+    statuses = await sync_to_async(mirror_board_statuses)(domain, bearer_key, space_id, board_id, refresh=refresh)
     return JsonResponse({"statuses": statuses})
 
 @require_GET
 @login_required
-def get_swimlanes(request):
+@with_kaiten_deadline(AJAX_BUDGET)
+async def get_swimlanes(request):
     """
     Возвращает JSON {"lanes": […]} по board_id
     """
-    admin_settings, _ = AdminSettings.objects.get_or_create(pk=1)
+    admin_settings, _ = await AdminSettings.objects.aget_or_create(pk=1)
     domain     = admin_settings.url_domain_value_id
     bearer_key = admin_settings.api_auth_key
 
     board_id = request.GET.get('board_id')
-    print(f"[DEBUG] AJAX get_swimlanes → board_id={board_id!r}")
-    lanes = fetch_kaiten_swimlanes(domain, bearer_key, board_id)
-    print(f"[DEBUG] AJAX swimlanes returned → {lanes!r}")
+    logger.debug("AJAX get_swimlanes → board_id=%r", board_id)
+    refresh = request.GET.get('refresh') == '1'
+    lanes = await sync_to_async(mirror_swimlanes)(domain, bearer_key, board_id, refresh=refresh)
+    logger.debug("AJAX swimlanes returned → %r", lanes)
     return JsonResponse({"lanes": lanes})
 
 
-def check_board_rates(board, project_id, roles):
+def load_rate_tables(project_ids, board_ids=None):
+    """
+    Ставки для набора проектов (и досок) двумя запросами вместо запроса на каждую роль.
+    Возвращает:
+      - project_rates: {(project_id, board_id, role_id): rate} — кастомные ставки (rate может быть None);
+      - default_rates: {role_id: default_rate} — стандартные ставки ролей.
+    """
+    project_rates = ProjectRate.objects.filter(project_id__in=[str(p) for p in project_ids])
+    if board_ids is not None:
+        project_rates = project_rates.filter(board_id__in=[str(b) for b in board_ids])
+    project_rates = {
+        (project_id, board_id, role_id): rate
+        for project_id, board_id, role_id, rate in project_rates.values_list('project_id', 'board_id', 'role_id', 'rate')
+    }
+    default_rates = dict(DefaultRoleRate.objects.values_list('role_id', 'default_rate'))
+    return project_rates, default_rates
+
+
+def resolve_rate(rate_tables, project_id, board_id, role_id):
+    """Ставка роли: кастомная, если задана, иначе стандартная, иначе 0."""
+    project_rates, default_rates = rate_tables
+    rate = project_rates.get((str(project_id), str(board_id), role_id))
+    if rate is None:
+        rate = default_rates.get(role_id) or 0
+    return rate
+
+
+def sync_default_role_rates(roles):
+    """
+    Заводит DefaultRoleRate для новых ролей Kaiten и обновляет названия существующих —
+    то же, что update_or_create по каждой роли, но за фиксированное число запросов.
+    """
+    names = {str(role.get('id')): role.get('name') for role in roles}
+    existing = {dr.role_id: dr for dr in DefaultRoleRate.objects.filter(role_id__in=list(names))}
+    renamed = []
+    for role_id, dr in existing.items():
+        if dr.role_name != names[role_id]:
+            dr.role_name = names[role_id]
+            renamed.append(dr)
+    if renamed:
+        DefaultRoleRate.objects.bulk_update(renamed, ['role_name'])
+    missing = [DefaultRoleRate(role_id=role_id, role_name=name) for role_id, name in names.items() if role_id not in existing]
+    if missing:
+        DefaultRoleRate.objects.bulk_create(missing, ignore_conflicts=True)
+
+
+def check_board_rates(board, project_id, roles, rate_tables=None):
     """
     Функция проверяет, удовлетворяет ли доска условию наличия ставок для каждой роли.
     Если для роли отсутствует кастомная ставка, ищется дефолтная ставка.
+    rate_tables — результат load_rate_tables(); если не передан, ставки доски загружаются здесь.
     Возвращает:
       - board_valid: True, если для всех ролей найдена ставка (кастомная или дефолтная);
       - auto_used: True, если хотя бы для одной роли ставка берётся из дефолтных.
@@ -115,66 +179,53 @@ def check_board_rates(board, project_id, roles):
     board_valid = True
     auto_used = False
     board_id = str(board.get("id"))
+    project_rates, default_rates = rate_tables or load_rate_tables([project_id], [board_id])
     for role in roles:
         role_id = str(role.get("id"))
-        try:
-            pr = ProjectRate.objects.get(
-                project_id=project_id,
-                board_id=board_id,
-                role_id=role_id
-            )
-            if pr.rate is None: #TODO: Log errors
-                try:
-                    dr = DefaultRoleRate.objects.get(role_id=role_id)
-                    if dr.default_rate is not None:
-                        auto_used = True
-                    else:
-                        board_valid = False
-                        break
-                except DefaultRoleRate.DoesNotExist:
-                    board_valid = False
-                    break
-        except ProjectRate.DoesNotExist:
-            try:
-                dr = DefaultRoleRate.objects.get(role_id=role_id)
-                if dr.default_rate is not None:
-                    auto_used = True
-                else:
-                    board_valid = False
-                    break
-            except DefaultRoleRate.DoesNotExist:
-                board_valid = False
-                break
+        if project_rates.get((str(project_id), board_id, role_id)) is not None:
+            continue
+        if default_rates.get(role_id) is not None:
+            auto_used = True
+        else:
+            board_valid = False
+            break
     return board_valid, auto_used
 
 @login_required
-def get_boards(request):
+@with_kaiten_deadline(AJAX_BUDGET)
+async def get_boards(request):
     kaiten_api_down = False
     space_id = request.GET.get('space_id')
     for_report = request.GET.get('for_report') == "1"
-    admin_settings, _ = AdminSettings.objects.get_or_create(pk=1)
+    refresh = request.GET.get('refresh') == '1'
+    admin_settings, _ = await AdminSettings.objects.aget_or_create(pk=1)
     domain = admin_settings.url_domain_value_id
     bearer_key = admin_settings.api_auth_key
 
-    boards = fetch_kaiten_boards(domain, bearer_key, space_id)
-    if not boards:
+    boards = await sync_to_async(mirror_boards)(domain, bearer_key, space_id, refresh=refresh)
+    if not boards or is_stale(boards):
         kaiten_api_down = True
 
     if for_report:
-        global_roles = fetch_kaiten_roles(domain, bearer_key)
-        for role in global_roles:
-            DefaultRoleRate.objects.update_or_create(
-                role_id=str(role.get('id')),
-                defaults={'role_name': role.get('name')}
+        def load_roles():
+            # Роли досок — из зеркала; отсутствующие в нём загружаются из Kaiten одновременно
+            board_roles = kaiten_mirror.preload(
+                domain, bearer_key, "board-roles", [(space_id, board['id']) for board in boards], refresh=refresh,
             )
-        # Удалить устаревшие роли
-        api_role_ids = [str(r.get('id')) for r in global_roles]
-        DefaultRoleRate.objects.exclude(role_id__in=api_role_ids).delete()
-        for board in boards:
-            board_roles = fetch_kaiten_board_roles(domain, bearer_key, space_id, board['id'])
-            if not board_roles:
+            board_roles.fetch_missing()
+            return mirror_roles(domain, bearer_key, refresh=refresh), [board_roles.get(space_id, board['id']) for board in boards]
+
+        global_roles, roles_per_board = await sync_to_async(load_roles)()
+        await sync_to_async(sync_default_role_rates)(global_roles)
+        # Удалить устаревшие роли (только по актуальному списку из Kaiten, не по сохранённому)
+        if global_roles and not is_stale(global_roles):
+            api_role_ids = [str(r.get('id')) for r in global_roles]
+            await DefaultRoleRate.objects.exclude(role_id__in=api_role_ids).adelete()
+        rate_tables = await sync_to_async(load_rate_tables)([space_id])
+        for board, board_roles in zip(boards, roles_per_board):
+            if not board_roles or is_stale(board_roles):
                 kaiten_api_down = True
-            valid, auto_used = check_board_rates(board, space_id, board_roles)
+            valid, auto_used = check_board_rates(board, space_id, board_roles, rate_tables)
             board["has_rates"] = valid
             if valid and auto_used:
                 board["title"] += " (автоставки)"
@@ -186,16 +237,18 @@ def get_boards(request):
     return JsonResponse({"boards": boards, "error": error_message})
 
 @login_required
+@with_kaiten_deadline(VIEW_BUDGET)
 def rates_view(request):
     admin_settings, _ = AdminSettings.objects.update_or_create(pk=1)
     domain = admin_settings.url_domain_value_id
     bearer_key = admin_settings.api_auth_key
     kaiten_api_down = False
+    refresh = request.GET.get('refresh') == '1'
 
     projects = []
     if domain and bearer_key:
-        projects = fetch_kaiten_projects(domain, bearer_key)
-        if not projects:
+        projects = mirror_projects(domain, bearer_key, refresh=refresh)
+        if not projects or is_stale(projects):
             kaiten_api_down = True
 
     project_id = request.GET.get('project_id')
@@ -214,39 +267,38 @@ def rates_view(request):
 
     boards = []
     if project_id:
-        boards = fetch_kaiten_boards(domain, bearer_key, project_id)
-        if not boards:
+        boards = mirror_boards(domain, bearer_key, project_id, refresh=refresh)
+        if not boards or is_stale(boards):
             kaiten_api_down = True
         if boards and not board_id:
             board_id = boards[0]['id']
             board_title = boards[0]['title']
 
     if domain and bearer_key and project_id and board_id:
-        global_roles = fetch_kaiten_roles(domain, bearer_key)
-        if not global_roles:
+        global_roles = mirror_roles(domain, bearer_key, refresh=refresh)
+        if not global_roles or is_stale(global_roles):
             kaiten_api_down = True
-        else:
-            for role in global_roles:
-                role_id = str(role.get('id'))
-                role_name = role.get('name')
-                ProjectRate.objects.get_or_create(
-                    project_id=project_id,
-                    board_id=board_id,
-                    role_id=role_id,
-                    defaults={'role_name': role_name}
-                )
-                DefaultRoleRate.objects.update_or_create(
-                    role_id=role_id,
-                    defaults={'role_name': role_name}
-                )
-            api_role_ids = [str(r.get('id')) for r in global_roles]
-            DefaultRoleRate.objects.exclude(role_id__in=api_role_ids).delete()
+        if global_roles:
+            existing = set(
+                ProjectRate.objects.filter(project_id=project_id, board_id=board_id)
+                .values_list('role_id', flat=True)
+            )
+            ProjectRate.objects.bulk_create([
+                ProjectRate(project_id=project_id, board_id=board_id, role_id=str(role.get('id')), role_name=role.get('name'))
+                for role in global_roles
+                if str(role.get('id')) not in existing
+            ], ignore_conflicts=True)
+            sync_default_role_rates(global_roles)
+            if not is_stale(global_roles):
+                api_role_ids = [str(r.get('id')) for r in global_roles]
+                DefaultRoleRate.objects.exclude(role_id__in=api_role_ids).delete()
 
     ProjectRateFormSet = modelformset_factory(ProjectRate, form=ProjectRateForm, extra=0)
     rates_formset = None
     if project_id and board_id:
         rates_formset = ProjectRateFormSet(
-            queryset=ProjectRate.objects.filter(project_id=project_id, board_id=board_id)
+            queryset=ProjectRate.objects.filter(project_id=project_id, board_id=board_id),
+            form_kwargs={'default_rates': dict(DefaultRoleRate.objects.values_list('role_id', 'default_rate'))},
         )
 
     if kaiten_api_down:
@@ -277,7 +329,8 @@ def rates_view(request):
                 queryset=ProjectRate.objects.filter(
                     project_id=project_id,
                     board_id=board_id
-                )
+                ),
+                form_kwargs={'default_rates': dict(DefaultRoleRate.objects.values_list('role_id', 'default_rate'))},
             )
             return save_rates(
                 request,
@@ -315,17 +368,19 @@ class ProjectRateForm(forms.ModelForm):
             'board_id': forms.HiddenInput(),
         }
 
-    def __init__(self, *args, **kwargs):
+    def __init__(self, *args, default_rates=None, **kwargs):
+        # default_rates — {role_id: default_rate} на весь formset, чтобы не делать запрос на каждую форму
         super().__init__(*args, **kwargs)
         self.is_default = False
         if self.instance and self.instance.rate is None:
-            try:
-                dr = DefaultRoleRate.objects.get(role_id=self.instance.role_id)
-                if dr.default_rate is not None:
-                    self.initial['rate'] = dr.default_rate
-                    self.is_default = True
-            except DefaultRoleRate.DoesNotExist:
-                pass
+            if default_rates is None:
+                dr = DefaultRoleRate.objects.filter(role_id=self.instance.role_id).first()
+                default_rate = dr.default_rate if dr else None
+            else:
+                default_rate = default_rates.get(self.instance.role_id)
+            if default_rate is not None:
+                self.initial['rate'] = default_rate
+                self.is_default = True
 
     def has_changed(self):
         if getattr(self, 'is_default', False):
@@ -389,6 +444,7 @@ def replace_placeholder_in_paragraph(paragraph, placeholder, replacement):
 
 
 @login_required
+@with_kaiten_deadline(VIEW_BUDGET)
 def custom_administration(request):
     if not request.user.is_staff:
         messages.error(request, "У вас нет доступа к странице администрирования, запросите права у администратора.")
@@ -400,14 +456,12 @@ def custom_administration(request):
     kaiten_roles = []
     kaiten_users = []
     if domain and admin_settings.api_auth_key:
-        kaiten_roles = fetch_kaiten_roles(domain, admin_settings.api_auth_key)
-        for role in kaiten_roles:
-            DefaultRoleRate.objects.update_or_create(
-                role_id=str(role.get('id')),
-                defaults={'role_name': role.get('name')}
-            )
-        api_ids = [str(r.get('id')) for r in kaiten_roles]
-        DefaultRoleRate.objects.exclude(role_id__in=api_ids).delete()
+        kaiten_roles = mirror_roles(domain, admin_settings.api_auth_key, refresh=request.GET.get('refresh') == '1')
+        sync_default_role_rates(kaiten_roles)
+        # Удалить устаревшие роли (только по актуальному списку из Kaiten, не по сохранённому)
+        if kaiten_roles and not is_stale(kaiten_roles):
+            api_ids = [str(r.get('id')) for r in kaiten_roles]
+            DefaultRoleRate.objects.exclude(role_id__in=api_ids).delete()
         kaiten_users = fetch_kaiten_users(domain, admin_settings.api_auth_key)
     overrides = {
         o.kaiten_user_id: o.override_role_id
@@ -442,6 +496,8 @@ def custom_administration(request):
             settings_form = AdminSettingsForm(request.POST, instance=admin_settings)
             if settings_form.is_valid():
                 settings_form.save()
+                # домен/ключ/поля могли измениться — закэшированные метаданные Kaiten больше не актуальны
+                invalidate_kaiten_cache()
                 messages.success(request, "Настройки успешно сохранены.")
                 return redirect('custom_administration')
         elif 'create_user' in request.POST:
@@ -483,6 +539,7 @@ def custom_administration(request):
 
 import json
 @login_required
+@with_kaiten_deadline(VIEW_BUDGET)
 def reports_view(request):
     # 1. Настройки
     admin_settings, _ = AdminSettings.objects.get_or_create(pk=1)
@@ -491,29 +548,39 @@ def reports_view(request):
     project_field_id = admin_settings.project_custom_field_id
 
     # 2. Подгрузка space и проверка ставок
-    projects        = fetch_kaiten_projects(domain, bearer_key)
-    kaiten_api_down = False
+    # Метаданные — из локального зеркала (kaiten_mirror), Kaiten страница не ждёт; ?refresh=1 перечитывает
+    # их из Kaiten. Если области в зеркале нет, а Kaiten недоступен, приходят данные с пометкой is_stale —
+    # страница строится по ним сразу, а пользователь видит предупреждение
+    refresh         = request.GET.get('refresh') == '1'
+    projects        = mirror_projects(domain, bearer_key, refresh=refresh)
+    kaiten_api_down = is_stale(projects)
     if not projects:
         kaiten_api_down = True
     else:
-        roles = fetch_kaiten_roles(domain, bearer_key)
-        if not roles:
+        roles = mirror_roles(domain, bearer_key, refresh=refresh)
+        if not roles or is_stale(roles):
             kaiten_api_down = True
-        else:
-            for role in roles:
-                DefaultRoleRate.objects.update_or_create(
-                    role_id=str(role['id']),
-                    defaults={'role_name': role['name']}
-                )
+        if roles:
+            sync_default_role_rates(roles)
+            rate_tables = load_rate_tables([project['id'] for project in projects])
+            # Доски и роли досок — из зеркала; отсутствующие в нём загружаются из Kaiten одновременно,
+            # сначала доски (от них зависит список ролей), затем роли — а не по одной в цикле
+            boards_by_space = kaiten_mirror.preload(
+                domain, bearer_key, "boards", [(project['id'],) for project in projects], refresh=refresh,
+            )
+            boards_by_space.fetch_missing()
+            roles_by_board = kaiten_mirror.preload(domain, bearer_key, "board-roles", [
+                (project['id'], board['id']) for project in projects for board in boards_by_space.get(project['id'])
+            ], refresh=refresh)
+            roles_by_board.fetch_missing()
             for project in projects:
                 pid    = str(project['id'])
-                boards = fetch_kaiten_boards(domain, bearer_key, pid)
+                boards = boards_by_space.get(pid)
+                kaiten_api_down = kaiten_api_down or is_stale(boards)
                 valid  = False
                 for board in boards:
-                    board_roles = fetch_kaiten_board_roles(
-                        domain, bearer_key, pid, str(board['id'])
-                    )
-                    ok, _ = check_board_rates(board, pid, board_roles)
+                    board_roles = roles_by_board.get(pid, str(board['id']))
+                    ok, _ = check_board_rates(board, pid, board_roles, rate_tables)
                     if ok:
                         valid = True
                         break
@@ -529,9 +596,14 @@ def reports_view(request):
         custom_proj = request.POST.get('custom_project', 'all')
         swimlane    = request.POST.get('swimlane', '')
 
+        try:
+            # даты формы — 'YYYY-MM-DD'; их же сравнивают со списаниями и берут в контрольную точку
+            dates_valid = bool(start_date and end_date) and date.fromisoformat(start_date) <= date.fromisoformat(end_date)
+        except ValueError:
+            dates_valid = False
         selected_proj = next((p for p in projects if str(p['id']) == proj_id), None)
         if selected_proj and selected_proj.get('has_rates') \
-           and board_id and template_id and start_date and end_date:
+           and board_id and template_id and dates_valid:
             try:
                 tpl = TemplateFile.objects.get(id=template_id)
             except TemplateFile.DoesNotExist:
@@ -550,8 +622,10 @@ def reports_view(request):
             messages.error(request, 'Выберите доску.')
         elif not template_id:
             messages.error(request, 'Выберите шаблон.')
-        else:
+        elif not (start_date and end_date):
             messages.error(request, 'Укажите период дат.')
+        else:
+            messages.error(request, 'Некорректный период дат.')
 
     # 4. Ошибка Kaiten
     if kaiten_api_down:
@@ -566,8 +640,9 @@ def reports_view(request):
         'swimlanes':     reverse('get_swimlanes'),
     }
     templates_qs = TemplateFile.objects.all()
-    print(f"[reports_view] templates count={templates_qs.count()}, "
-                 f"list={[t.file.name for t in templates_qs]}")
+    if logger.isEnabledFor(logging.DEBUG):
+        # список шаблонов — лишний запрос к БД, только при отладке
+        logger.debug(f"[reports_view] templates: {[t.file.name for t in templates_qs]}")
     context    = {
         'ajax_urls_json': json.dumps(ajax_urls),
         'projects':               projects,
@@ -587,21 +662,6 @@ def reports_view(request):
     }
     return render(request, 'reports.html', context)
 
-def fetch_all_kaiten_cards(domain, bearer_key, space_id):
-    url = f"https://{domain}.kaiten.ru/api/latest/cards"
-    params = {"space_id": space_id, "offset": 0, "limit": 1000}
-    headers = {
-        "Authorization": f"Bearer {bearer_key}",
-        "Accept": "application/json",
-        "Content-Type": "application/json",
-    }
-    return requests.get(
-        url,
-        headers=headers,
-        params=params,
-        timeout=80
-    ).json()
-
 def get_custom_prop(card, prop_id):
     # card["custom_properties"] — список {id, value}
     for cp in card.get("custom_properties", []):
@@ -624,8 +684,11 @@ def clear_cell_margins(cell):
     tcPr.append(tcMar)
 
 @login_required
+@metrics.count_outcomes("report_total")
+@with_kaiten_deadline(VIEW_BUDGET)
 def generate_report(request, project, template_instance, start_date, end_date, board_id, custom_proj, swimlane):
     logger.debug("=== START generate_report ===")
+    phases = metrics.PhaseTimer("report_phase_duration_seconds")
 
     # 1. Настройки и авторизация
     admin_settings, _ = AdminSettings.objects.get_or_create(pk=1)
@@ -640,13 +703,13 @@ def generate_report(request, project, template_instance, start_date, end_date, b
         project_id    = str(project.get('id', ''))
         project_title = project.get('title', '')
     else:
-        all_projects = fetch_kaiten_projects(domain, bearer_key)
+        all_projects = mirror_projects(domain, bearer_key)
         proj_dict    = next((p for p in all_projects if str(p.get('id')) == str(project)), {})
         project_id   = str(proj_dict.get('id', ''))
         project_title= proj_dict.get('title', '')
 
     # 3. Определение board_id и board_title
-    boards     = fetch_kaiten_boards(domain, bearer_key, project_id)
+    boards     = mirror_boards(domain, bearer_key, project_id)
     board_dict = next((b for b in boards if str(b.get('id')) == str(board_id)), {})
     board_id    = str(board_dict.get('id', board_id))
     board_title = board_dict.get('title', '')
@@ -657,8 +720,11 @@ def generate_report(request, project, template_instance, start_date, end_date, b
         for o in KaitenUserRoleOverride.objects.all()
     }
     logger.debug(f"[DEBUG] overrides: {overrides}")
-    roles_list = fetch_kaiten_roles(domain, bearer_key)
+    roles_list = mirror_roles(domain, bearer_key)
     roles_map  = { str(r.get('id')): r.get('name') for r in roles_list }
+    # Ставки доски — одним запросом на таблицу, а не запросом на каждое списание
+    rate_tables = load_rate_tables([project_id], [board_id])
+    phases.mark("metadata")
 
     # 4.1. Получение членства пользователей, чтобы знать реальную роль
     '''memberships = fetch_kaiten_memberships(domain, bearer_key, project_id, board_id)
@@ -666,17 +732,23 @@ def generate_report(request, project, template_instance, start_date, end_date, b
         str(m.get('userId')): str(m.get('roleId'))
         for m in memberships
     } '''
-    # 5. Загрузка карточек: «Все» и «Не указано» → весь список, иначе — фильтр по кастомному полю
-    if custom_proj in ('all', ''):
-        cards = fetch_all_kaiten_cards(domain, bearer_key, project_id)
-    else:
-        cards = fetch_kaiten_cards(
-            domain, bearer_key,
-            project_id,
-            admin_settings.project_custom_field_id,
-            custom_proj
-        )
-    cards = [c for c in cards if str(c.get("board_id")) == board_id]
+    # 5. Загрузка карточек: доска, дорожка, статус и кастомное поле «Проект» фильтруются на стороне
+    #    Kaiten («Все» и «Не указано» → без фильтра по полю), поэтому приходят только карточки отчёта.
+    #    Массовые запросы отчёта идут с приоритетом REPORT, чтобы не задерживать AJAX других пользователей
+    status = request.POST.get('status', '')
+    card_filter = CardFilter(project_id).board(board_id)
+    if swimlane and swimlane != 'all':
+        card_filter.lane(swimlane)
+    if status and status != 'all':
+        card_filter.column(status)
+    if custom_proj not in ('all', ''):
+        card_filter.custom_property(admin_settings.project_custom_field_id, custom_proj)
+    with kaiten_priority(PRIORITY_REPORT):
+        cards = fetch_kaiten_filtered_cards(domain, bearer_key, card_filter)
+    if not cards and is_kaiten_degraded(domain):
+        # карточки не кэшируются: при разомкнутом circuit breaker пустой список — это сбой, а не «нет задач»
+        messages.error(request, 'Сервер Kaiten недоступен, повторите позже.')
+        return redirect('reports')
     """
     # 6. Фильтрация по кастомному полю «Проект»
     if custom_proj == '':
@@ -691,23 +763,82 @@ def generate_report(request, project, template_instance, start_date, end_date, b
             if get_custom_prop(c, admin_settings.project_custom_field_id) == custom_proj
         ]"""
 
-    # 7. Фильтрация по swimlane и статусу
+    # 7. Контрольная фильтрация по доске, swimlane и статусу: при поддержке параметров сервером ничего не отсеивает
+    cards = [c for c in cards if str(c.get("board_id")) == board_id]
     if swimlane and swimlane != 'all':
         cards = [c for c in cards if str(c.get('lane_id', '')) == swimlane]  # 
 
-    status = request.POST.get('status', '')
     if status and status != 'all':
         cards = [c for c in cards if str(c.get('column_id', '')) == status]
+    phases.mark("cards")
 
     # 8. Подготовка строк таблицы и подсчёт
     table_rows   = []
     total_time   = 0.0
     total_amount = 0.0
 
+    # Списания, загруженные прошлой (прерванной) попыткой с теми же параметрами, берутся из контрольной точки
+    progress = ReportProgress(
+        domain, project_id=project_id, board_id=board_id, start_date=start_date, end_date=end_date,
+        custom_proj=custom_proj, swimlane=swimlane, status=status,
+    )
+    pending_cards = [card for card in cards if str(card.get('id')) not in progress.done]
+    if progress.resumed:
+        logger.info(f"generate_report: продолжение загрузки, готово карточек {progress.resumed}, осталось {len(pending_cards)}")
+
+    # При загрузке по карточкам и включённом KAITEN_ACTIVITY_PREFILTER карточки без активности в периоде
+    # (по датам изменения, перемещения и последнего списания) пропускаются: каждая из них — отдельный запрос
+    pending_by_id = {card.get('id'): card for card in pending_cards}
+
+    def only_active(card_ids):
+        active, skipped = prefilter_active_cards(domain, [pending_by_id[card_id] for card_id in card_ids], start_date, end_date)
+        if skipped:
+            logger.info(f"generate_report: карточек {len(card_ids)}, без активности в периоде пропущено {skipped}")
+        return [card.get('id') for card in active]
+
+    # Списания за период — постранично по доске; если Kaiten так не умеет — по карточкам
+    # параллельно (в пределах лимита Kaiten), ошибки — по карточкам; загруженное сохраняется пачками
+    try:
+        with kaiten_priority(PRIORITY_REPORT):
+            logs_by_card, failed_cards = fetch_kaiten_time_logs_between(
+                domain, bearer_key, [card.get('id') for card in pending_cards],
+                start_date, end_date, space_id=project_id, board_id=board_id,
+                on_logs=progress.add, per_card=only_active,
+            )
+    finally:
+        progress.flush()
+    record_time_log_watermarks(domain, logs_by_card)
+    for card in cards:
+        done = progress.done.get(str(card.get('id')))
+        if done is not None and card.get('id') not in logs_by_card:
+            logs_by_card[card.get('id')] = done
+    phases.mark("time_logs")
+    if any(isinstance(e, KaitenUnavailableError) for e in failed_cards.values()):
+        logger.warning(f"generate_report: Kaiten недоступен, не загружено карточек: {len(failed_cards)}")
+        messages.error(request, 'Сервер Kaiten недоступен, повторите позже.')
+        return redirect('reports')
+    if any(isinstance(e, KaitenDeadlineExceeded) for e in failed_cards.values()):
+        # Неполный отчёт по биллингу хуже понятной ошибки: сообщаем и не формируем документ
+        logger.warning(f"generate_report: бюджет времени исчерпан, не загружено карточек: {len(failed_cards)}")
+        messages.error(
+            request,
+            f"Kaiten отвечает слишком медленно: не успели загрузить списания для {len(failed_cards)} "
+            f"из {len(cards)} карточек. Повторите попытку позже — загрузка продолжится с места остановки."
+        )
+        return redirect('reports')
+    if failed_cards:
+        logger.warning(f"generate_report: не удалось получить списания для карточек: {failed_cards}")
+        messages.warning(
+            request,
+            "Не удалось получить списания времени для карточек: "
+            + ", ".join(str(cid) for cid in sorted(failed_cards, key=str))
+            + ". Отчёт может быть неполным."
+        )
+
     for card in cards:
         card_id    = card.get('id')
         card_title = card.get('title')
-        logs       = fetch_kaiten_time_logs(domain, bearer_key, card_id)
+        logs       = logs_by_card.get(card_id, [])
 
         for log in logs:
             # Фильтр по дате
@@ -738,20 +869,7 @@ def generate_report(request, project, template_instance, start_date, end_date, b
                 role_name = roles_map.get(role_id, '—')
 
             # Правильный fallback: сначала кастомная ставка, если None → дефолт, иначе 0
-            try:
-                pr = ProjectRate.objects.get(
-                    project_id=project_id,
-                    board_id=board_id,
-                    role_id=role_id
-                )
-                if pr.rate is not None:
-                    rate = pr.rate
-                else:
-                    dr = DefaultRoleRate.objects.filter(role_id=role_id).first()
-                    rate = dr.default_rate or 0 if dr else 0
-            except ProjectRate.DoesNotExist:
-                dr = DefaultRoleRate.objects.filter(role_id=role_id).first()
-                rate = dr.default_rate or 0 if dr else 0  # 
+            rate = resolve_rate(rate_tables, project_id, board_id, role_id)
 
             total_amount += rate * hours
             role_name = roles_map.get(role_id, '—')
@@ -767,6 +885,8 @@ def generate_report(request, project, template_instance, start_date, end_date, b
                 'cost':       f"{(rate * hours):.2f}".replace('.', ',') + ' ₽',
             })
 
+    phases.mark("rows")
+    progress.complete()
     if not table_rows:
         messages.error(request, "Записей не найдено")
         return redirect('reports')
@@ -844,5 +964,37 @@ def generate_report(request, project, template_instance, start_date, end_date, b
     )
     today = datetime.now(pytz.timezone('Europe/Moscow')).strftime('%Y-%m-%d')
     response['Content-Disposition'] = f'attachment; filename="report_{project_id}_{today}.docx"'
+    phases.mark("docx")
     logger.debug("=== END generate_report ===")
     return response
+
+
+@require_GET
+def metrics_view(request):
+    """
+    Метрики клиента Kaiten и формирования отчётов (формат Prometheus), суммарно по воркерам.
+    Доступ: Bearer-токен METRICS_TOKEN для сборщика, без токена в окружении — только staff.
+    """
+    token = os.getenv("METRICS_TOKEN", "")
+    if token:
+        auth = request.headers.get("Authorization", "")
+        if not hmac.compare_digest(auth.encode(), f"Bearer {token}".encode()):
+            raise PermissionDenied
+    elif not request.user.is_staff:
+        raise PermissionDenied
+    return HttpResponse(metrics.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+@csrf_exempt
+@require_POST
+def kaiten_webhook_view(request):
+    """
+    Приём вебхуков Kaiten (подпись и обработка — kaiten_webhooks.receive).
+    202 — событие в очереди, повторная доставка того же события тоже 202.
+    """
+    try:
+        event = kaiten_webhooks.receive(request.body, request.headers, request.GET)
+    except kaiten_webhooks.WebhookRejected as e:
+        logger.warning(f"Вебхук Kaiten отклонён: {e}")
+        return JsonResponse({"error": str(e)}, status=e.status)
+    return JsonResponse({"id": event.event_id, "processed": event.processed_at is not None}, status=202)
@@ -1,6 +1,9 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
+# Ручная проверка фиксированного списка карточек. Для пространства или доски
+# целиком: python manage.py audit_time_logs --space <id> [--board <id>]
+
 import argparse
 import time
 import json